@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# BATCH RUNNER - RUN MANY SIMULATION MODULES SIDE BY SIDE IN ONE PROCESS
+
+import argparse
+import concurrent.futures
+import datetime
+import importlib
+import os
+import sys
+
+import numpy as np
+
+from montecarlo import PERCENTILES, open_bank, success_rates
+from simulation import run_seed
+
+
+def read_manifest(path):
+    # One scenario per line: "module_name [seed]".  Blank lines and "#" comments are ignored.
+    scenarios = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            seed = int(fields[1]) if len(fields) > 1 else None
+            scenarios.append((fields[0], seed))
+    return scenarios
+
+
+def init_worker(module_names):
+    # Workers stay alive for the whole batch, so pay for the imports once per worker.
+    # The simulations print a running narrative, which nobody reads in a batch.
+    sys.stdout = open(os.devnull, "w")
+    for name in module_names:
+        importlib.import_module(name)
+
+
+def run_chunk(module_name, start_year, num_years, seed, first_run, num_runs, bank_path=None):
+    simulation_module = importlib.import_module(module_name)
+    chunk_totals = []
+    for run_num in range(first_run, first_run + num_runs):
+        this_sim = simulation_module.Simulation(start_year, num_years)
+        this_sim.seed(run_seed(seed, run_num))
+        if bank_path:
+            yearly = open_bank(bank_path).draws(run_num, 1, num_years, this_sim.asset_classes)[0]
+            this_sim.draws = this_sim.spread_over_steps(yearly)
+        chunk_totals.append(this_sim.single_simulation())
+    return chunk_totals
+
+
+def run_scenarios(scenarios, start_year, num_years, num_runs, seed, workers=None, chunk_size=None, bank_path=None):
+    """
+    Run every scenario on one shared process pool.
+
+    scenarios is a list of (module_name, seed) pairs; a seed of None means "use the
+    master seed", so scenarios without their own seed see the same market sequences.
+    With bank_path, run N of every scenario takes its markets from scenario N of the bank.
+    Returns a dict of label -> array of year totals, shaped (runs, years + 1), where
+    the label is the module name, plus ":seed" when the scenario brings its own seed.
+    Raises ValueError if two scenarios would get the same label.
+    """
+    workers = workers or os.cpu_count()
+    if not chunk_size:
+        chunk_size = max(1, num_runs // (4 * workers))
+    module_names = [name for name, _ in scenarios]
+
+    # Import everything up front, so a typo fails before any work is scheduled.
+    for name in module_names:
+        importlib.import_module(name)
+
+    labels = [name if scenario_seed is None else f"{name}:{scenario_seed}" for name, scenario_seed in scenarios]
+    repeated = sorted({label for label in labels if labels.count(label) > 1})
+    if repeated:
+        raise ValueError(f"{', '.join(repeated)} listed more than once")
+    results = {label: [None] * num_runs for label in labels}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(module_names,)) as pool:
+        futures = {}
+        for first_run in range(0, num_runs, chunk_size):
+            count = min(chunk_size, num_runs - first_run)
+            for label, (name, scenario_seed) in zip(labels, scenarios):
+                scenario_seed = seed if scenario_seed is None else scenario_seed
+                future = pool.submit(run_chunk, name, start_year, num_years, scenario_seed, first_run, count, bank_path)
+                futures[future] = (label, first_run)
+        for future in concurrent.futures.as_completed(futures):
+            label, first_run = futures[future]
+            chunk_totals = future.result()
+            results[label][first_run:first_run + len(chunk_totals)] = chunk_totals
+
+    return {label: np.array(totals, dtype=float) for label, totals in results.items()}
+
+
+def print_comparison(results, start_year, step=5):
+    labels = list(results.keys())
+    cell = 10 + 9 * len(PERCENTILES)
+    print("year  " + "".join(f"| {label:<{cell - 2}}" for label in labels))
+    print("      " + "".join(
+        "| success " + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) for _ in labels))
+    num_years = next(iter(results.values())).shape[1] - 1
+    for year in range(start_year, start_year + num_years + 1, step):
+        year_idx = year - start_year
+        line = f"{year}  "
+        for label in labels:
+            totals = results[label][:, year_idx]
+            line += f"| {success_rates(results[label])[year_idx]:6.1f}% "
+            for value in np.percentile(totals, PERCENTILES):
+                line += f"{int(value) // 1000:>8,}k"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run several simulation modules and compare them")
+    parser.add_argument("simulations", nargs="*", help="simulation modules, each with a class called Simulation")
+    parser.add_argument("--manifest", help="file listing simulation modules, one per line, with an optional seed")
+    parser.add_argument("--runs", type=int, default=100, help="number of simulations per scenario")
+    parser.add_argument("--years", type=int, default=50, help="number of years")
+    parser.add_argument("--seed", type=int, default=0, help="master seed, for scenarios without their own")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--bank", default=None, help="take market draws from this scenario bank")
+    args = parser.parse_args()
+
+    scenarios = [(name, None) for name in args.simulations]
+    if args.manifest:
+        scenarios += read_manifest(args.manifest)
+    if not scenarios:
+        parser.error("give at least one simulation module, or a --manifest")
+
+    start_year = datetime.date.today().year
+    try:
+        results = run_scenarios(scenarios, start_year, args.years, args.runs, args.seed, args.workers,
+                                bank_path=args.bank)
+    except ValueError as e:
+        parser.error(str(e))
+    print_comparison(results, start_year)
+
+
+if __name__ == "__main__":
+    main()
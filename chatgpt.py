@@ -7,6 +7,28 @@ from scipy.stats import t
 # These functions were generated by OpenAI's GPT-3 model.
 # They are not meant to be comprehensive, but just "good enough" for estimates.
 
+# 2024 Federal income tax brackets for single filers
+SINGLE_BRACKETS = [
+    (0, 11_600, 0.10),
+    (11_601, 47_150, 0.12),
+    (47_151, 100_525, 0.22),
+    (100_526, 191_950, 0.24),
+    (191_951, 243_725, 0.32),
+    (243_726, 609_350, 0.35),
+    (609_351, float("inf"), 0.37),
+]
+# 2024 Federal income tax brackets for married filers
+MARRIED_JOINT_BRACKETS = [
+    (0, 22_000, 0.10),  # 10% on income up to $22,000
+    (22_001, 89_450, 0.12),  # 12% on income from $22,001 to $89,450
+    (89_451, 190_750, 0.22),  # 22% on income from $89,451 to $190,750
+    (190_751, 364_200, 0.24),  # 24% on income from $190,751 to $364,200
+    (364_201, 462_500, 0.32),  # 32% on income from $364,201 to $462,500
+    (462_501, 693_750, 0.35),  # 35% on income from $462,501 to $693,750
+    (693_751, float("inf"), 0.37),  # 37% on income over $693,750
+]
+
+
 def estimate_income_tax(income, married=False):
     """
     Estimate U.S. federal income tax owed based on taxable income for single filers (2023 brackets).
@@ -17,30 +39,9 @@ def estimate_income_tax(income, married=False):
     Returns:
         float: Estimated federal income tax.
     """
-    # 2024 Federal income tax brackets for single filers
-    single_brackets = [
-        (0, 11_600, 0.10),
-        (11_601, 47_150, 0.12),
-        (47_151, 100_525, 0.22),
-        (100_526, 191_950, 0.24),
-        (191_951, 243_725, 0.32),
-        (243_726, 609_350, 0.35),
-        (609_351, float("inf"), 0.37),
-    ]
-    # 2024 Federal income tax brackets for married filers
-    married_joint_brackets = [
-        (0, 22_000, 0.10),  # 10% on income up to $22,000
-        (22_001, 89_450, 0.12),  # 12% on income from $22,001 to $89,450
-        (89_451, 190_750, 0.22),  # 22% on income from $89,451 to $190,750
-        (190_751, 364_200, 0.24),  # 24% on income from $190,751 to $364,200
-        (364_201, 462_500, 0.32),  # 32% on income from $364,201 to $462,500
-        (462_501, 693_750, 0.35),  # 35% on income from $462,501 to $693,750
-        (693_751, float("inf"), 0.37),  # 37% on income over $693,750
-    ]
-
     tax_owed = 0.0
 
-    brackets = single_brackets if not married else married_joint_brackets
+    brackets = SINGLE_BRACKETS if not married else MARRIED_JOINT_BRACKETS
 
     for lower, upper, rate in brackets:
         if income > lower:
@@ -52,6 +53,71 @@ def estimate_income_tax(income, married=False):
     return round(tax_owed, 2)
 
 
+def estimate_income_tax_array(incomes, married=False):
+    """
+    Same as estimate_income_tax(), for a whole numpy array of incomes at once.
+    """
+    tax_owed = np.zeros(np.shape(incomes))
+
+    brackets = SINGLE_BRACKETS if not married else MARRIED_JOINT_BRACKETS
+
+    # The brackets go up, so once an income is below a bracket it is below the rest.
+    for lower, upper, rate in brackets:
+        taxable_amount = np.minimum(incomes, upper) - lower
+        tax_owed += np.where(incomes > lower, taxable_amount * rate, 0.0)
+
+    return np.round(tax_owed, 2)
+
+
+# Uniform Lifetime Table divisor values
+UNIFORM_LIFETIME_TABLE = {
+    72: 25.6,
+    73: 24.7,
+    74: 23.8,
+    75: 22.9,
+    76: 22.0,
+    77: 21.2,
+    78: 20.3,
+    79: 19.5,
+    80: 18.7,
+    81: 17.9,
+    82: 17.1,
+    83: 16.3,
+    84: 15.5,
+    85: 14.8,
+    86: 14.1,
+    87: 13.4,
+    88: 12.7,
+    89: 12.0,
+    90: 11.4,
+    91: 10.8,
+    92: 10.2,
+    93: 9.6,
+    94: 9.1,
+    95: 8.6,
+    96: 8.1,
+    97: 7.6,
+    98: 7.1,
+    99: 6.7,
+    100: 6.3,
+    101: 5.9,
+    102: 5.5,
+    103: 5.2,
+    104: 4.9,
+    105: 4.5,
+    106: 4.2,
+    107: 3.9,
+    108: 3.7,
+    109: 3.4,
+    110: 3.1,
+    111: 2.9,
+    112: 2.6,
+    113: 2.4,
+    114: 2.1,
+    115: 1.9,
+}
+
+
 def calculate_rmd(account_balance, age):
     """
     Calculate the Required Minimum Distribution (RMD) for an IRA.
@@ -63,60 +129,12 @@ def calculate_rmd(account_balance, age):
     Returns:
         float: The estimated RMD for the given age and account balance.
     """
-    # Uniform Lifetime Table divisor values
-    uniform_lifetime_table = {
-        72: 25.6,
-        73: 24.7,
-        74: 23.8,
-        75: 22.9,
-        76: 22.0,
-        77: 21.2,
-        78: 20.3,
-        79: 19.5,
-        80: 18.7,
-        81: 17.9,
-        82: 17.1,
-        83: 16.3,
-        84: 15.5,
-        85: 14.8,
-        86: 14.1,
-        87: 13.4,
-        88: 12.7,
-        89: 12.0,
-        90: 11.4,
-        91: 10.8,
-        92: 10.2,
-        93: 9.6,
-        94: 9.1,
-        95: 8.6,
-        96: 8.1,
-        97: 7.6,
-        98: 7.1,
-        99: 6.7,
-        100: 6.3,
-        101: 5.9,
-        102: 5.5,
-        103: 5.2,
-        104: 4.9,
-        105: 4.5,
-        106: 4.2,
-        107: 3.9,
-        108: 3.7,
-        109: 3.4,
-        110: 3.1,
-        111: 2.9,
-        112: 2.6,
-        113: 2.4,
-        114: 2.1,
-        115: 1.9,
-    }
-
     # Check if age is in the table
-    if age not in uniform_lifetime_table:
+    if age not in UNIFORM_LIFETIME_TABLE:
         raise ValueError("Age must be between 72 and 115 to calculate RMD.")
 
     # Get the divisor for the given age
-    divisor = uniform_lifetime_table[age]
+    divisor = UNIFORM_LIFETIME_TABLE[age]
 
     # Calculate RMD
     rmd = account_balance / divisor
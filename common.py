@@ -4,7 +4,7 @@ from chatgpt import get_full_retirement_age, random_inflation
 
 class Person:
 
-    def __init__(self, name, birthday_str, salary, retirement_age, ss_age, ss_benefits, spouse=None):
+    def __init__(self, name, birthday_str, salary, retirement_age, ss_age, ss_benefits, spouse=None, sex=None):
         self.name = name
         self.birthday = parser.parse(birthday_str)
         self.salary = salary
@@ -12,6 +12,8 @@ class Person:
         self.ss_start_age = ss_age
         self.ss_benefits = ss_benefits
         self.spouse = spouse
+        # "M" or "F", for the life table in mortality.py - or None to split the difference
+        self.sex = sex
         if self.spouse and self.spouse.spouse != self:
             self.spouse.spouse = self
 
@@ -36,7 +38,7 @@ class Person:
 
     def waited_for_full_ss(self, year):
         age = self.age(year)
-        return age >= self.ss_start_age and age >= get_full_retirement_age(year)
+        return age >= self.ss_start_age and age >= get_full_retirement_age(self.birth_year())
 
 
 class Account:
@@ -57,6 +59,9 @@ class Account:
         self.owner = owner
         self.balance = balance
         self.debug = False
+        self.journal = None
+        # share of the balance in each asset class, for simulations that have asset_classes
+        self.weights = None
 
     def add(self, amount):
         if self.debug:
@@ -67,6 +72,8 @@ class Account:
             print(
                 f"{self.debug}account {ownership} {self.type} : ${int(before)} {add} {int(abs(amount))} -> ${int(after)}"
             )
+        if self.journal is not None:
+            self.journal.record(self, amount)
         self.balance = self.balance + amount
 
     def subtract(self, amount):
@@ -91,6 +98,7 @@ class Account:
 class Accounts:
     def __init__(self, initial_accounts=None, debug=False):
         self.accounts = {}
+        self.journal = None
         # add COPIES of initial accounts
         for account in initial_accounts:
             self.add(Account(account.type, account.owner, account.balance))
@@ -100,6 +108,14 @@ class Accounts:
         owner = account.owner
         # TODO - COPY here instead of reference
         self.accounts[(acct_type, owner)] = account
+        if self.journal is not None:
+            account.journal = self.journal
+
+    def set_journal(self, journal):
+        # record every add() to these accounts, and to any created later
+        self.journal = journal
+        for account in self.accounts.values():
+            account.journal = journal
 
     def get(self, acct_type, owner=None):
         acct = self.accounts.get((acct_type, owner))
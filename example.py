@@ -13,7 +13,8 @@ class Simulation(SimulationBase):
             salary=125_000,
             retirement_age=65,
             ss_age=70,
-            ss_benefits=[2606, 2793, 2998, 3264, 3533, 3804, 3921, 4243, 4767]
+            ss_benefits=[2606, 2793, 2998, 3264, 3533, 3804, 3921, 4243, 4767],
+            sex="M"
         )
         self.jane = Person(
             'Jane',
@@ -22,7 +23,8 @@ class Simulation(SimulationBase):
             64,
             70,
             [860, 948, 1045, 1170, 1300, 1436, 1548, 1714, 1940],
-            self.joe
+            self.joe,
+            "F"
         )
         super().__init__(start_year, num_years)
 
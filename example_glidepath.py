@@ -0,0 +1,29 @@
+from common import Account
+import chatgpt
+import example
+from simulation import glidepath
+
+
+class Simulation(example.Simulation):
+    # The same family as example.py, but with money split between stocks and bonds,
+    # sliding toward bonds as Joe gets close to retirement.
+
+    asset_classes = ["stocks", "bonds"]
+
+    def asset_return_percentages(self):
+        return [
+            chatgpt.random_inflation(mean=7.5, std_dev=12.0, min_value=-40.0, max_value=40.0),
+            chatgpt.random_inflation(mean=4.0, std_dev=4.0, min_value=-10.0, max_value=15.0),
+        ]
+
+
+    def asset_allocation(self, year, account):
+        if account.type == Account.DEFERRED_IRA:
+            # taxed as income when it comes out, so keep the slow growers here
+            return [0.3, 0.7]
+        stocks = glidepath(year, 2025, 0.9, self.joe.birthday.year + 70, 0.4)
+        return [stocks, 1.0 - stocks]
+
+
+    def rebalance(self, year):
+        return True
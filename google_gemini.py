@@ -1,7 +1,69 @@
-import math
-
-
-def estimate_us_healthcare_costs(age: int, health_status: str = 'average') -> dict:
+import numpy as np
+
+# Data points for average annual healthcare costs (in USD)
+# These are derived and interpolated from various sources (e.g., ACA premium data,
+# total personal healthcare expenditures for different age groups).
+# Note: For ages 65+, these estimates aim to capture total healthcare spending,
+# not just premiums, as Medicare becomes a primary payer.
+AVERAGE_ANNUAL_COSTS_BY_AGE = {
+    20: 4500,  # ~ACA premium * 12
+    25: 4700,  # Interpolated
+    30: 5300,  # ~ACA premium * 12
+    35: 5700,  # Interpolated
+    40: 6000,  # ~ACA premium * 12
+    45: 6800,  # Interpolated
+    50: 8300,  # ~ACA premium * 12
+    55: 10500,  # Interpolated
+    60: 12700,  # ~ACA premium * 12
+    # Medicare starts at 65, but costs increase significantly
+    65: 22400,  # Based on average for 65+ total spending
+    70: 25000,  # Estimated increase reflecting rising needs
+    75: 28000,  # Estimated increase
+    80: 32000,  # Estimated increase
+    85: 38000,  # Estimated increase
+    90: 45000,  # Estimated increase
+    95: 55000,  # Estimated increase
+    100: 65000  # Estimated for very advanced age
+}
+
+# Health status modifiers
+# Based on general understanding of how health impacts costs,
+# with 'unhealthy' having significantly higher costs due to chronic conditions.
+HEALTH_MODIFIERS = {
+    'healthy': 0.85,  # 15% less than average
+    'average': 1.00,  # Baseline
+    'unhealthy': 1.40  # 40% more than average
+}
+HEALTH_STATUSES = list(HEALTH_MODIFIERS)
+MAX_AGE = 100
+
+
+def _base_cost(age):
+    # Interpolate linearly between known data points, and hold the ends flat
+    ages = sorted(AVERAGE_ANNUAL_COSTS_BY_AGE.keys())
+    if age <= ages[0]:
+        return AVERAGE_ANNUAL_COSTS_BY_AGE[ages[0]]
+    if age >= ages[-1]:
+        return AVERAGE_ANNUAL_COSTS_BY_AGE[ages[-1]]
+    lower_age = max(a for a in ages if a <= age)
+    upper_age = min(a for a in ages if a >= age)
+    if lower_age == upper_age:  # Age is exactly one of the data points
+        return AVERAGE_ANNUAL_COSTS_BY_AGE[age]
+    cost_lower = AVERAGE_ANNUAL_COSTS_BY_AGE[lower_age]
+    cost_upper = AVERAGE_ANNUAL_COSTS_BY_AGE[upper_age]
+    # Linear interpolation formula:
+    # y = y1 + (x - x1) * (y2 - y1) / (x2 - x1)
+    return cost_lower + (age - lower_age) * (cost_upper - cost_lower) / (upper_age - lower_age)
+
+
+# Every answer, worked out once: COST_TABLE[age, HEALTH_STATUSES.index(status)]
+COST_TABLE = np.array([
+    [round(_base_cost(age) * HEALTH_MODIFIERS[status], 2) for status in HEALTH_STATUSES]
+    for age in range(MAX_AGE + 1)
+])
+
+
+def estimate_us_healthcare_costs(age: int, health_status: str = 'average') -> float:
     """
     Estimates annual healthcare costs in the US based on age and health status.
 
@@ -17,117 +79,59 @@ def estimate_us_healthcare_costs(age: int, health_status: str = 'average') -> di
                              Defaults to 'average'.
 
     Returns:
-        dict: A dictionary containing the estimated annual healthcare cost and
-              the health status used for the estimation.
-              Returns None if the age is out of a reasonable range (e.g., <0 or >100).
+        float: The estimated annual cost in dollars.  Ages over 100 cost the same as 100.
     """
 
-    # Data points for average annual healthcare costs (in USD)
-    # These are derived and interpolated from various sources (e.g., ACA premium data,
-    # total personal healthcare expenditures for different age groups).
-    # Note: For ages 65+, these estimates aim to capture total healthcare spending,
-    # not just premiums, as Medicare becomes a primary payer.
-    average_annual_costs_by_age = {
-        20: 4500,  # ~ACA premium * 12
-        25: 4700,  # Interpolated
-        30: 5300,  # ~ACA premium * 12
-        35: 5700,  # Interpolated
-        40: 6000,  # ~ACA premium * 12
-        45: 6800,  # Interpolated
-        50: 8300,  # ~ACA premium * 12
-        55: 10500,  # Interpolated
-        60: 12700,  # ~ACA premium * 12
-        # Medicare starts at 65, but costs increase significantly
-        65: 22400,  # Based on average for 65+ total spending
-        70: 25000,  # Estimated increase reflecting rising needs
-        75: 28000,  # Estimated increase
-        80: 32000,  # Estimated increase
-        85: 38000,  # Estimated increase
-        90: 45000,  # Estimated increase
-        95: 55000,  # Estimated increase
-        100: 65000  # Estimated for very advanced age
-    }
-
-    # Health status modifiers
-    # Based on general understanding of how health impacts costs,
-    # with 'unhealthy' having significantly higher costs due to chronic conditions.
-    health_modifiers = {
-        'healthy': 0.85,  # 15% less than average
-        'average': 1.00,  # Baseline
-        'unhealthy': 1.40  # 40% more than average
-    }
-
     # Input validation
-    if age > 100:
-        age = 100  # Clamp to maximum age
-    if not isinstance(age, int) or age < 0 or age > 100:
+    if age > MAX_AGE:
+        age = MAX_AGE  # Clamp to maximum age
+    if not isinstance(age, int) or age < 0 or age > MAX_AGE:
         raise ValueError("Age must be an integer between 0 and 100.")
-    if health_status.lower() not in health_modifiers:
-        raise ValueError(f"Error: Invalid health_status. Must be one of {list(health_modifiers.keys())}.")
-
-    # Normalize health_status input
-    health_status = health_status.lower()
+    if health_status.lower() not in HEALTH_MODIFIERS:
+        raise ValueError(f"Error: Invalid health_status. Must be one of {HEALTH_STATUSES}.")
 
-    # Find the appropriate age range for interpolation
-    ages = sorted(average_annual_costs_by_age.keys())
+    return float(COST_TABLE[age, HEALTH_STATUSES.index(health_status.lower())])
 
-    # Handle ages outside the defined range
-    if age <= ages[0]:
-        base_cost = average_annual_costs_by_age[ages[0]]
-    elif age >= ages[-1]:
-        base_cost = average_annual_costs_by_age[ages[-1]]
-    else:
-        # Interpolate linearly between known data points
-        lower_age = max(a for a in ages if a <= age)
-        upper_age = min(a for a in ages if a >= age)
-
-        if lower_age == upper_age:  # Age is exactly one of the data points
-            base_cost = average_annual_costs_by_age[age]
-        else:
-            cost_lower = average_annual_costs_by_age[lower_age]
-            cost_upper = average_annual_costs_by_age[upper_age]
-
-            # Linear interpolation formula:
-            # y = y1 + (x - x1) * (y2 - y1) / (x2 - x1)
-            base_cost = cost_lower + (age - lower_age) * \
-                        (cost_upper - cost_lower) / (upper_age - lower_age)
 
-    # Apply health status modifier
-    estimated_cost = base_cost * health_modifiers[health_status]
+def estimate_us_healthcare_costs_array(ages, health_status='average', years=0, medical_inflation=0.0):
+    """
+    Same as estimate_us_healthcare_costs(), for a whole numpy array of ages at once - say,
+    every member of the household on every path.  Ages are clamped to 0 ... 100, and ages
+    in between whole years are interpolated.
 
-    return round(estimated_cost, 2)
+    health_status is one status, or an array of them that lines up with ages.
+    With medical_inflation (percent per year, above regular inflation), costs grow by
+    that much for each of years, which is a number or an array that lines up with ages.
+    """
+    ages = np.clip(np.asarray(ages, dtype=float), 0, MAX_AGE)
+    statuses = np.char.lower(np.asarray(health_status, dtype=str))
+    unknown = set(np.unique(statuses)) - set(HEALTH_STATUSES)
+    if unknown:
+        raise ValueError(f"Error: Invalid health_status {sorted(unknown)}. Must be one of {HEALTH_STATUSES}.")
+    costs = np.zeros(np.broadcast(ages, statuses).shape)
+    for column, status in enumerate(HEALTH_STATUSES):
+        costs = np.where(statuses == status, np.interp(ages, np.arange(MAX_AGE + 1), COST_TABLE[:, column]), costs)
+    if medical_inflation:
+        costs = costs * (1.0 + medical_inflation / 100.0) ** np.asarray(years)
+    return costs
 
 
 # --- Example Usage ---
 if __name__ == "__main__":
     print("--- Healthcare Cost Estimates ---")
 
-    # Example 1: Average health at 30
-    estimate1 = estimate_us_healthcare_costs(30)
-    if estimate1:
-        print(f"Age: {estimate1['age']}, Health: {estimate1['health_status']}, "
-              f"Estimated Annual Cost: ${estimate1['estimated_annual_cost_usd']:,}")
-
-    # Example 2: Healthy individual at 65
-    estimate2 = estimate_us_healthcare_costs(65, 'healthy')
-    if estimate2:
-        print(f"Age: {estimate2['age']}, Health: {estimate2['health_status']}, "
-              f"Estimated Annual Cost: ${estimate2['estimated_annual_cost_usd']:,}")
-
-    # Example 3: Unhealthy individual at 78 (interpolation)
-    estimate3 = estimate_us_healthcare_costs(78, 'unhealthy')
-    if estimate3:
-        print(f"Age: {estimate3['age']}, Health: {estimate3['health_status']}, "
-              f"Estimated Annual Cost: ${estimate3['estimated_annual_cost_usd']:,}")
-
-    # Example 4: Age outside range (clamped to boundary)
-    estimate4 = estimate_us_healthcare_costs(10, 'healthy')
-    if estimate4:
-        print(f"Age: {estimate4['age']}, Health: {estimate4['health_status']}, "
-              f"Estimated Annual Cost: ${estimate4['estimated_annual_cost_usd']:,}")
-
-    # Example 5: Invalid health status
-    estimate5 = estimate_us_healthcare_costs(50, 'excellent')
-    if estimate5:
-        print(f"Age: {estimate5['age']}, Health: {estimate5['health_status']}, "
-              f"Estimated Annual Cost: ${estimate5['estimated_annual_cost_usd']:,}")
+    for age, health_status in [(30, 'average'), (65, 'healthy'), (78, 'unhealthy'), (10, 'healthy')]:
+        cost = estimate_us_healthcare_costs(age, health_status)
+        print(f"Age: {age}, Health: {health_status}, Estimated Annual Cost: ${cost:,}")
+
+    # A couple, for the next 30 years, with medical costs growing 2% a year faster than inflation
+    years = np.arange(30)
+    couple = np.array([[66], [64]]) + years
+    costs = estimate_us_healthcare_costs_array(couple, [['average'], ['healthy']], years, medical_inflation=2.0)
+    print(f"Couple, next 30 years: ${costs.sum():,.0f}")
+
+    # Invalid health status
+    try:
+        estimate_us_healthcare_costs(50, 'excellent')
+    except ValueError as e:
+        print(e)
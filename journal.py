@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# TRANSACTION JOURNAL - RECORD EVERY MOVE OF MONEY AS A ROW OF NUMBERS, NOT A LINE OF TEXT
+#
+# Rows go into a preallocated numpy buffer, which is written to disk a chunk at a time.
+# A small JSON file next to it says what the phase and account numbers mean.
+#
+#   python main.py --journal=runs.journal --runs=100
+#   python journal.py runs.journal
+
+import argparse
+import json
+
+import numpy as np
+
+ROW = np.dtype([
+    ("run", np.uint32),
+    ("year", np.uint16),
+    ("phase", np.uint8),
+    ("slot", np.uint16),
+    ("amount", np.float64),
+])
+
+# the yearly steps of SimulationBase.simulate_year(), in order, after the deaths at the start of the year
+PHASES = [
+    "household_deaths",
+    "job_income",
+    "socsec_income",
+    "budget_expenses",
+    "housing_expenses",
+    "healthcare_expenses",
+    "other_one_time_adjustments",
+    "required_minimum_distributions",
+    "roth_conversions",
+    "voluntary_distributions",
+    "calculate_taxes",
+    "sweep_category_accounts_into_savings",
+    "ensure_minimum_savings_balance",
+    "apply_investment_returns_and_inflation",
+]
+PHASE_NUMBER = {phase: number for number, phase in enumerate(PHASES)}
+
+
+class Journal:
+    def __init__(self, path, chunk_rows=1_000_000):
+        self.path = path
+        self.file = open(path, "wb")
+        self.buffer = np.empty(chunk_rows, dtype=ROW)
+        self.used = 0
+        self.rows = 0
+        self.runs = 0
+        # (acct_type, owner name) -> slot number, in the order they show up
+        self.slots = {}
+        # where the simulation is right now, for record()
+        self.run = 0
+        self.year = 0
+        self.phase = 0
+
+    def slot(self, acct_type, owner_name):
+        return self.slots.setdefault((acct_type, owner_name), len(self.slots))
+
+    def record(self, account, amount):
+        # called by Account.add() - keep this cheap
+        if not amount:
+            return
+        if self.used == len(self.buffer):
+            self.flush()
+        owner_name = account.owner.name if account.owner else None
+        self.buffer[self.used] = (self.run, self.year, self.phase, self.slot(account.type, owner_name), amount)
+        self.used += 1
+
+    def record_many(self, runs, year, phase, acct_type, owner_name, amounts):
+        # the batched engine's version: one row per run, for the same account
+        keep = amounts != 0
+        runs, amounts = runs[keep], amounts[keep]
+        slot = self.slot(acct_type, owner_name)
+        while len(amounts):
+            if self.used == len(self.buffer):
+                self.flush()
+            count = min(len(amounts), len(self.buffer) - self.used)
+            rows = self.buffer[self.used:self.used + count]
+            rows["run"] = runs[:count]
+            rows["year"] = year
+            rows["phase"] = PHASE_NUMBER[phase]
+            rows["slot"] = slot
+            rows["amount"] = amounts[:count]
+            self.used += count
+            runs, amounts = runs[count:], amounts[count:]
+
+    def flush(self):
+        self.file.write(self.buffer[:self.used].tobytes())
+        self.rows += self.used
+        self.used = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        with open(self.path + ".json", "w") as manifest:
+            json.dump({
+                "fields": [[name, ROW[name].str] for name in ROW.names],
+                "rows": self.rows,
+                "runs": self.runs,
+                "phases": PHASES,
+                "slots": [list(key) for key in self.slots],
+            }, manifest, indent=2)
+
+    def attach(self, sim, run_num):
+        """
+        Journal one run of sim.  The yearly steps get wrapped so the journal knows which
+        phase it is in, and single_simulation() hands the journal to every account.
+        """
+        self.run = run_num
+        self.runs = max(self.runs, run_num + 1)
+        sim.journal = self
+
+        def enter_year(step):
+            def wrapped():
+                self.year = sim.year
+                return step()
+            return wrapped
+
+        def enter_phase(phase, step):
+            def wrapped(*args):
+                self.phase = PHASE_NUMBER[phase]
+                return step(*args)
+            return wrapped
+
+        for phase in PHASES:
+            setattr(sim, phase, enter_phase(phase, getattr(sim, phase)))
+        sim.simulate_year = enter_year(sim.simulate_year)
+        sim.household_deaths = enter_year(sim.household_deaths)
+
+    def recorder(self, runs, year):
+        # for the batched engine: note(phase, (acct_type, owner name), amounts)
+        def note(phase, key, amounts):
+            self.record_many(runs, year, phase, key[0], key[1], amounts)
+        return note
+
+
+def read_journal(path):
+    with open(path + ".json") as manifest:
+        info = json.load(manifest)
+    rows = np.memmap(path, dtype=ROW, mode="r", shape=(info["rows"],)) if info["rows"] else np.empty(0, dtype=ROW)
+    return rows, info
+
+
+def phase_breakdown(rows, info, chunk_rows=10_000_000):
+    """
+    Add up the amounts for each (phase, account type), a chunk at a time so a huge journal
+    never has to fit in memory.  Returns (account types, array shaped (phases, types)).
+    """
+    acct_types = sorted({acct_type for acct_type, _ in info["slots"]})
+    slot_type = np.array([acct_types.index(acct_type) for acct_type, _ in info["slots"]], dtype=np.int64)
+    num_cells = len(PHASES) * len(acct_types)
+    sums = np.zeros(num_cells)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        cell = chunk["phase"].astype(np.int64) * len(acct_types) + slot_type[chunk["slot"]]
+        sums += np.bincount(cell, weights=chunk["amount"], minlength=num_cells)
+    return acct_types, sums.reshape(len(PHASES), len(acct_types))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summarize a transaction journal")
+    parser.add_argument("journal", help="journal file written by --journal")
+    args = parser.parse_args()
+
+    rows, info = read_journal(args.journal)
+    acct_types, sums = phase_breakdown(rows, info)
+    runs = max(info["runs"], 1)
+    print(f"{info['rows']:,} transactions over {info['runs']:,} runs, average $ per run:")
+    print(f"{'phase':<40}" + "".join(f"{acct_type:>16}" for acct_type in acct_types))
+    for phase, phase_sums in zip(PHASES, sums):
+        if phase_sums.any():
+            print(f"{phase:<40}" + "".join(f"{int(amount / runs):>16,}" for amount in phase_sums))
+
+
+if __name__ == "__main__":
+    main()
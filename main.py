@@ -1,58 +1,137 @@
 #!/usr/bin/env python3
 # ENTRY POINT - FOR RUNNING THE SIMULATOR
+#
+# The work is done by montecarlo.run_monte_carlo(); this just reads the command line,
+# prints the success table and draws the chart.
 
 import argparse
 import datetime
+import importlib
+
 import matplotlib.pyplot as plt
+import numpy as np
+
+from memprofile import MemoryProfile, phase
+from montecarlo import make_simulation, print_success_table, replay, run_monte_carlo
+
+# more lines than this just make the chart slow to draw
+PLOTTED_RUNS = 500
+# failed runs to list after a quiet run, to pick one to --replay
+LISTED_FAILURES = 10
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    parser.add_argument("--runs", type=int, default=100, help="number of simulations")
+    parser.add_argument("--years", type=int, default=50, help="number of years")
+    parser.add_argument("--seed", type=int, default=None, help="random seed (default: a new one every time)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, with --quiet")
+    parser.add_argument("--quiet", default=False, action="store_true",
+                        help="don't print every run, and use the batched engine if the simulation allows it")
+    parser.add_argument("--debug", default=False, action="store_true", help="print more output")
+    parser.add_argument("--journal", default=None, help="record every move of money in this file")
+    parser.add_argument("--bank", default=None, help="take market draws from this scenario bank")
+    parser.add_argument("--monthly", default=False, action="store_true", help="move money and markets a month at a time")
+    parser.add_argument("--roth-schedule", default=None, help="convert to Roth by this schedule, from roth_optimizer.py")
+    parser.add_argument("--mortality", default=False, action="store_true", help="give everyone a random lifespan")
+    parser.add_argument("--watch", default=False, action="store_true", help="re-run every time the simulation module is saved")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="megabytes to stay within, with --quiet; only the first runs are kept for the chart")
+    parser.add_argument("--mem-profile", default=False, action="store_true",
+                        help="print how much memory each phase took, and where it went")
+    parser.add_argument("--replay", type=int, default=None, metavar="K",
+                        help="tell the whole story of run K (counting from 0) of --seed, with --debug output")
+    parser.add_argument("--importance", default=False, action="store_true",
+                        help="estimate a small chance of running out of money by rolling worse markets and weighing the runs")
+    args = parser.parse_args()
+
+    start_year = datetime.date.today().year
+    num_years = args.years
+
+    # Import the custom simulator class based on the command line argument
+    simulation_module = importlib.import_module(args.simulation)
+
+    overrides = {}
+    if args.monthly:
+        overrides["steps_per_year"] = 12
+    if args.roth_schedule:
+        from roth_optimizer import load_schedule
+        overrides["roth_conversion_schedule"] = load_schedule(args.roth_schedule)
+    if args.mortality:
+        overrides["mortality"] = True
+
+    if args.replay is not None:
+        if args.seed is None:
+            parser.error("--replay needs the --seed that the runs were made with")
+        totals, batched = replay(simulation_module.Simulation, args.replay, args.seed, num_years, start_year,
+                                 overrides, args.bank)
+        if batched is None:
+            print(f"(run {args.replay} can only run one run at a time, so there is nothing to check it against)")
+        elif np.array_equal(totals, batched):
+            print(f"run {args.replay} of seed {args.seed} matches the batched engine in every year")
+        else:
+            years = [start_year + idx for idx in np.flatnonzero(totals != batched)]
+            print(f"WARNING: run {args.replay} of seed {args.seed} doesn't match the batched engine in {years}")
+        return
+
+    if args.importance:
+        if args.bank:
+            parser.error("--importance rolls its own markets, so it can't take them from --bank")
+        from tailrisk import failure_probability, print_failure_table
+        result = failure_probability(simulation_module.Simulation, args.runs, args.seed, num_years, start_year, overrides)
+        print_failure_table(make_simulation(simulation_module.Simulation, start_year, num_years, overrides), result,
+                            args.runs)
+        print(f"(seed {result['seed']} - add --seed={result['seed']} to see these runs again)")
+        return
+
+    if args.watch:
+        from watch import Watcher
+        Watcher(args.simulation, start_year, num_years, args.runs, seed=args.seed, overrides=overrides,
+                bank=args.bank).watch()
+        return
+
+    journal = None
+    if args.journal:
+        from journal import Journal
+        journal = Journal(args.journal)
+
+    profile = MemoryProfile() if args.mem_profile else None
+    result = run_monte_carlo(simulation_module.Simulation, num_years, args.runs, args.seed, args.workers,
+                             start_year=start_year, overrides=overrides, bank=args.bank, journal=journal,
+                             debug=args.debug, verbose=not args.quiet, max_memory=args.max_memory, profile=profile)
+
+    if journal:
+        journal.close()
+
+    print_success_table(make_simulation(simulation_module.Simulation, start_year, num_years, overrides), result.totals,
+                        success_pct=result.success_pct)
+    print(f"(seed {result.seed} - add --seed={result.seed} to see these runs again)")
+    failed = np.flatnonzero(result.totals[:, -1] <= 0)
+    if args.quiet and len(failed):
+        listed = ", ".join(str(run_num) for run_num in failed[:LISTED_FAILURES])
+        more = f" and {len(failed) - LISTED_FAILURES} more" if len(failed) > LISTED_FAILURES else ""
+        among = f" (of the first {len(result.totals):,})" if result.aggregate is not None else ""
+        print(f"runs that ran out of money{among}: {listed}{more} - add --replay=K --seed={result.seed} to see one")
+
+    with phase(profile, "plot"):
+        for single_sim_data in result.totals[:PLOTTED_RUNS]:
+            plt.plot(result.years, single_sim_data, marker=None, linestyle=None)
+    if profile:
+        profile.report()
+
+    # plt.title("My Plot")
+    plt.xlabel("years")
+    plt.ylabel("money")
+    plt.ylim(bottom=0, top=4_000_000)
+
+    # Format the y-axis (money) to prevent scientific notation
+    plt.ticklabel_format(axis='y', style='plain')
+    # Optionally, format the x-axis (years) as well
+    plt.ticklabel_format(axis='x', style='plain')
+
+    plt.show(block=True)
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
-parser.add_argument("--runs", type=int, default=100, help="number of simulations")
-parser.add_argument("--years", type=int, default=50, help="number of years")
-parser.add_argument("--debug", default=False, action="store_true", help="print more output")
-
-args = parser.parse_args()
-
-
-start_year = datetime.date.today().year
-num_years = args.years
-year_array = range(start_year, start_year + num_years + 1)
-num_runs = args.runs
-successes = [0] * (num_years + 1)
-
-# Import the custom simulator class based on the command line argument
-simulation_module = __import__(args.simulation)
-
-for run_num in range(num_runs):
-    print(f"\n{50 * '-'}\n")
-    print(f"SIMULATION {run_num + 1}")
-    this_sim = simulation_module.Simulation(start_year, num_years)
-    if args.debug:
-        this_sim.debug = True
-    print(f"starting {this_sim}")
-    single_sim_data = this_sim.single_simulation()
-    plt.plot(year_array, single_sim_data, marker=None, linestyle=None)
-
-    # calculate successes - in this one run, did my money last X years?
-    for year in year_array:
-        if single_sim_data[year - start_year] > 0:
-            successes[year - start_year] += 1
-
-for year in range(start_year, start_year + num_years + 1, 5):
-    simulation_instance = simulation_module.Simulation(start_year, num_years)
-    family = simulation_instance.family()
-    ages = ', '.join([str(p.age(year)) for p in family])
-    print(f"{year} (ages {ages}), {100 * successes[year - start_year] / num_runs : .1f} %")
-
-# plt.title("My Plot")
-plt.xlabel("years")
-plt.ylabel("money")
-plt.ylim(bottom=0, top=4_000_000)
-
-# Format the y-axis (money) to prevent scientific notation
-plt.ticklabel_format(axis='y', style='plain')
-# Optionally, format the x-axis (years) as well
-plt.ticklabel_format(axis='x', style='plain')
-
-plt.show(block=True)
+if __name__ == "__main__":
+    main()
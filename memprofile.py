@@ -0,0 +1,90 @@
+# MEMORY PROFILE - HOW MUCH MEMORY EACH PHASE OF A MONTE CARLO RUN TAKES, AND WHERE IT GOES
+#
+#   python main.py --runs=100000 --quiet --mem-profile
+#   python main.py --runs=10000000 --quiet --max-memory=500
+#
+# Peak RSS comes from the operating system; everything else comes from tracemalloc,
+# which numpy reports its arrays to, so the big arrays show up under the line that made them.
+# Tracing every allocation makes the Python-heavy phases (rolling the market draws) a few
+# times slower, so the seconds are only good for comparing phases with each other.
+
+import contextlib
+import resource
+import sys
+import time
+import tracemalloc
+
+MB = 2 ** 20
+# tracemalloc's own bookkeeping isn't worth reporting
+NOT_TRACEMALLOC = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def peak_rss():
+    # the most memory this process has used so far, in bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss():
+    # the memory this process is using right now, in bytes (the peak, where we can't tell)
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_rss()
+
+
+class MemoryProfile:
+    """
+    Wrap each phase in "with profile.phase(name):".  For every phase name it keeps how long
+    it took, the most memory tracemalloc saw in use at once during it, the peak RSS of the
+    process by the end of it, and the source lines holding the most new memory when it
+    ended.  A phase that runs many times (once per block) adds up.
+    """
+
+    def __init__(self, top=5):
+        self.top = top
+        # name -> {"count", "seconds", "peak", "rss", "sites": {line: bytes}}
+        self.phases = {}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot().filter_traces(NOT_TRACEMALLOC)
+        started = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot().filter_traces(NOT_TRACEMALLOC)
+            stats = self.phases.setdefault(name, {"count": 0, "seconds": 0.0, "peak": 0, "rss": 0, "sites": {}})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["peak"] = max(stats["peak"], peak)
+            stats["rss"] = max(stats["rss"], peak_rss())
+            for diff in after.compare_to(before, "lineno"):
+                if diff.size_diff > 0:
+                    site = str(diff.traceback[0])
+                    stats["sites"][site] = stats["sites"].get(site, 0) + diff.size_diff
+            del before, after
+
+    def report(self):
+        print(f"peak RSS {peak_rss() / MB:,.1f} MB")
+        print(f"{'phase':<16}{'times':>7}{'seconds':>10}{'traced peak':>14}{'RSS by end':>13}")
+        for name, stats in self.phases.items():
+            print(f"{name:<16}{stats['count']:>7,}{stats['seconds']:>10.2f}"
+                  f"{stats['peak'] / MB:>11.1f} MB{stats['rss'] / MB:>10.1f} MB")
+            sites = sorted(stats["sites"].items(), key=lambda item: -item[1])[:self.top]
+            for site, size in sites:
+                print(f"    {size / MB:>9.2f} MB  {site}")
+
+
+def phase(profile, name):
+    # profile.phase(name), or nothing if there is no profile
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.phase(name)
@@ -0,0 +1,308 @@
+# MONTE CARLO - RUN A SIMULATION MANY TIMES AND HAND BACK ARRAYS INSTEAD OF PRINTOUTS
+#
+#   from montecarlo import run_monte_carlo
+#   import example
+#   result = run_monte_carlo(example.Simulation, years=50, runs=5000, seed=1)
+#   result.success_pct[-1], result.percentiles[50]
+#
+# main.py is a thin wrapper around this, and notebooks or other services can call it in
+# the same process.  Run N is seeded with run_seed(seed, N), the same as batch.py and
+# shard.py, so a seed gives the same runs whichever engine does the work and however
+# many worker processes share it.
+#
+# With max_memory, the runs go through in blocks sized to fit, and each block's totals are
+# added to a shard.Aggregate and thrown away, so any number of runs fits in the same memory.
+
+import concurrent.futures
+import contextlib
+import datetime
+import os
+import random
+
+import numpy as np
+
+from memprofile import MB, current_rss, phase
+from scenario_bank import ScenarioBank
+from simulation import RETURNS, run_seed
+from vectorized import CompiledSimulation, run_batched
+
+ENGINES = ["auto", "batched", "scalar"]
+# runs the batched engine does at once, so a big study doesn't need all its draws in memory
+BLOCK = 10_000
+# with max_memory, the runs whose totals are kept (for plotting); the rest only go into the aggregate
+KEPT_RUNS = 1000
+PERCENTILES = [10, 50, 90]
+
+# scenario banks opened by this process, by path
+banks = {}
+
+
+class MonteCarloResult:
+    """
+    What run_monte_carlo() found, as numpy arrays:
+      totals          total value at the start of each year, shaped (runs, years + 1)
+      years           the calendar year of each column
+      success_counts  how many runs still had money in each year
+      success_pct     the same, in percent
+      percentiles     {p: total value at the p-th percentile in each year}, for PERCENTILES
+      outlived_money_pct  with mortality, percent of runs where the money ran out while
+                      someone was still alive (None without mortality)
+    With an aggregate (a shard.Aggregate of every run), totals only holds the first few
+    runs, and the percentiles come from its histogram, which is good to about 1%.
+    """
+
+    def __init__(self, totals, start_year, seed, engine, mortality=False, aggregate=None):
+        self.totals = totals
+        self.start_year = start_year
+        self.seed = seed
+        self.engine = engine
+        self.aggregate = aggregate
+        self.years = np.arange(start_year, start_year + totals.shape[1])
+        if aggregate is None:
+            self.runs = len(totals)
+            self.success_counts = np.count_nonzero(totals > 0, axis=0)
+            self.percentiles = dict(zip(PERCENTILES, np.percentile(totals, PERCENTILES, axis=0)))
+        else:
+            self.runs = aggregate.runs
+            self.success_counts = aggregate.successes.copy()
+            self.percentiles = {p: np.array([aggregate.percentile(year_idx, p) for year_idx in range(len(self.years))])
+                                for p in PERCENTILES}
+        self.success_pct = 100.0 * self.success_counts / self.runs
+        self.outlived_money_pct = None
+        if mortality:
+            self.outlived_money_pct = 100.0 * (self.runs - self.success_counts[-1]) / self.runs
+
+
+def success_rates(totals):
+    # percent of runs, for each year, where the money lasted
+    return 100.0 * np.count_nonzero(totals > 0, axis=0) / totals.shape[0]
+
+
+def open_bank(path):
+    if path not in banks:
+        banks[path] = ScenarioBank(path)
+    return banks[path]
+
+
+def bank_draws(bank_path, sim, seed, first_run, num_runs):
+    # Draws for a block of runs from a scenario bank, split into steps the same way the
+    # one-run-at-a-time path of run_block() does it, so the batched engine sees the same markets.
+    draws = open_bank(bank_path).draws(first_run, num_runs, sim.num_years, sim.asset_classes)
+    if sim.steps_per_year == 1:
+        return draws
+    steps = []
+    for row, run_num in enumerate(range(first_run, first_run + num_runs)):
+        sim.seed(run_seed(seed, run_num))
+        steps.append(sim.spread_over_steps(draws[row]))
+    return np.stack(steps)
+
+
+def make_simulation(simulation_cls, start_year, num_years, overrides):
+    sim = simulation_cls(start_year, num_years)
+    sim.override(overrides or {})
+    return sim
+
+
+def pick_engine(sim, engine="auto"):
+    # "batched" if the batched engine can run sim, "scalar" if it can't
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine}, pick one of {ENGINES}")
+    if engine == "auto":
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                CompiledSimulation(sim)
+        except ValueError:
+            return "scalar"
+        return "batched"
+    return engine
+
+
+def bytes_per_run(sim, engine, num_slots):
+    # A generous guess at the memory one run needs while its block is going through: the
+    # market draws (and the noise that splits years into steps), the balances and their
+    # copies inside simulate_year(), the year totals, and the aggregate's temporaries.
+    if engine == "scalar":
+        # a list of Python ints, plus its row in the block's totals
+        return 64 * (sim.num_years + 1)
+    num_assets = len(sim.asset_classes) if sim.asset_classes else 1
+    draws = sim.num_years * sim.steps_per_year * (RETURNS + num_assets)
+    balances = num_slots * (1 + num_assets)
+    return 8 * (3 * draws + 6 * balances + 4 * (sim.num_years + 1) + 64)
+
+
+def block_for_memory(sim, engine, max_memory, workers=1):
+    # how many runs to do at once for each process to stay within max_memory megabytes in all
+    num_slots = 0
+    if engine == "batched":
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            num_slots = len(CompiledSimulation(sim).slots)
+    # every worker starts out as big as this process is now
+    available = max_memory * MB / workers - current_rss()
+    per_run = bytes_per_run(sim, engine, num_slots)
+    if available < 100 * per_run:
+        raise ValueError(f"{max_memory} MB is not enough: each of {workers} processes starts at "
+                         f"{current_rss() / MB:.0f} MB, and each run needs about {per_run / 1024:.0f} KB more")
+    return int(available // per_run)
+
+
+def run_block(simulation_cls, start_year, num_years, seed, first_run, num_runs, overrides=None, bank=None,
+              engine="batched", journal=None, debug=False, verbose=False, profile=None, block=BLOCK):
+    """
+    Runs first_run ... first_run + num_runs - 1, with the batched engine (block runs at a
+    time) or one at a time with single_simulation().  Returns their year totals, shaped
+    (runs, years + 1).  profile is a memprofile.MemoryProfile, if given.
+    """
+    sim = make_simulation(simulation_cls, start_year, num_years, overrides)
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        if engine == "batched":
+            with phase(profile, "compile"):
+                compiled = CompiledSimulation(sim)
+            blocks = []
+            for first in range(first_run, first_run + num_runs, block):
+                count = min(block, first_run + num_runs - first)
+                with phase(profile, "draws"):
+                    if bank:
+                        draws = bank_draws(bank, sim, seed, first, count)
+                    else:
+                        draws = sim.market_draws(seed, first, count)
+                    death_ages = sim.death_ages(seed, first, count) if sim.mortality else None
+                with phase(profile, "simulate"):
+                    blocks.append(run_batched(compiled, draws, journal=journal, death_ages=death_ages, first_run=first))
+                del draws, death_ages
+            return np.concatenate(blocks)
+
+        totals = []
+        for run_num in range(first_run, first_run + num_runs):
+            print(f"\n{50 * '-'}\n")
+            print(f"SIMULATION {run_num + 1}")
+            this_sim = make_simulation(simulation_cls, start_year, num_years, overrides)
+            this_sim.debug = debug
+            this_sim.seed(run_seed(seed, run_num))
+            if bank:
+                yearly = open_bank(bank).draws(run_num, 1, num_years, this_sim.asset_classes)[0]
+                this_sim.draws = this_sim.spread_over_steps(yearly)
+            if journal:
+                journal.attach(this_sim, run_num)
+            print(f"starting {this_sim}")
+            with phase(profile, "simulate"):
+                totals.append(this_sim.single_simulation())
+        return np.array(totals, dtype=np.int64)
+
+
+def stream_block(simulation_cls, start_year, num_years, seed, first_run, num_runs, overrides=None, bank=None,
+                 engine="batched", block=BLOCK, keep=KEPT_RUNS, profile=None):
+    """
+    Runs first_run ... first_run + num_runs - 1 block runs at a time, adding each block's
+    totals to a shard.Aggregate and keeping only the ones of runs before keep.
+    Returns (aggregate, kept totals).
+    """
+    from shard import Aggregate
+
+    aggregate = Aggregate(num_years)
+    kept = [np.zeros((0, num_years + 1), dtype=np.int64)]
+    for first in range(first_run, first_run + num_runs, block):
+        count = min(block, first_run + num_runs - first)
+        totals = run_block(simulation_cls, start_year, num_years, seed, first, count, overrides, bank, engine,
+                           profile=profile, block=block)
+        with phase(profile, "aggregate"):
+            aggregate.add(totals, first)
+        if first < keep:
+            kept.append(totals[:keep - first].copy())
+        del totals
+    return aggregate, np.concatenate(kept)
+
+
+def run_monte_carlo(simulation_cls, years=50, runs=100, seed=None, workers=1, start_year=None, overrides=None,
+                    bank=None, engine="auto", journal=None, debug=False, verbose=False, max_memory=None,
+                    profile=None):
+    """
+    Run simulation_cls (a SimulationBase subclass) runs times over years years, and return
+    a MonteCarloResult.
+
+    seed None picks one at random (it is kept in the result).  overrides are applied to
+    every run with SimulationBase.override(), and bank is the path of a scenario bank to
+    take the markets from.  engine "auto" uses the batched engine when the simulation
+    allows it.  verbose prints every run's year-by-year story (debug adds more), which
+    only single_simulation() tells, so it runs them one at a time.  With workers, blocks
+    of runs are spread over that many processes, except with a journal or verbose.
+
+    max_memory (megabytes, for all the processes together) streams the runs through in
+    blocks that fit, keeping only the totals of the first KEPT_RUNS runs.  profile, a
+    memprofile.MemoryProfile, keeps track of each phase's memory (in this process only,
+    so it runs everything here).
+    """
+    start_year = start_year or datetime.date.today().year
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    sim = make_simulation(simulation_cls, start_year, years, overrides)
+    if verbose or debug:
+        if engine == "batched":
+            raise ValueError("only the scalar engine prints what happens in each run")
+        engine = "scalar"
+    engine = pick_engine(sim, engine)
+    if profile is not None:
+        workers = 1
+
+    if max_memory:
+        if journal is not None or verbose:
+            raise ValueError("max_memory streams the runs, so it can't print or journal them")
+        block = block_for_memory(sim, engine, max_memory, workers)
+        size = max(1, -(-runs // workers))
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(stream_block, *zip(*[
+                    (simulation_cls, start_year, years, seed, first, min(size, runs - first), overrides, bank, engine,
+                     block)
+                    for first in range(0, runs, size)])))
+        else:
+            parts = [stream_block(simulation_cls, start_year, years, seed, 0, runs, overrides, bank, engine, block,
+                                  profile=profile)]
+        aggregate = parts[0][0]
+        for other, _ in parts[1:]:
+            aggregate.merge(other)
+        kept = np.concatenate([totals for _, totals in parts])[:KEPT_RUNS]
+        return MonteCarloResult(kept, start_year, seed, engine, sim.mortality, aggregate)
+
+    if workers > 1 and journal is None and not verbose:
+        size = max(1, -(-runs // workers))
+        firsts = range(0, runs, size)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = pool.map(run_block, *zip(*[
+                (simulation_cls, start_year, years, seed, first, min(size, runs - first), overrides, bank, engine)
+                for first in firsts]))
+            totals = np.concatenate(list(blocks))
+    else:
+        totals = run_block(simulation_cls, start_year, years, seed, 0, runs, overrides, bank, engine, journal, debug,
+                           verbose, profile)
+    return MonteCarloResult(totals, start_year, seed, engine, sim.mortality)
+
+
+def replay(simulation_cls, run_num, seed, years=50, start_year=None, overrides=None, bank=None, debug=True):
+    """
+    Run number run_num of seed again, by itself, with single_simulation() - printing its
+    year-by-year story, and with debug every move of money too.  Nothing is stored: the
+    run's seed comes from run_seed(seed, run_num), as it did the first time.  Returns its
+    year totals, and the batched engine's for the same run to check them against (None
+    for simulations that can only run one run at a time).
+    """
+    start_year = start_year or datetime.date.today().year
+    totals = run_block(simulation_cls, start_year, years, seed, run_num, 1, overrides, bank, "scalar", debug=debug,
+                       verbose=True)[0]
+    batched = None
+    if pick_engine(make_simulation(simulation_cls, start_year, years, overrides)) == "batched":
+        batched = run_block(simulation_cls, start_year, years, seed, run_num, 1, overrides, bank, "batched")[0]
+    return totals, batched
+
+
+def print_success_table(sim, totals, step=5, success_pct=None):
+    # percent of runs with money left, every step years, with everyone's ages
+    # (success_pct, if given, is used instead of working it out from totals)
+    if success_pct is None:
+        success_pct = 100 * np.count_nonzero(totals > 0, axis=0) / len(totals)
+    for year in range(sim.start_year, sim.start_year + sim.num_years + 1, step):
+        ages = ', '.join([str(p.age(year)) for p in sim.everyone()])
+        print(f"{year} (ages {ages}), {success_pct[year - sim.start_year] : .1f} %")
+    if sim.mortality:
+        print(f"chance of outliving the money: {100 - success_pct[-1] : .1f} %")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# MORTALITY - HOW LONG EVERYONE LIVES, DRAWN FROM A PERIOD LIFE TABLE
+#
+#   python mortality.py --simulation=example
+#
+# The chance of dying within a year at selected ages, rounded from the Social Security
+# Administration's 2020 period life table.  The ages in between are filled in on a log
+# scale, and nobody lives past MAX_AGE.
+
+import argparse
+import datetime
+import importlib
+
+import numpy as np
+
+MAX_AGE = 119
+LIFE_TABLE = {
+    # age: (male, female)
+    0: (0.0060, 0.0050),
+    1: (0.0004, 0.0003),
+    10: (0.0001, 0.0001),
+    20: (0.0013, 0.0005),
+    30: (0.0023, 0.0011),
+    40: (0.0032, 0.0018),
+    50: (0.0058, 0.0036),
+    55: (0.0088, 0.0055),
+    60: (0.0127, 0.0080),
+    65: (0.0178, 0.0114),
+    70: (0.0260, 0.0173),
+    75: (0.0400, 0.0275),
+    80: (0.0640, 0.0450),
+    85: (0.1050, 0.0780),
+    90: (0.1700, 0.1330),
+    95: (0.2650, 0.2220),
+    100: (0.3600, 0.3150),
+    105: (0.4600, 0.4200),
+    110: (0.5700, 0.5400),
+    115: (0.7000, 0.6800),
+    MAX_AGE: (1.0, 1.0),
+}
+SEXES = ["M", "F"]
+
+
+def _fill_in(column):
+    ages = sorted(LIFE_TABLE)
+    log_q = np.log([LIFE_TABLE[age][column] for age in ages])
+    return np.exp(np.interp(np.arange(MAX_AGE + 1), ages, log_q))
+
+
+# chance of dying between each age and the next, for each of SEXES
+DEATH_PROBABILITIES = np.array([_fill_in(column) for column in range(len(SEXES))])
+
+
+def death_probabilities(sex=None):
+    # for each age 0 ... MAX_AGE; without a sex, halfway between the two
+    if sex is None:
+        return DEATH_PROBABILITIES.mean(axis=0)
+    return DEATH_PROBABILITIES[SEXES.index(sex.upper()[0])]
+
+
+def death_age_chances(person, start_year):
+    # chance of dying at each age from now on, given alive now: (ages, chances)
+    q = death_probabilities(person.sex)
+    ages = np.arange(min(person.age(start_year), MAX_AGE), MAX_AGE + 1)
+    surviving = np.concatenate([[1.0], np.cumprod(1.0 - q[ages])[:-1]])
+    return ages, surviving * q[ages]
+
+
+def death_ages(uniforms, people, start_year):
+    """
+    Turn uniform random numbers, shaped (runs, people), into the age each person dies at
+    (they live through the year they reach it), for every run at once.
+    """
+    ages = np.zeros(uniforms.shape, dtype=np.int64)
+    for column, person in enumerate(people):
+        person_ages, chances = death_age_chances(person, start_year)
+        cumulative = np.cumsum(chances)
+        cumulative[-1] = 1.0
+        ages[:, column] = person_ages[np.searchsorted(cumulative, uniforms[:, column], side="right")]
+    return ages
+
+
+def life_expectancy(person, start_year):
+    ages, chances = death_age_chances(person, start_year)
+    # living through the year of death counts as half of it
+    return float((chances * (ages + 0.5)).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="show how long the family in a simulation might live")
+    parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    args = parser.parse_args()
+
+    start_year = datetime.date.today().year
+    sim = importlib.import_module(args.simulation).Simulation(start_year, 1)
+    family = sim.family()
+    for person in family:
+        ages, chances = death_age_chances(person, start_year)
+        alive_at = {age: chances[ages >= age].sum() for age in (80, 90, 100)}
+        print(f"{person.name} ({person.sex or 'either sex'}), age {person.age(start_year)}: "
+              f"expected to live to {life_expectancy(person, start_year):.1f}, " +
+              ", ".join(f"{100 * chance:.0f}% chance of reaching {age}" for age, chance in alive_at.items()))
+    if len(family) > 1:
+        # odds that at least one of them is still around, treating them as independent
+        for age in (90, 95, 100):
+            nobody = 1.0
+            for person in family:
+                ages, chances = death_age_chances(person, start_year)
+                nobody *= chances[ages < age + person.age(start_year) - family[0].age(start_year)].sum()
+            print(f"{100 * (1 - nobody):.0f}% chance one of them is alive when {family[0].name} would be {age}")
+
+
+if __name__ == "__main__":
+    main()
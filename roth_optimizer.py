@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# ROTH CONVERSION OPTIMIZER - PICK HOW MUCH TO CONVERT EACH YEAR, BY DYNAMIC PROGRAMMING
+#
+#   python roth_optimizer.py --simulation=example --save=roth_schedule.json
+#   python main.py --simulation=example --roth-schedule=roth_schedule.json
+#
+# The household's traditional IRA balance is the state, on a grid of balances.  Going
+# backwards from the last year, each grid balance gets the best conversion for that
+# year: the one with the lowest taxes this year plus the best that can be done from the
+# balance it leaves for next year.  Then the best path is followed forward from today's
+# balance, giving one conversion amount per year.
+#
+# The model follows the markets' expected returns, so it is a plan for the average
+# path.  It takes RMDs, voluntary distributions and other taxable income into account
+# the way SimulationBase does, with each person's IRA staying the same share of the total.
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import json
+import os
+
+import numpy as np
+
+import chatgpt
+from simulation import INFLATION, RETURNS
+from vectorized import CompiledSimulation, TAXED_INC, run_batched
+
+OBJECTIVES = ["wealth", "taxes"]
+
+
+def expected_growth(sim, compiled, seed=0, num_runs=1000):
+    # average real growth of the IRAs in each year, from the simulation's own market hooks
+    draws = sim.market_draws(seed, 0, num_runs)
+    growth = 1.0 + (draws[..., RETURNS:] - draws[..., INFLATION, None]) / 100.0
+    if draws.ndim == 4:
+        # compound the steps of each year
+        growth = growth.prod(axis=2)
+    growth = growth.mean(axis=0)
+    if compiled.asset_classes:
+        # the mix the first IRA is set to hold each year
+        return (compiled.targets[:, compiled.ira[0]] * growth).sum(axis=1)
+    return growth[:, 0]
+
+
+class ConversionModel:
+    """
+    One simulation boiled down to what matters for Roth conversions, year by year: IRA
+    contributions, other taxable income, RMD rates, voluntary distribution percentages and
+    expected growth.
+    """
+
+    def __init__(self, sim, seed=0):
+        compiled = CompiledSimulation(sim)
+        self.start_year = sim.start_year
+        self.num_years = sim.num_years
+        self.married = compiled.married
+        initial = compiled.initial[compiled.ira]
+        self.balance = initial.sum()
+        self.shares = initial / self.balance if self.balance > 0 else np.full(len(initial), 1.0 / len(initial))
+        self.contributions = compiled.deltas[:, compiled.ira].sum(axis=1)
+        self.other_income = compiled.flows[:, TAXED_INC]
+        self.distribution_pct = np.array(compiled.distribution_pct, dtype=float)
+        # share of the whole IRA balance that has to come out as RMDs
+        self.rmd_rate = np.array([
+            sum(share / chatgpt.UNIFORM_LIFETIME_TABLE[age]
+                for share, age in zip(self.shares, ages) if age >= 73 and age in chatgpt.UNIFORM_LIFETIME_TABLE)
+            for ages in compiled.ages
+        ])
+        self.can_withdraw = np.array([any(age >= 59.5 for age in ages) for ages in compiled.ages])
+        self.growth = expected_growth(sim, compiled, seed)
+
+    def year(self, year_idx, balances, conversions):
+        """
+        What happens in one year for every combination of starting IRA balance (shaped
+        (balances, 1)) and conversion (shaped (1, conversions)).  Returns (tax, balance at
+        the end of the year); conversions bigger than what is there give nan.
+        """
+        balances = balances + self.contributions[year_idx]
+        rmd = balances * self.rmd_rate[year_idx]
+        after = balances - rmd - conversions
+        voluntary = np.zeros(np.broadcast(after, conversions).shape)
+        if self.can_withdraw[year_idx]:
+            target = after * self.distribution_pct[year_idx] / 100.0
+            voluntary = np.clip(target - rmd - conversions, 0.0, np.maximum(after, 0.0))
+        income = self.other_income[year_idx] + rmd + conversions + voluntary
+        tax = chatgpt.estimate_income_tax_array(income, self.married)
+        tax = np.where(after >= 0, tax, np.nan)
+        return tax, (after - voluntary) * self.growth[year_idx]
+
+    def simple_rule(self, year_idx, balance):
+        # SimulationBase.roth_conversions(): up to $125,000 each, in years with no other taxable income
+        if self.other_income[year_idx] > 0:
+            return 0.0
+        after_rmd = (balance + self.contributions[year_idx]) * (1.0 - self.rmd_rate[year_idx])
+        return float(sum(min(after_rmd * share, 125_000) for share in self.shares))
+
+
+def tax_weights(model, objective):
+    # what a dollar of tax in each year costs, and what a dollar left in the IRA at the end costs
+    if objective == "taxes":
+        return np.ones(model.num_years + 1)
+    # a dollar paid in tax would have grown along with the rest of the money until the end
+    return np.append(np.cumprod(model.growth[::-1])[::-1], 1.0)
+
+
+def optimize_conversions(model, objective="wealth", heir_tax_rate=0.24, step=5_000, max_conversion=500_000,
+                         grid_points=401):
+    """
+    Returns {year: conversion}, minimizing taxes plus heir_tax_rate on the IRA left at the
+    end.  With objective "wealth", each tax dollar counts as what it would have grown to by
+    the end, which is the same as maximizing after-tax wealth at the end; with "taxes",
+    every tax dollar counts the same.
+    """
+    weights = tax_weights(model, objective)
+    # the IRA can't get bigger than it would with nothing ever taken out
+    biggest = model.balance
+    for year_idx in range(model.num_years):
+        biggest = max(biggest, (biggest + model.contributions[year_idx]) * model.growth[year_idx])
+    grid = np.linspace(0.0, biggest, grid_points)
+    conversions = np.arange(0.0, max_conversion + step, step)
+
+    # cost[year_idx] is the least weighted tax from the start of that year, for each grid balance
+    cost = weights[-1] * heir_tax_rate * grid
+    best = []
+    for year_idx in reversed(range(model.num_years)):
+        tax, next_balance = model.year(year_idx, grid[:, None], conversions[None, :])
+        total = weights[year_idx] * tax + np.interp(next_balance, grid, cost)
+        total = np.where(np.isnan(total), np.inf, total)
+        cost = total.min(axis=1)
+        best.append(cost)
+    costs = best[::-1] + [weights[-1] * heir_tax_rate * grid]
+
+    # follow the best path forward from the real starting balance
+    schedule = {}
+    balance = model.balance
+    for year_idx in range(model.num_years):
+        tax, next_balance = model.year(year_idx, np.array([[balance]]), conversions[None, :])
+        total = weights[year_idx] * tax + np.interp(next_balance, grid, costs[year_idx + 1])
+        choice = int(np.nanargmin(total[0]))
+        if conversions[choice] > 0:
+            schedule[model.start_year + year_idx] = float(conversions[choice])
+        balance = float(next_balance[0, choice])
+    return schedule
+
+
+def follow(model, schedule=None):
+    """
+    Follow the expected path with a schedule of conversions, or the simple rule if it is None.
+    Returns (taxes paid each year, conversions each year, IRA balance at the end).
+    """
+    taxes, converted = [], []
+    balance = model.balance
+    for year_idx in range(model.num_years):
+        if schedule is None:
+            conversion = model.simple_rule(year_idx, balance)
+        else:
+            conversion = schedule.get(model.start_year + year_idx, 0.0)
+        tax, next_balance = model.year(year_idx, np.array([[balance]]), np.array([[conversion]]))
+        taxes.append(float(tax[0, 0]))
+        converted.append(conversion)
+        balance = float(next_balance[0, 0])
+    return np.array(taxes), np.array(converted), balance
+
+
+def load_schedule(path):
+    with open(path) as schedule_file:
+        return {int(year): amount for year, amount in json.load(schedule_file).items()}
+
+
+def save_schedule(path, schedule):
+    with open(path, "w") as schedule_file:
+        json.dump({str(year): amount for year, amount in schedule.items()}, schedule_file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="plan Roth conversions by dynamic programming")
+    parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    parser.add_argument("--years", type=int, default=50, help="number of years")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="wealth",
+                        help="maximize after-tax wealth at the end, or minimize lifetime taxes")
+    parser.add_argument("--heir-tax-rate", type=float, default=0.24, help="tax rate on the IRA left at the end")
+    parser.add_argument("--step", type=int, default=5_000, help="conversions are multiples of this")
+    parser.add_argument("--max-conversion", type=int, default=500_000, help="most to convert in one year")
+    parser.add_argument("--grid", type=int, default=401, help="number of IRA balances on the grid")
+    parser.add_argument("--runs", type=int, default=1000, help="monte carlo runs comparing the plans (0 to skip)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--save", default=None, help="write the schedule to this JSON file")
+    args = parser.parse_args()
+
+    start_year = datetime.date.today().year
+    simulation_module = importlib.import_module(args.simulation)
+    sim = simulation_module.Simulation(start_year, args.years)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        model = ConversionModel(sim, args.seed)
+    schedule = optimize_conversions(model, args.objective, args.heir_tax_rate, args.step, args.max_conversion,
+                                    args.grid)
+
+    print("year   conversion")
+    for year, amount in schedule.items():
+        print(f"{year}  ${int(amount):>10,}")
+    print(f"\n{'on the expected path:':<21}{'simple rule':>14}{'schedule':>14}")
+    simple, planned = follow(model), follow(model, schedule)
+    for label, values in [("converted", [simple[1].sum(), planned[1].sum()]),
+                          ("lifetime taxes", [simple[0].sum(), planned[0].sum()]),
+                          ("IRA left at the end", [simple[2], planned[2]])]:
+        print(f"{label:<21}" + "".join(f"{'$' + format(int(value), ','):>14}" for value in values))
+
+    if args.runs:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            draws = sim.market_draws(args.seed, 0, args.runs)
+            results = [run_batched(CompiledSimulation(sim), draws)]
+            planned_sim = simulation_module.Simulation(start_year, args.years)
+            planned_sim.roth_conversion_schedule = schedule
+            results.append(run_batched(CompiledSimulation(planned_sim), draws))
+        print(f"\n{'over ' + format(args.runs, ',') + ' runs:':<21}{'simple rule':>14}{'schedule':>14}")
+        print(f"{'success at the end':<21}" + "".join(f"{100.0 * (totals[:, -1] > 0).mean():>13.1f}%"
+                                                     for totals in results))
+        print(f"{'median at the end':<21}" + "".join(f"{'$' + format(int(np.median(totals[:, -1])), ','):>14}"
+                                                    for totals in results))
+
+    if args.save:
+        save_schedule(args.save, schedule)
+        print(f"\nwrote {args.save}")
+
+
+if __name__ == "__main__":
+    main()
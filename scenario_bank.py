@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# SCENARIO BANK - GENERATE MARKET SCENARIOS ONCE, SAVE THEM, AND SHARE THEM BETWEEN JOBS
+#
+#   python scenario_bank.py create banks/default --scenarios=100000 --years=60 --seed=1
+#   python scenario_bank.py info banks/default
+#   python main.py --bank=banks/default
+#
+# A bank is a numpy array shaped (scenarios, years, series), saved as banks/default.npy,
+# with banks/default.json saying how it was made.  Jobs open it memory-mapped and read
+# rows by scenario index, so it is generated once and any number of jobs share it.
+
+import argparse
+import datetime
+import json
+
+import numpy as np
+
+from simulation import INFLATION, RETURNS
+
+# Inflation comes first, then one column per asset class, so a bank lines up with the
+# draw matrix columns in simulation.py: a one-asset simulation gets its returns from stocks.
+SERIES = ["inflation", "stocks", "bonds"]
+assert SERIES.index("inflation") == INFLATION and SERIES.index("stocks") == RETURNS
+
+# Markets switch between regimes, and tend to stay in the one they are in.
+# TRANSITIONS[a][b] is the chance of going from regime a one year to regime b the next.
+REGIMES = [
+    {
+        "name": "calm",
+        "mean": [2.5, 9.0, 4.5],
+        "std_dev": [1.5, 13.0, 5.0],
+        "correlation": [
+            [1.0, -0.2, -0.3],
+            [-0.2, 1.0, 0.1],
+            [-0.3, 0.1, 1.0],
+        ],
+    },
+    {
+        "name": "stressed",
+        "mean": [5.0, -6.0, 2.0],
+        "std_dev": [3.5, 24.0, 8.0],
+        "correlation": [
+            [1.0, -0.4, -0.5],
+            [-0.4, 1.0, -0.3],
+            [-0.5, -0.3, 1.0],
+        ],
+    },
+]
+TRANSITIONS = [
+    [0.88, 0.12],
+    [0.45, 0.55],
+]
+# nothing loses more than this in a year
+MIN_RETURN = -90.0
+# scenarios generated together, each chunk from its own seed
+CHUNK = 10_000
+
+
+def generate_chunk(rng, num_scenarios, num_years, regimes, transitions):
+    transitions = np.array(transitions)
+    # start in the long-run mix of regimes
+    start = np.linalg.matrix_power(transitions, 200)[0]
+    regime = np.zeros((num_scenarios, num_years), dtype=np.int64)
+    regime[:, 0] = rng.choice(len(regimes), size=num_scenarios, p=start)
+    cumulative = np.cumsum(transitions, axis=1)
+    for year_idx in range(1, num_years):
+        thresholds = cumulative[regime[:, year_idx - 1]]
+        regime[:, year_idx] = (rng.random((num_scenarios, 1)) >= thresholds[:, :-1]).sum(axis=1)
+
+    shocks = rng.standard_normal((num_scenarios, num_years, len(SERIES)))
+    scenarios = np.empty_like(shocks)
+    for number, spec in enumerate(regimes):
+        std_dev = np.array(spec["std_dev"])
+        covariance = np.array(spec["correlation"]) * np.outer(std_dev, std_dev)
+        in_regime = regime == number
+        scenarios[in_regime] = np.array(spec["mean"]) + shocks[in_regime] @ np.linalg.cholesky(covariance).T
+    scenarios[:, :, 1:] = np.maximum(scenarios[:, :, 1:], MIN_RETURN)
+    return scenarios
+
+
+def create_bank(path, num_scenarios, num_years, seed, regimes=REGIMES, transitions=TRANSITIONS):
+    data = np.lib.format.open_memmap(path + ".npy", mode="w+", dtype=np.float64,
+                                     shape=(num_scenarios, num_years, len(SERIES)))
+    for chunk_idx, first in enumerate(range(0, num_scenarios, CHUNK)):
+        count = min(CHUNK, num_scenarios - first)
+        rng = np.random.default_rng([seed, chunk_idx])
+        data[first:first + count] = generate_chunk(rng, count, num_years, regimes, transitions)
+    data.flush()
+    with open(path + ".json", "w") as manifest:
+        json.dump({
+            "shape": [num_scenarios, num_years, len(SERIES)],
+            "series": SERIES,
+            "units": "percent per year",
+            "seed": seed,
+            "regimes": regimes,
+            "transitions": transitions,
+            "min_return": MIN_RETURN,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        }, manifest, indent=2)
+    return ScenarioBank(path)
+
+
+class ScenarioBank:
+    def __init__(self, path):
+        self.path = path
+        with open(path + ".json") as manifest:
+            self.manifest = json.load(manifest)
+        self.data = np.load(path + ".npy", mmap_mode="r")
+        self.series = self.manifest["series"]
+        self.num_scenarios, self.num_years, _ = self.data.shape
+
+    def draws(self, first, num_runs, num_years, asset_classes=None):
+        """
+        Draws for runs first ... first + num_runs - 1, shaped (runs, years, columns), with
+        inflation and then the returns of each of asset_classes (default: just stocks).
+        When those are the first columns of the bank, this is a view of the memory-mapped
+        file, not a copy, so only the rows used get read.
+        """
+        if first + num_runs > self.num_scenarios or num_years > self.num_years:
+            raise ValueError(
+                f"bank {self.path} has {self.num_scenarios} scenarios of {self.num_years} years, "
+                f"asked for runs {first}-{first + num_runs - 1} of {num_years} years")
+        missing = [name for name in asset_classes or [] if name not in self.series]
+        if missing:
+            raise ValueError(f"bank {self.path} has no {', '.join(missing)} returns")
+        columns = [self.series.index("inflation")] + [self.series.index(name) for name in asset_classes or ["stocks"]]
+        rows = self.data[first:first + num_runs, :num_years]
+        if columns == list(range(len(columns))):
+            return rows[:, :, :len(columns)]
+        return rows[:, :, columns]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="create or describe a bank of market scenarios")
+    parser.add_argument("command", choices=["create", "info"])
+    parser.add_argument("path", help="bank path, without the .npy/.json extension")
+    parser.add_argument("--scenarios", type=int, default=100_000, help="number of scenarios")
+    parser.add_argument("--years", type=int, default=60, help="years in each scenario")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        bank = create_bank(args.path, args.scenarios, args.years, args.seed)
+    else:
+        bank = ScenarioBank(args.path)
+
+    sample = np.asarray(bank.data[:min(bank.num_scenarios, CHUNK)]).reshape(-1, len(bank.series))
+    print(f"{bank.path}: {bank.num_scenarios:,} scenarios x {bank.num_years} years, seed {bank.manifest['seed']}")
+    for column, name in enumerate(bank.series):
+        print(f"  {name:<10} mean {sample[:, column].mean():6.2f}%  std dev {sample[:, column].std():6.2f}%")
+    print("  correlation:")
+    for name, row in zip(bank.series, np.corrcoef(sample.T)):
+        print(f"  {name:<10}" + "".join(f"{value:7.2f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# SENSITIVITY - WHICH INPUTS MOVE THE SUCCESS RATE THE MOST (A TORNADO CHART)
+#
+#   python sensitivity.py --simulation=example --runs=5000
+#
+# Each input is moved down and up a notch, and every version of the plan runs in one
+# batched pass against the same market draws (and lifespans), so the only difference
+# between them is the input.  That is what makes small effects show up: comparing two
+# separate runs of main.py buries them in the noise of different markets.  The effect
+# is the success rate with the input up minus with it down, and its standard error
+# comes from the run-by-run differences, which are small because the markets match.
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import os
+
+import numpy as np
+
+from common import Accounts
+from simulation import INFLATION, RETURNS
+
+
+def scale_expenses(sim, hook_name, factor):
+    # make the sim's hook (one that takes year and accounts) do factor times what it does now
+    hook = getattr(sim, hook_name)
+
+    def scaled(year, accounts):
+        scratch = Accounts([])
+        hook(year, scratch)
+        for (acct_type, owner), account in scratch.accounts.items():
+            accounts.get(acct_type, owner).add(account.balance * factor)
+    setattr(sim, hook_name, scaled)
+
+
+class Input:
+    """
+    Something about the plan to move down and up.  apply(sim, direction) changes sim in
+    place, for direction -1 or +1; shift(sim, direction) is percentage points to add to
+    each step's market draws (one per draw column), or None.
+    """
+
+    def __init__(self, name, change):
+        self.name = name
+        self.change = change
+
+    def apply(self, sim, direction):
+        pass
+
+    def shift(self, sim, direction):
+        return None
+
+
+class PersonInput(Input):
+    # the same attribute of everyone in the family, moved by step and kept within [low, high]
+    def __init__(self, name, change, attribute, step, low=None, high=None):
+        super().__init__(name, change)
+        self.attribute = attribute
+        self.step = step
+        self.low = low
+        self.high = high
+
+    def apply(self, sim, direction):
+        for person in sim.everyone():
+            value = getattr(person, self.attribute) + direction * self.step
+            if self.low is not None:
+                value = max(self.low, value)
+            if self.high is not None:
+                value = min(self.high, value)
+            setattr(person, self.attribute, value)
+
+
+class ScaledPersonInput(PersonInput):
+    # the same attribute of everyone in the family, times 1 +/- pct percent
+    def __init__(self, name, change, attribute, pct):
+        super().__init__(name, change, attribute, 0)
+        self.pct = pct
+
+    def apply(self, sim, direction):
+        for person in sim.everyone():
+            setattr(person, self.attribute, getattr(person, self.attribute) * (1 + direction * self.pct / 100.0))
+
+
+class ScaledExpenses(Input):
+    # everything an expense hook does to the accounts, times 1 +/- pct percent
+    def __init__(self, name, change, hook, pct):
+        super().__init__(name, change)
+        self.hook = hook
+        self.pct = pct
+
+    def apply(self, sim, direction):
+        scale_expenses(sim, self.hook, 1 + direction * self.pct / 100.0)
+
+
+class ScaledValue(Input):
+    # what a hook that returns a number for the year returns, times 1 +/- pct percent
+    def __init__(self, name, change, hook, pct):
+        super().__init__(name, change)
+        self.hook = hook
+        self.pct = pct
+
+    def apply(self, sim, direction):
+        hook = getattr(sim, self.hook)
+        factor = 1 + direction * self.pct / 100.0
+        setattr(sim, self.hook, lambda year: hook(year) * factor)
+
+
+class MarketShift(Input):
+    # Every year's returns (all asset classes) or inflation, moved by points.  With more than
+    # one step per year, each step moves by its share, which comes to about the same in a year.
+    def __init__(self, name, change, columns, points):
+        super().__init__(name, change)
+        self.columns = columns
+        self.points = points
+
+    def shift(self, sim, direction):
+        num_assets = len(sim.asset_classes) if sim.asset_classes else 1
+        shift = np.zeros(RETURNS + num_assets)
+        shift[self.columns] = direction * self.points / sim.steps_per_year
+        return shift
+
+
+INPUTS = [
+    ScaledPersonInput("salary", "+/-10%", "salary", 10),
+    PersonInput("retirement age", "+/-1 year", "retirement_age", 1),
+    ScaledExpenses("budget", "+/-10%", "budget_expenses", 10),
+    MarketShift("return mean", "+/-1 point", slice(RETURNS, None), 1.0),
+    MarketShift("inflation mean", "+/-0.5 point", INFLATION, 0.5),
+    ScaledValue("minimum savings", "+/-25%", "minimum_savings_balance", 25),
+    # social security benefits are only known from 62 to 70
+    PersonInput("social security age", "+/-1 year", "ss_start_age", 1, 62, 70),
+]
+
+
+def compile_variants(sims):
+    # CompiledSimulations of sims that all use the same accounts, in the order the first one has them
+    from vectorized import CompiledSimulation
+
+    compiled = [CompiledSimulation(sim) for sim in sims]
+    slots = list(compiled[0].slots)
+    for variant in compiled[1:]:
+        slots += [slot for slot in variant.slots if slot not in slots]
+    return [variant if variant.slots == slots else CompiledSimulation(sim, slots=slots)
+            for sim, variant in zip(sims, compiled)]
+
+
+def tornado(make_simulation, num_runs, seed=0, inputs=INPUTS, draws=None):
+    """
+    Run the plan as it is, and with each input moved down and up, in one batched pass
+    against the same draws.  make_simulation() makes a fresh copy of the plan each time.
+    Returns (the success rate as it is, a list of dicts with each input's success rate
+    down and up, and the effect of going from down to up with its standard error - all in
+    percent), biggest effect first.
+    """
+    from vectorized import VariantRuns, run_with_snapshots
+
+    sim = make_simulation()
+    if draws is None:
+        draws = sim.market_draws(seed, 0, num_runs)
+    death_ages = sim.death_ages(seed, 0, num_runs) if sim.mortality else None
+    sims = [sim]
+    shifts = [np.zeros(draws.shape[-1])]
+    for item in inputs:
+        for direction in (-1, 1):
+            variant = make_simulation()
+            item.apply(variant, direction)
+            sims.append(variant)
+            shift = item.shift(variant, direction)
+            shifts.append(np.zeros(draws.shape[-1]) if shift is None else shift)
+    variants = compile_variants(sims)
+    variant_runs = VariantRuns(variants, len(draws), np.array(shifts))
+    totals, _ = run_with_snapshots(variants[0], draws, (), death_ages=death_ages, variant_runs=variant_runs)
+
+    # one row of successes (1 or 0) per variant, one column per run
+    succeeded = (totals[:, -1] > 0).reshape(len(variants), len(draws)).astype(float)
+    base = succeeded[0]
+    results = []
+    for number, item in enumerate(inputs):
+        down, up = succeeded[1 + 2 * number], succeeded[2 + 2 * number]
+        results.append({
+            "input": item.name,
+            "change": item.change,
+            "down_pct": 100.0 * down.mean(),
+            "up_pct": 100.0 * up.mean(),
+            "effect_pct": 100.0 * (up - down).mean(),
+            "effect_se": 100.0 * standard_error(up - down),
+            "down_se": 100.0 * standard_error(down - base),
+            "up_se": 100.0 * standard_error(up - base),
+        })
+    return 100.0 * base.mean(), sorted(results, key=lambda result: -abs(result["effect_pct"]))
+
+
+def standard_error(differences):
+    if len(differences) < 2:
+        return 0.0
+    return float(np.std(differences, ddof=1) / np.sqrt(len(differences)))
+
+
+def print_tornado(base_pct, results):
+    print(f"success rate as planned: {base_pct:.1f}%")
+    print(f"{'input':<22}{'change':<14}{'down':>8}{'up':>8}{'effect':>10}{'std err':>10}")
+    for result in results:
+        print(f"{result['input']:<22}{result['change']:<14}{result['down_pct']:7.1f}%{result['up_pct']:7.1f}%"
+              f"{result['effect_pct']:>+9.1f}{result['effect_se']:>10.2f}")
+    print("(effect is the success rate with the input up minus with it down, in points)")
+
+
+def plot_tornado(base_pct, results, path=None):
+    import matplotlib.pyplot as plt
+
+    # biggest effect at the top
+    results = list(reversed(results))
+    rows = np.arange(len(results))
+    figure, axes = plt.subplots(figsize=(8, 1 + 0.5 * len(results)))
+    for side, color in (("down", "tab:red"), ("up", "tab:blue")):
+        values = np.array([result[f"{side}_pct"] for result in results])
+        errors = [result[f"{side}_se"] for result in results]
+        axes.barh(rows, values - base_pct, left=base_pct, color=color, xerr=errors, label=f"input {side}")
+    axes.axvline(base_pct, color="black", linewidth=1)
+    axes.set_yticks(rows, [f"{result['input']} ({result['change']})" for result in results])
+    axes.set_xlabel("success rate (%)")
+    axes.legend()
+    figure.tight_layout()
+    if path:
+        figure.savefig(path)
+    else:
+        plt.show(block=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="see which inputs move the success rate the most")
+    parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    parser.add_argument("--runs", type=int, default=2000, help="number of simulations per version of the plan")
+    parser.add_argument("--years", type=int, default=50, help="number of years")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--bank", default=None, help="take market draws from this scenario bank")
+    parser.add_argument("--mortality", default=False, action="store_true", help="give everyone a random lifespan")
+    parser.add_argument("--save", default=None, help="save the chart to this file instead of showing it")
+    parser.add_argument("--no-chart", default=False, action="store_true", help="just print the table")
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.simulation)
+    start_year = datetime.date.today().year
+
+    def make_simulation():
+        sim = module.Simulation(start_year, args.years)
+        if args.mortality:
+            sim.mortality = True
+        return sim
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        draws = None
+        if args.bank:
+            from montecarlo import bank_draws
+            draws = bank_draws(args.bank, make_simulation(), args.seed, 0, args.runs)
+        base_pct, results = tornado(make_simulation, args.runs, args.seed, draws=draws)
+
+    print_tornado(base_pct, results)
+    if not args.no_chart:
+        plot_tornado(base_pct, results, args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# SIMULATION SERVICE - ANSWER WHAT-IF QUESTIONS OVER LOCAL HTTP, WITH EVERYTHING KEPT WARM
+#
+#   python serve.py --port=8765
+#   curl -s localhost:8765/run -d '{"simulation": "example", "runs": 2000, "overrides": {"joe.ss_start_age": 67}}'
+#
+#   python serve.py --check --preload=example
+#
+#   python serve.py --surrogate=glidepath.surrogate.json
+#   curl -s localhost:8765/predict -d '{"simulation": "example_glidepath", "knobs": {"spending": 1.1}}'
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import http.server
+import importlib
+import json
+import os
+import time
+
+import numpy as np
+
+from montecarlo import PERCENTILES, bank_draws, success_rates
+from vectorized import CompiledSimulation, first_difference, run_batched, run_with_snapshots
+
+# overrides for these change the market draws; anything else only changes the schedule
+MARKET_HOOKS = ["return_percentage", "inflation_percentage", "asset_return_percentages", "asset_classes",
+                "steps_per_year", "step_volatility"]
+# the plan that what-ifs resume from is run with these overrides too, since no run of a
+# plan without mortality can pick up from one with it (or the other way around)
+BASE_OVERRIDES = MARKET_HOOKS + ["mortality"]
+# how many entries each cache keeps, dropping the least recently used ones past that
+COMPILED_CACHE = 64
+DRAWS_CACHE = 8
+SNAPSHOTS_CACHE = 4
+# what-ifs for --check: a later social security age resumes from a snapshot, and retiring
+# at 50 gives Jane accounts the plan doesn't have, so it has to start over
+CHECK_WHAT_IFS = [
+    {"joe.ss_start_age": 67},
+    {"jane.retirement_age": 50},
+    {"jane.retirement_age": 50, "mortality": True},
+    {"distribution_percentage": 3.0},
+]
+
+
+class Cache(collections.OrderedDict):
+    # a dict that only keeps the limit most recently used entries
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.limit:
+            self.popitem(last=False)
+
+
+class SimulationService:
+    def __init__(self, start_year, workers=1, snapshot_every=5):
+        self.start_year = start_year
+        self.snapshot_every = snapshot_every
+        self.modules = {}
+        # (module, years, overrides) -> CompiledSimulation
+        self.compiled = Cache(COMPILED_CACHE)
+        # (module, years, seed, market overrides) -> draws for the first N runs
+        self.draws = Cache(DRAWS_CACHE)
+        # (module, years, seed or bank, base overrides) -> (runs, {year: PathState}) of the plan as written
+        self.base_runs = Cache(SNAPSHOTS_CACHE)
+        # (module, years, seed, everyone's birthday and sex) -> death ages for the first N runs
+        self.lifespans = Cache(DRAWS_CACHE)
+        # simulation name -> surrogate.Surrogate, for /predict
+        self.surrogates = {}
+        self.pool = None
+        if workers > 1:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+
+    def simulation(self, name, num_years, overrides):
+        if name not in self.modules:
+            self.modules[name] = importlib.import_module(name)
+        sim = self.modules[name].Simulation(self.start_year, num_years)
+        sim.override(overrides)
+        return sim
+
+    def compiled_simulation(self, name, num_years, overrides):
+        key = (name, num_years, json.dumps(overrides, sort_keys=True))
+        if key not in self.compiled:
+            self.compiled[key] = CompiledSimulation(self.simulation(name, num_years, overrides))
+        return self.compiled[key]
+
+    def market_draws(self, name, num_years, num_runs, seed, overrides, bank=None):
+        market = {path: value for path, value in overrides.items() if path in MARKET_HOOKS}
+        if bank:
+            return bank_draws(bank, self.simulation(name, num_years, market), seed, 0, num_runs)
+        key = (name, num_years, seed, json.dumps(market, sort_keys=True))
+        draws = self.draws.get(key)
+        have = 0 if draws is None else len(draws)
+        if have < num_runs:
+            # Every run has its own seed, so the extra rows continue the ones we have.
+            more = self.simulation(name, num_years, market).market_draws(seed, have, num_runs - have)
+            draws = more if draws is None else np.concatenate([draws, more])
+            self.draws[key] = draws
+        return draws[:num_runs]
+
+    def death_ages(self, name, num_years, num_runs, seed, overrides):
+        # the age everyone dies at in each run, or None for a simulation without mortality
+        sim = self.simulation(name, num_years, overrides)
+        if not sim.mortality:
+            return None
+        key = (name, num_years, seed, tuple((str(person.birthday), person.sex) for person in sim.everyone()))
+        ages = self.lifespans.get(key)
+        have = 0 if ages is None else len(ages)
+        if have < num_runs:
+            more = sim.death_ages(seed, have, num_runs - have)
+            ages = more if ages is None else np.concatenate([ages, more])
+            self.lifespans[key] = ages
+        return ages[:num_runs]
+
+    def base_snapshots(self, name, num_years, num_runs, seed, base, bank=None):
+        # Run the plan with only the base overrides, saving where every run stands every
+        # few years, so what-ifs that only change later years can start from there.
+        key = (name, num_years, bank or seed, json.dumps(base, sort_keys=True))
+        if key not in self.base_runs or self.base_runs[key][0] < num_runs:
+            compiled = self.compiled_simulation(name, num_years, base)
+            draws = self.market_draws(name, num_years, num_runs, seed, base, bank)
+            death_ages = self.death_ages(name, num_years, num_runs, seed, base)
+            years = range(self.start_year, self.start_year + num_years, self.snapshot_every)
+            _, snapshots = run_with_snapshots(compiled, draws, years, death_ages=death_ages)
+            self.base_runs[key] = (num_runs, snapshots)
+        return self.base_runs[key][1]
+
+    def run(self, name, num_years, num_runs, seed, overrides, bank=None):
+        """
+        Returns (year totals, year the runs were resumed from, or None if they started over).
+        With bank, the markets come from that scenario bank instead of the module's hooks.
+        """
+        compiled = self.compiled_simulation(name, num_years, overrides)
+        draws = self.market_draws(name, num_years, num_runs, seed, overrides, bank)
+        death_ages = self.death_ages(name, num_years, num_runs, seed, overrides)
+
+        base = {path: value for path, value in overrides.items() if path in BASE_OVERRIDES}
+        base_compiled = self.compiled_simulation(name, num_years, base)
+        # runs with a withdrawal strategy can't be saved or resumed, and runs of a what-if with
+        # other accounts can't pick up from the plan's, so they always start over
+        strategy = compiled.withdrawal_strategy is not None or base_compiled.withdrawal_strategy is not None
+        same_accounts = (base_compiled.slots == compiled.slots
+                         and base_compiled.asset_classes == compiled.asset_classes)
+        if base != overrides and not strategy and same_accounts:
+            changed_year = self.start_year + first_difference(base_compiled, compiled)
+            # the runs have to die at the same ages as the ones they pick up from
+            base_death_ages = self.death_ages(name, num_years, num_runs, seed, base)
+            if death_ages is not None and not np.array_equal(death_ages, base_death_ages):
+                changed_year = self.start_year - 1
+            snapshots = self.base_snapshots(name, num_years, num_runs, seed, base, bank)
+            resume_years = [year for year in snapshots if year <= changed_year]
+            if resume_years:
+                resume_year = max(resume_years)
+                resume_from = snapshots[resume_year].first_runs(num_runs)
+                return run_batched(compiled, draws, resume_from, death_ages=death_ages), resume_year
+
+        if self.pool is None:
+            return run_batched(compiled, draws, death_ages=death_ages), None
+        chunks = np.array_split(draws, self.workers)
+        death_chunks = [None] * len(chunks) if death_ages is None else np.array_split(death_ages, self.workers)
+        return np.concatenate(list(self.pool.map(run_batched, [compiled] * len(chunks), chunks,
+                                                 [None] * len(chunks), [None] * len(chunks), death_chunks))), None
+
+    def check(self, name, num_years, num_runs, seed, what_ifs=CHECK_WHAT_IFS):
+        """
+        Answer every what-if the way run() does, and again from the start with nothing
+        cached.  Returns a list of (overrides, year it resumed from or None, number of
+        runs whose year totals differ).
+        """
+        mismatches = []
+        for overrides in what_ifs:
+            totals, resumed_from = self.run(name, num_years, num_runs, seed, overrides)
+            sim = self.simulation(name, num_years, overrides)
+            death_ages = sim.death_ages(seed, 0, num_runs) if sim.mortality else None
+            fresh = run_batched(CompiledSimulation(sim), sim.market_draws(seed, 0, num_runs), death_ages=death_ages)
+            mismatches.append((overrides, resumed_from, int((totals != fresh).any(axis=1).sum())))
+        return mismatches
+
+    def answer(self, request):
+        started = time.time()
+        name = request.get("simulation", "example")
+        num_years = int(request.get("years", 50))
+        num_runs = int(request.get("runs", 1000))
+        seed = int(request.get("seed", 0))
+        overrides = request.get("overrides", {})
+        bank = request.get("bank")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            totals, resumed_from = self.run(name, num_years, num_runs, seed, overrides, bank)
+        return {
+            "simulation": name,
+            "runs": num_runs,
+            "seed": seed,
+            "overrides": overrides,
+            "bank": bank,
+            "resumed_from": resumed_from,
+            "years": list(range(self.start_year, self.start_year + num_years + 1)),
+            "success_pct": success_rates(totals).round(2).tolist(),
+            "percentiles": {
+                f"p{p}": values.round().tolist()
+                for p, values in zip(PERCENTILES, np.percentile(totals, PERCENTILES, axis=0))
+            },
+            "seconds": round(time.time() - started, 3),
+        }
+
+
+    def predict(self, request):
+        # the chance of success from a surrogate of the plan, which runs a real simulation outside its box
+        started = time.time()
+        name = request.get("simulation", "example")
+        if name not in self.surrogates:
+            raise ValueError(f"no surrogate for {name} - start the service with --surrogate")
+        knobs = request.get("knobs", {})
+        success_pct, source = self.surrogates[name].predict(**knobs)
+        return {
+            "simulation": name,
+            "knobs": knobs,
+            "success_pct": round(success_pct, 2),
+            "source": source,
+            "seconds": round(time.time() - started, 6),
+        }
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.reply(404, {"error": f"unknown path {self.path}"})
+        self.reply(200, {"ok": True, "simulations": sorted(self.server.service.modules)})
+
+    def do_POST(self):
+        if self.path not in ("/run", "/predict"):
+            return self.reply(404, {"error": f"unknown path {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/predict":
+                answer = self.server.service.predict(request)
+            else:
+                answer = self.server.service.answer(request)
+        except (ValueError, TypeError, AttributeError, ImportError) as e:
+            return self.reply(400, {"error": str(e)})
+        self.reply(200, answer)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve simulation results over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for big requests")
+    parser.add_argument("--preload", action="append", default=[], help="simulation module to warm up at start")
+    parser.add_argument("--snapshot-every", type=int, default=5, help="years between saved states for what-ifs")
+    parser.add_argument("--surrogate", action="append", default=[], help="surrogate file from surrogate.py, for /predict")
+    parser.add_argument("--check", default=False, action="store_true",
+                        help="check that what-ifs come out the same as fresh runs, then stop")
+    args = parser.parse_args()
+
+    service = SimulationService(datetime.date.today().year, args.workers, args.snapshot_every)
+    if args.check:
+        mismatches = []
+        for name in args.preload or ["example"]:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                mismatches += service.check(name, 50, 200, 0)
+        if service.pool is not None:
+            service.pool.shutdown()
+        for overrides, resumed_from, differ in mismatches:
+            started = "started over" if resumed_from is None else f"resumed from {resumed_from}"
+            print(f"{json.dumps(overrides):<54}{started:<20}{'same' if differ == 0 else f'{differ} runs differ'}")
+        if any(differ for _, _, differ in mismatches):
+            raise SystemExit("what-ifs don't match fresh runs")
+        return
+    for path in args.surrogate:
+        import surrogate
+        model = surrogate.load(path)
+        service.surrogates[model.job["simulation"]] = model
+    for name in args.preload:
+        service.answer({"simulation": name})
+    server = http.server.HTTPServer((args.host, args.port), RequestHandler)
+    server.service = service
+    print(f"serving on http://{args.host}:{args.port}/run")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# SHARDS - SPLIT A BIG STUDY INTO BLOCKS OF RUNS, RUN THEM ANYWHERE, AND ADD UP THE RESULTS
+#
+#   python shard.py plan study --simulation=example --runs=1000000 --seed=1
+#   python shard.py work study          (as many times as you like, on any machine that sees study/)
+#   python shard.py status study
+#   python shard.py merge study
+#
+# A shard is a JSON file with everything the report needs about its block of runs, in a
+# form that adds up exactly: counts, integer sums and a fixed-bin histogram.  So merging
+# any set of shards gives the same report as running all of their runs in one place.
+#
+# The work queue is just directories: study/todo has one empty file per block of runs,
+# a worker claims one by renaming it into study/claimed (a rename is atomic, so only one
+# worker can win), and the finished shard goes into study/done.
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import socket
+
+import numpy as np
+
+from montecarlo import BLOCK, PERCENTILES, make_simulation, pick_engine, run_block
+
+# Histogram bins for the quantile sketch: bin 0 is out of money, bin 1 is under $1,000,
+# then 800 bins each about 2.3% wider than the last, up to $100 billion, then everything above.
+BIN_EDGES = np.concatenate([[1], np.geomspace(1_000, 100_000_000_000, 801)])
+NUM_BINS = len(BIN_EDGES) + 1
+# rows Aggregate.add() turns into Python ints at once
+EXACT_ROWS = 4096
+# what has to match for two shards to belong to the same study
+JOB_KEYS = ["simulation", "start_year", "years", "seed", "bank", "overrides"]
+
+
+class Aggregate:
+    """
+    What a report needs to know about a set of runs: how many there were, how many still
+    had money in each year, exact integer sums of the year totals and of their squares,
+    and a histogram of them for percentiles.  Aggregates of different runs can be merged.
+    """
+
+    def __init__(self, num_years):
+        self.num_years = num_years
+        # [first run, number of runs] for each block added
+        self.blocks = []
+        self.runs = 0
+        self.successes = np.zeros(num_years + 1, dtype=np.int64)
+        # Python ints, which never overflow, so the sums come out the same in any order
+        self.sums = [0] * (num_years + 1)
+        self.sums_of_squares = [0] * (num_years + 1)
+        self.histogram = np.zeros((num_years + 1, NUM_BINS), dtype=np.int64)
+
+    def add(self, totals, first_run):
+        # totals is shaped (runs, years + 1), for runs first_run, first_run + 1, ...
+        totals = np.asarray(totals, dtype=np.int64)
+        self.blocks.append([first_run, len(totals)])
+        self.runs += len(totals)
+        self.successes += np.count_nonzero(totals > 0, axis=0)
+        # a few rows at a time, since Python ints take several times the memory of the block
+        for row in range(0, len(totals), EXACT_ROWS):
+            exact = totals[row:row + EXACT_ROWS].astype(object)
+            self.sums = [a + b for a, b in zip(self.sums, exact.sum(axis=0))]
+            self.sums_of_squares = [a + b for a, b in zip(self.sums_of_squares, (exact * exact).sum(axis=0))]
+        cells = np.arange(self.num_years + 1) * NUM_BINS + np.searchsorted(BIN_EDGES, totals, side="right")
+        self.histogram += np.bincount(cells.ravel(), minlength=self.histogram.size).reshape(self.histogram.shape)
+
+    def merge(self, other):
+        if other.num_years != self.num_years:
+            raise ValueError(f"can't merge {other.num_years} years into {self.num_years}")
+        for first, count in other.blocks:
+            for have_first, have_count in self.blocks:
+                if first < have_first + have_count and have_first < first + count:
+                    raise ValueError(f"runs {first}-{first + count - 1} are already in this aggregate")
+        self.blocks += other.blocks
+        self.runs += other.runs
+        self.successes += other.successes
+        self.sums = [a + b for a, b in zip(self.sums, other.sums)]
+        self.sums_of_squares = [a + b for a, b in zip(self.sums_of_squares, other.sums_of_squares)]
+        self.histogram += other.histogram
+
+    def missing_runs(self, num_runs):
+        # [first, count] blocks of 0 ... num_runs - 1 that haven't been added yet
+        missing = []
+        next_run = 0
+        for first, count in sorted(self.blocks) + [[num_runs, 0]]:
+            if first > next_run:
+                missing.append([next_run, first - next_run])
+            next_run = max(next_run, first + count)
+        return missing
+
+    def success_pct(self, year_idx):
+        return 100.0 * self.successes[year_idx] / self.runs
+
+    def mean(self, year_idx):
+        return self.sums[year_idx] / self.runs
+
+    def std_dev(self, year_idx):
+        if self.runs < 2:
+            return 0.0
+        n, total, squares = self.runs, self.sums[year_idx], self.sums_of_squares[year_idx]
+        return ((n * squares - total * total) / (n * (n - 1))) ** 0.5
+
+    def percentile(self, year_idx, pct):
+        # the middle of the bin holding that run, counting up from the poorest
+        rank = max(1, int(np.ceil(pct / 100.0 * self.runs)))
+        bin_idx = int(np.searchsorted(np.cumsum(self.histogram[year_idx]), rank))
+        if bin_idx == 0:
+            return 0.0
+        if bin_idx == NUM_BINS - 1:
+            return float(BIN_EDGES[-1])
+        return float(np.sqrt(BIN_EDGES[bin_idx - 1] * BIN_EDGES[bin_idx]))
+
+    def to_json(self):
+        year_idx, bin_idx = np.nonzero(self.histogram)
+        return {
+            "num_years": self.num_years,
+            "blocks": self.blocks,
+            "runs": self.runs,
+            "successes": self.successes.tolist(),
+            "sums": self.sums,
+            "sums_of_squares": self.sums_of_squares,
+            # only the bins with something in them: [year index, bin, count]
+            "histogram": [[int(y), int(b), int(self.histogram[y, b])] for y, b in zip(year_idx, bin_idx)],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        aggregate = cls(data["num_years"])
+        aggregate.blocks = data["blocks"]
+        aggregate.runs = data["runs"]
+        aggregate.successes = np.array(data["successes"], dtype=np.int64)
+        aggregate.sums = data["sums"]
+        aggregate.sums_of_squares = data["sums_of_squares"]
+        for year_idx, bin_idx, count in data["histogram"]:
+            aggregate.histogram[year_idx, bin_idx] = count
+        return aggregate
+
+
+def job_overrides(job):
+    # the job's overrides as the simulation wants them; JSON turned the roth schedule's years into strings
+    overrides = dict(job["overrides"])
+    if "roth_conversion_schedule" in overrides:
+        overrides["roth_conversion_schedule"] = {int(year): amount
+                                                 for year, amount in overrides["roth_conversion_schedule"].items()}
+    return overrides
+
+
+def run_shard(job, first_run, num_runs):
+    """
+    Run a block of runs of a study, and return their Aggregate.  Uses the batched engine
+    when the simulation allows it, and single_simulation() when it doesn't; both give
+    the same year totals for the same run.
+    """
+    name, start_year, num_years, seed, bank, _ = (job[key] for key in JOB_KEYS)
+    overrides = job_overrides(job)
+    simulation_cls = importlib.import_module(name).Simulation
+    engine = pick_engine(make_simulation(simulation_cls, start_year, num_years, overrides))
+    aggregate = Aggregate(num_years)
+    for first in range(first_run, first_run + num_runs, BLOCK):
+        count = min(BLOCK, first_run + num_runs - first)
+        aggregate.add(run_block(simulation_cls, start_year, num_years, seed, first, count, overrides, bank=bank,
+                                engine=engine), first)
+    return aggregate
+
+
+def write_shard(path, job, aggregate):
+    # write to a temporary name and rename, so nobody ever reads half a shard
+    temporary = f"{path}.{socket.gethostname()}-{os.getpid()}"
+    with open(temporary, "w") as shard:
+        json.dump({"job": job, "aggregate": aggregate.to_json()}, shard)
+    os.rename(temporary, path)
+
+
+def read_job(job_file):
+    job = json.load(job_file)
+    # studies from before overrides were saved didn't have any
+    job.setdefault("overrides", {})
+    return job
+
+
+def read_shard(path):
+    with open(path) as shard:
+        data = json.load(shard)
+    data["job"].setdefault("overrides", {})
+    return data["job"], Aggregate.from_json(data["aggregate"])
+
+
+def plan(directory, job, shard_size):
+    for subdirectory in ["todo", "claimed", "done"]:
+        os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+    with open(os.path.join(directory, "job.json"), "w") as job_file:
+        json.dump(job, job_file, indent=2)
+    for first in range(0, job["runs"], shard_size):
+        count = min(shard_size, job["runs"] - first)
+        open(os.path.join(directory, "todo", f"{first:012d}-{count}"), "w").close()
+
+
+def work(directory, max_shards=None):
+    """
+    Claim and run blocks from the queue until there are none left (or max_shards are done).
+    Returns the number of shards this worker finished.
+    """
+    with open(os.path.join(directory, "job.json")) as job_file:
+        job = read_job(job_file)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    finished = 0
+    while max_shards is None or finished < max_shards:
+        for task in sorted(os.listdir(os.path.join(directory, "todo"))):
+            claimed = os.path.join(directory, "claimed", f"{task}@{worker}")
+            try:
+                os.rename(os.path.join(directory, "todo", task), claimed)
+                break
+            except FileNotFoundError:
+                # somebody else got it first
+                continue
+        else:
+            break
+        first, count = (int(field) for field in task.split("-"))
+        print(f"{worker}: runs {first}-{first + count - 1}")
+        write_shard(os.path.join(directory, "done", f"{task}.json"), job, run_shard(job, first, count))
+        os.remove(claimed)
+        finished += 1
+    return finished
+
+
+def requeue(directory):
+    # put claimed blocks back in the queue - for when their workers died
+    for claimed in os.listdir(os.path.join(directory, "claimed")):
+        task = claimed.split("@", 1)[0]
+        os.rename(os.path.join(directory, "claimed", claimed), os.path.join(directory, "todo", task))
+        print(f"requeued {task}")
+
+
+def merge(paths):
+    """
+    Merge shard files, and directories of them (a study, or its done/ directory).
+    Returns (job, Aggregate).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(os.path.join(path, "done")):
+            path = os.path.join(path, "done")
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".json")]
+        else:
+            files.append(path)
+    if not files:
+        raise ValueError("no shards to merge")
+    job, aggregate = read_shard(files[0])
+    for path in files[1:]:
+        other_job, other = read_shard(path)
+        if [other_job[key] for key in JOB_KEYS] != [job[key] for key in JOB_KEYS]:
+            raise ValueError(f"{path} is from a different study")
+        job["runs"] = max(job["runs"], other_job["runs"])
+        aggregate.merge(other)
+    return job, aggregate
+
+
+def print_report(job, aggregate, step=5):
+    sim = importlib.import_module(job["simulation"]).Simulation(job["start_year"], job["years"])
+    print(f"{job['simulation']}: {aggregate.runs:,} runs, seed {job['seed']}")
+    if job["overrides"]:
+        print(f"  with {', '.join(sorted(job['overrides']))}")
+    missing = aggregate.missing_runs(job["runs"])
+    if missing:
+        print(f"  still missing runs: {', '.join(f'{first}-{first + count - 1}' for first, count in missing)}")
+    print(f"{'year':<6}{'ages':<10}{'success':>9}{'mean':>10}{'std dev':>10}" +
+          "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+    for year_idx in range(0, job["years"] + 1, step):
+        year = job["start_year"] + year_idx
+        ages = ", ".join(str(person.age(year)) for person in sim.family())
+        line = f"{year:<6}{ages:<10}{aggregate.success_pct(year_idx):8.1f}%"
+        for value in [aggregate.mean(year_idx), aggregate.std_dev(year_idx)]:
+            line += f"{int(value) // 1000:>9,}k"
+        for p in PERCENTILES:
+            line += f"{int(aggregate.percentile(year_idx, p)) // 1000:>9,}k"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run a big study as mergeable shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_job_options(command):
+        command.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+        command.add_argument("--runs", type=int, default=100_000, help="number of simulations")
+        command.add_argument("--years", type=int, default=50, help="number of years")
+        command.add_argument("--seed", type=int, default=0, help="master seed")
+        command.add_argument("--bank", default=None, help="take market draws from this scenario bank")
+        command.add_argument("--monthly", default=False, action="store_true",
+                             help="move money and markets a month at a time")
+        command.add_argument("--roth-schedule", default=None,
+                             help="convert to Roth by this schedule, from roth_optimizer.py")
+        command.add_argument("--mortality", default=False, action="store_true", help="give everyone a random lifespan")
+
+    command = subparsers.add_parser("plan", help="set up a study directory with a queue of blocks")
+    command.add_argument("directory")
+    add_job_options(command)
+    command.add_argument("--shard-size", type=int, default=10_000, help="runs per shard")
+
+    command = subparsers.add_parser("run", help="run one block of runs into a shard file")
+    add_job_options(command)
+    command.add_argument("--first", type=int, default=0, help="first run number")
+    command.add_argument("--out", required=True, help="shard file to write")
+
+    command = subparsers.add_parser("work", help="run blocks from a study's queue until it is empty")
+    command.add_argument("directory")
+    command.add_argument("--max-shards", type=int, default=None, help="stop after this many")
+
+    command = subparsers.add_parser("status", help="show how far a study has got")
+    command.add_argument("directory")
+
+    command = subparsers.add_parser("requeue", help="put blocks claimed by dead workers back in the queue")
+    command.add_argument("directory")
+
+    command = subparsers.add_parser("merge", help="add up shards and print the report")
+    command.add_argument("shards", nargs="+", help="shard files, or study directories")
+    args = parser.parse_args()
+
+    if args.command in ("plan", "run"):
+        # the same overrides as main.py's flags, kept as JSON in the job
+        overrides = {}
+        if args.monthly:
+            overrides["steps_per_year"] = 12
+        if args.roth_schedule:
+            with open(args.roth_schedule) as schedule_file:
+                overrides["roth_conversion_schedule"] = json.load(schedule_file)
+        if args.mortality:
+            overrides["mortality"] = True
+        job = {"simulation": args.simulation, "start_year": datetime.date.today().year, "years": args.years,
+               "seed": args.seed, "bank": args.bank, "overrides": overrides, "runs": args.runs}
+    if args.command == "run":
+        # as far as this shard knows, the study ends with it
+        job["runs"] = args.first + args.runs
+    if args.command == "plan":
+        plan(args.directory, job, args.shard_size)
+        print(f"{args.directory}: {len(os.listdir(os.path.join(args.directory, 'todo')))} blocks to run")
+    elif args.command == "run":
+        write_shard(args.out, job, run_shard(job, args.first, args.runs))
+    elif args.command == "work":
+        print(f"finished {work(args.directory, args.max_shards)} shards")
+    elif args.command == "status":
+        for subdirectory in ["todo", "claimed", "done"]:
+            print(f"{subdirectory:<8} {len(os.listdir(os.path.join(args.directory, subdirectory)))}")
+    elif args.command == "requeue":
+        requeue(args.directory)
+    else:
+        print_report(*merge(args.shards))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,105 @@ from abc import ABC, abstractmethod
 import random
 import time
 
+import numpy as np
+
 import chatgpt
 from common import *
+import mortality
+import socialsecurity
 
 DEBUG_PREFIX = "    . "
 
+# columns of a market draw matrix, which is shaped (runs, years, columns)
+INFLATION = 0
+RETURNS = 1
+
+# the hooks that move money around based on the year alone, in the order they are called
+SCHEDULED_HOOKS = ["job_income", "socsec_income", "budget_expenses", "housing_expenses",
+                   "healthcare_expenses", "other_one_time_adjustments"]
+
+
+def glidepath(year, start_year, start_weight, end_year, end_weight):
+    # a weight that slides in a straight line from start_weight to end_weight, for asset_allocation()
+    if year <= start_year:
+        return start_weight
+    if year >= end_year:
+        return end_weight
+    return start_weight + (end_weight - start_weight) * (year - start_year) / (end_year - start_year)
+
+
+def split_into_steps(annual, noise, volatility):
+    """
+    Spread yearly market percentages, shaped (..., years, columns), over the steps of each
+    year.  noise is standard normal, shaped (..., years, steps, asset classes); it is made to
+    add up to zero within each year and scaled by volatility (percent per step), so the
+    steps swing around but still compound to the year's real growth.
+    Returns percentages per step, shaped (..., years, steps, columns).
+    """
+    steps = noise.shape[-2]
+    # a year that loses everything can't be split into steps, so it loses almost everything
+    real_growth = np.maximum(1.0 + (annual[..., RETURNS:] - annual[..., INFLATION, None]) / 100.0, 1e-6)
+    shock = (noise - noise.mean(axis=-2, keepdims=True)) * np.asarray(volatility) / 100.0
+    step_growth = np.exp(np.log(real_growth)[..., None, :] / steps + shock)
+    step_inflation = 100.0 * ((1.0 + annual[..., INFLATION] / 100.0) ** (1.0 / steps) - 1.0)
+    draws = np.empty(annual.shape[:-1] + (steps, annual.shape[-1]))
+    draws[..., INFLATION] = step_inflation[..., None]
+    draws[..., RETURNS:] = step_inflation[..., None, None] + 100.0 * (step_growth - 1.0)
+    return draws
+
+
+def run_seed(master_seed, run_num):
+    # Each run gets its own seed, derived from the master seed and the run number,
+    # so any run can be reproduced without re-running the ones before it.
+    return int(np.random.SeedSequence([master_seed, run_num]).generate_state(1)[0])
+
+
 class SimulationBase(ABC):
+    # Leave this alone to grow everything by return_percentage().  To hold a mix of
+    # investments instead, list them here (with names from the scenario bank, like
+    # ["stocks", "bonds"]) and override asset_allocation() and asset_return_percentages().
+    asset_classes = None
+    # Set this to 12 to move money and apply the markets a month at a time.  The hooks still
+    # give yearly amounts, which get spread evenly over the months; taxes and distributions
+    # are still worked out once a year.  step_volatility is how much the markets swing from
+    # one step to the next (percent per step, one number or one per asset class).
+    steps_per_year = 1
+    step_volatility = 4.0
+    # {year: amount} of traditional IRA money to convert to Roth each year, like the ones
+    # roth_optimizer.py makes.  Leave it as None for the simple rule in roth_conversions().
+    roth_conversion_schedule = None
+    # A withdrawals.WithdrawalStrategy that decides how much to take out of the IRAs and
+    # Roths each year once everyone is retired, instead of distribution_percentage().  What
+    # it takes out is what gets spent that year, instead of budget_expenses().
+    withdrawal_strategy = None
+    # Set this to True to give everyone a random lifespan from the life table in mortality.py.
+    # When someone dies, their IRAs and Roths roll over to their spouse, who pays taxes as a
+    # single person and keeps the higher of the two Social Security benefits.  Once everyone
+    # is gone, the run is over and whatever money is left stays where it is.
+    mortality = False
+    # How many percent a year Social Security falls behind inflation, if you don't trust the
+    # COLAs to keep up.  0 keeps benefits level in today's dollars.
+    ss_cola_gap = 0.0
+
     def __init__(self, start_year, num_years):
         self.start_year = start_year
         self.num_years = num_years
         self.accounts = None
         self.year = None
+        # optional pre-drawn market percentages for this run, shaped (years, columns)
+        self.draws = None
+        # optional journal.Journal, recording every move of money
+        self.journal = None
+        # which step of the year we are on, and the generator for splitting years into steps
+        self.step = 0
+        self.step_rng = np.random.default_rng()
+        # with mortality: the age each member of the family dies at (in family() order, optional
+        # like draws), the ones who already have, and the generator for rolling lifespans
+        self.lifetimes = None
+        self.deceased = set()
+        self.life_rng = np.random.default_rng()
+        # Social Security benefits for the whole plan, for each household it has had - see social_security()
+        self.ss_streams = {}
         random.seed(time.time())
         self.debug = False
 
@@ -24,6 +112,155 @@ class SimulationBase(ABC):
             on_year = f" on {self.year}"
         return f"Simulation{on_year} for {self.num_years} years with balances: {self.accounts}"
 
+    def seed(self, value):
+        # __init__ seeds from the clock; call this afterwards to make a run repeatable
+        random.seed(value)
+        np.random.seed(value)
+        self.step_rng = np.random.default_rng(value)
+        self.life_rng = np.random.default_rng([value, 1])
+
+    def override(self, overrides):
+        """
+        Change a few inputs without writing a new simulation module.
+
+        overrides maps attribute paths to values, like {"joe.ss_start_age": 67}.  If the
+        attribute is a hook function and the value is not, the hook is replaced by one that
+        always returns the value, like {"distribution_percentage": 3.0}.
+        """
+        for path, value in overrides.items():
+            target = self
+            *parents, name = path.split(".")
+            for parent in parents:
+                target = getattr(target, parent)
+            if callable(getattr(target, name, None)) and not callable(value):
+                value = (lambda constant: lambda *args, **kwargs: constant)(value)
+            setattr(target, name, value)
+
+    def market_draws(self, seed, first_run, num_runs):
+        """
+        Roll the dice for a block of runs up front, using the return_percentage() and
+        inflation_percentage() hooks.  Each run is seeded with run_seed(seed, run_num),
+        so a block gives the same rows no matter how the runs are split up.
+        The draws are shaped (runs, years, columns), or (runs, years, steps, columns) with
+        more than one step per year.
+        """
+        num_assets = len(self.asset_classes) if self.asset_classes else 1
+        draws = np.zeros((num_runs, self.num_years, RETURNS + num_assets))
+        noise = np.zeros((num_runs, self.num_years, self.steps_per_year, num_assets))
+        for row, run_num in enumerate(range(first_run, first_run + num_runs)):
+            self.seed(run_seed(seed, run_num))
+            draws[row] = self.yearly_draws()
+            if self.steps_per_year > 1:
+                noise[row] = self.step_noise()
+        if self.steps_per_year > 1:
+            return split_into_steps(draws, noise, self.step_volatility)
+        return draws
+
+    def death_ages(self, seed, first_run, num_runs):
+        """
+        Roll everyone's lifespan for a block of runs, seeded the same way as market_draws().
+        Returns the age each member of the family dies at, shaped (runs, people).
+        """
+        everyone = self.everyone()
+        uniforms = np.zeros((num_runs, len(everyone)))
+        for row, run_num in enumerate(range(first_run, first_run + num_runs)):
+            self.seed(run_seed(seed, run_num))
+            uniforms[row] = self.life_rng.random(len(everyone))
+        return mortality.death_ages(uniforms, everyone, self.start_year)
+
+    def yearly_draws(self):
+        # this run's market percentages, shaped (years, columns), from the hooks
+        num_assets = len(self.asset_classes) if self.asset_classes else 1
+        draws = np.zeros((self.num_years, RETURNS + num_assets))
+        for year_idx in range(self.num_years):
+            self.year = self.start_year + year_idx
+            if self.asset_classes:
+                draws[year_idx, RETURNS:] = self.asset_return_percentages()
+            else:
+                draws[year_idx, RETURNS] = self.return_percentage()
+            draws[year_idx, INFLATION] = self.inflation_percentage()
+        self.year = None
+        return draws
+
+    def step_noise(self):
+        # all of this run's month-to-month swings at once, from step_rng
+        num_assets = len(self.asset_classes) if self.asset_classes else 1
+        return self.step_rng.standard_normal((self.num_years, self.steps_per_year, num_assets))
+
+    def spread_over_steps(self, draws):
+        # one run's yearly draws (say, from a scenario bank), split into steps_per_year steps
+        if self.steps_per_year == 1:
+            return draws
+        return split_into_steps(draws, self.step_noise(), self.step_volatility)
+
+    def current_draw(self):
+        # this step's row of self.draws
+        if self.steps_per_year == 1:
+            return self.draws[self.year - self.start_year]
+        return self.draws[self.year - self.start_year, self.step]
+
+    def schedule(self, by_hook=False, starting=()):
+        """
+        Record what income and expenses do to the accounts in each year, starting from
+        empty accounts, so it can be replayed for every run.  This is only valid when the
+        income and expense hooks depend on the year alone, not on account balances -
+        which is true for the example simulation.
+        Returns a list with one {(acct_type, owner): amount} dict per year, in the
+        order the accounts were first touched.  With by_hook, each year is a dict of
+        {hook name: {(acct_type, owner): amount}} instead, with what each hook did, and
+        every year can start with copies of the starting accounts instead of empty ones
+        (to check that the hooks don't look at balances).
+        """
+        saved_year, saved_accounts = self.year, self.accounts
+        years = []
+        for year_idx in range(self.num_years):
+            self.year = self.start_year + year_idx
+            self.accounts = Accounts(starting)
+            hooks = {}
+            before = {key: acct.balance for key, acct in self.accounts.accounts.items()}
+            for name in SCHEDULED_HOOKS:
+                if name == "budget_expenses" and self.strategy_spending():
+                    pass
+                elif name in ("job_income", "socsec_income"):
+                    getattr(self, name)()
+                else:
+                    getattr(self, name)(self.year, self.accounts)
+                after = {key: acct.balance for key, acct in self.accounts.accounts.items()}
+                hooks[name] = {key: after[key] - before.get(key, 0) for key in after if after[key] != before.get(key, 0)}
+                before = after
+            years.append(hooks if by_hook else before)
+        self.year, self.accounts = saved_year, saved_accounts
+        return years
+
+    def everyone(self):
+        # the whole family, whether or not they are still alive
+        return type(self).family(self)
+
+    def living_family(self):
+        # stands in for family() when mortality is on
+        return [person for person in self.everyone() if person not in self.deceased]
+
+    def household_deaths(self):
+        """
+        At the start of each year, anyone older than their age in self.lifetimes has died,
+        and their IRAs and Roths roll over to their spouse.  Returns False once nobody is left.
+        """
+        for person, death_age in zip(self.everyone(), self.lifetimes):
+            if person in self.deceased or person.age(self.year) <= death_age:
+                continue
+            print(f" - {person} died at {death_age}")
+            self.deceased.add(person)
+            heir = person.spouse
+            if heir is None or heir in self.deceased or heir not in self.everyone():
+                continue
+            for acct_type in (Account.DEFERRED_IRA, Account.EXEMPT_ROTH):
+                amount = self.accounts.get(acct_type, person).balance
+                if amount:
+                    print(f" - {person}'s {acct_type} of ${int(amount)} rolls over to {heir}")
+                    self.accounts.get(acct_type, person).subtract(amount)
+                    self.accounts.get(acct_type, heir).add(amount)
+        return bool(self.living_family())
+
     def job_income(self):
         for person in self.family():
             self.individual_job_income(person)
@@ -52,43 +289,42 @@ class SimulationBase(ABC):
             self.accounts.get(Account.TAXED_INC).add(gross_salary)
 
 
-    def socsec_income(self):
-
-        # common formula, used a few times below
-        def benefit(person):
-            soc_sec = 0
-            if person.claiming_ss(self.year):
-                soc_sec = person.ss_amount() * 12
-            return soc_sec
-
-        # find the higher benefit among spouses who can collect
-        higher_benefit = 0
-        for person in self.family():
-            soc_sec = benefit(person)
-            if soc_sec > higher_benefit:
-                higher_benefit = soc_sec
+    def social_security(self):
+        """
+        (yearly benefits shaped (years, people), why each person collects them) for the
+        people in family() over the whole plan, from socialsecurity.benefits().  It is only
+        worked out again when someone dies or an input it depends on changes.
+        """
+        living = self.family()
+        key = (tuple(person.name for person in living), frozenset(person.name for person in self.deceased),
+               tuple((person.birthday, person.ss_start_age, tuple(person.ss_benefits)) for person in self.everyone()),
+               self.start_year, self.num_years, self.ss_cola_gap)
+        if key not in self.ss_streams:
+            self.ss_streams[key] = socialsecurity.benefits(living, self.deceased, self.start_year, self.num_years,
+                                                           self.ss_cola_gap)
+        return self.ss_streams[key]
 
-        # collect benefits, if available
-        for person in self.family():
-            if person.claiming_ss(self.year):
-                their_benefit = benefit(person)
-                collected_benefit = their_benefit
-                # special case - spousal benefit
-                # lower earning spouse must wait until full retirement age (67-ish)
-                if person.waited_for_full_ss(self.year):
-                    collected_benefit = max(their_benefit, 0.5 * higher_benefit)
-                if collected_benefit > their_benefit:
-                    print(f" - {person} earns 1/2 spouse's social security = ${collected_benefit}")
-                else:
-                    print(f" - {person} earns social security = ${collected_benefit}")
-                self.accounts.get(Account.UNTAXED_INC).add(collected_benefit)
+    def socsec_income(self):
+        # this year's row of the household's benefits
+        amounts, reasons = self.social_security()
+        year_idx = self.year - self.start_year
+        living = self.family()
+        for idx, reason in reasons[year_idx].items():
+            person, amount = living[idx], float(amounts[year_idx, idx])
+            if reason == socialsecurity.SURVIVOR:
+                print(f" - {person} earns late spouse's social security = ${int(amount)}")
+            elif reason == socialsecurity.SPOUSAL:
+                print(f" - {person} earns 1/2 spouse's social security = ${int(amount)}")
+            else:
+                print(f" - {person} earns social security = ${int(amount)}")
+            self.accounts.get(Account.UNTAXED_INC).add(amount)
 
 
     def required_minimum_distributions(self):
         for person in self.family():
             person_age = person.age(self.year)
             if person_age >= 73:
-                ira_balance = self.accounts.get(Account.DEFERRED_IRA).balance
+                ira_balance = self.accounts.get(Account.DEFERRED_IRA, person).balance
                 try:
                     rmd = chatgpt.calculate_rmd(ira_balance, person_age)
                 except ValueError:
@@ -100,6 +336,10 @@ class SimulationBase(ABC):
                     self.accounts.get(Account.DEFERRED_IRA, person).subtract(rmd)
 
     def roth_conversions(self):
+        if self.roth_conversion_schedule is not None:
+            self.scheduled_roth_conversions()
+            return
+
         # Only do a Roth conversion if we have no other taxable income.
         if self.accounts.get(Account.TAXED_INC).balance > 0:
             return
@@ -118,6 +358,28 @@ class SimulationBase(ABC):
             self.accounts.get(Account.IRA_WITHDRAWALS).add(conversion)
             self.accounts.get(Account.SAVINGS).subtract(conversion)
 
+    def scheduled_roth_conversions(self):
+        # Convert this year's amount from the schedule, taking from each person's traditional
+        # IRAs in proportion to their balances.
+        amount = self.roth_conversion_schedule.get(self.year, 0)
+        if amount <= 0:
+            return
+        all_balances = 0.0
+        for person in self.family():
+            all_balances += self.accounts.get(Account.DEFERRED_IRA, person).balance
+        if all_balances <= 0:
+            return
+        for person in self.family():
+            person_balance = self.accounts.get(Account.DEFERRED_IRA, person).balance
+            conversion = min(amount * (person_balance / all_balances), person_balance)
+            if conversion <= 0:
+                continue
+            print(f" - scheduled Roth conversion ${int(conversion)} from {person}'s traditional IRAs")
+            self.accounts.get(Account.DEFERRED_IRA, person).subtract(conversion)
+            self.accounts.get(Account.EXEMPT_ROTH, person).add(conversion)
+            self.accounts.get(Account.IRA_WITHDRAWALS).add(conversion)
+            self.accounts.get(Account.SAVINGS).subtract(conversion)
+
     def move_from_retirement_accounts(self, ret_acct_type, amount, target_acct, why):
         # Figure out how much we have in the specified type of retirement accounts for people over 60.
         # TODO - refactor this into a "take proportionally" function ??
@@ -146,6 +408,11 @@ class SimulationBase(ABC):
         target_int = self.distribution_percentage(self.year)
         target_pct = target_int / 100.0
         why = f"{target_int}% voluntary distribution"
+        if self.strategy_spending():
+            target_pct, amount = self.strategy_withdrawal()
+            why = f"{self.withdrawal_strategy} withdrawal"
+            # what the strategy takes out is this year's budget
+            self.accounts.get(Account.EXPENSES).subtract(amount)
 
         # Figure out how much we need to distribute from Traditional IRAs
         already_distributed_ira = self.accounts.get(Account.IRA_WITHDRAWALS).balance
@@ -167,6 +434,25 @@ class SimulationBase(ABC):
             # Distribute from Roth IRAs directly into savings, since we do not have to pay taxes on it.
             self.move_from_retirement_accounts(Account.EXEMPT_ROTH, remaining, Account.SAVINGS, why)
 
+    def withdrawing(self):
+        # withdrawal strategies take over once everyone is retired
+        return all(person.retired(self.year) for person in self.family())
+
+    def strategy_spending(self):
+        # is a withdrawal strategy deciding this year's withdrawals and budget?
+        return self.withdrawal_strategy is not None and self.withdrawing()
+
+    def strategy_withdrawal(self):
+        # this year's withdrawal from the strategy, as (a share of the IRAs and Roths, amount)
+        portfolio = self.accounts.sum(Account.DEFERRED_IRA) + self.accounts.sum(Account.EXEMPT_ROTH)
+        youngest = min(person.age(self.year) for person in self.family())
+        previous = None if self.withdrawals is None else np.array([self.withdrawals[-1]])
+        initial = None if self.withdrawals is None else np.array([self.withdrawals[0]])
+        fraction, amount = self.withdrawal_strategy.withdraw(np.array([portfolio]), youngest, previous, initial)
+        print(f" - {self.withdrawal_strategy} withdrawal = ${int(amount[0])}")
+        self.withdrawals = (self.withdrawals or []) + [float(amount[0])]
+        return float(fraction[0]), float(amount[0])
+
     def calculate_taxes(self):
         taxable_income = self.accounts.get(Account.TAXED_INC).balance + self.accounts.get(Account.IRA_WITHDRAWALS).balance
         married_yn = len(self.family()) > 1
@@ -177,8 +463,13 @@ class SimulationBase(ABC):
         self.accounts.get(Account.TAX_OWED).subtract(tax)
 
     def sweep_category_accounts_into_savings(self):
-        for acct in [Account.EXPENSES, Account.TAXED_INC, Account.UNTAXED_INC, Account.IRA_WITHDRAWALS, Account.TAX_OWED]:
-            move_amt = self.accounts.get(acct).balance
+        if self.step == 0:
+            # this year's amounts, swept in equal parts at each step
+            self.step_amounts = {
+                acct: self.accounts.get(acct).balance / self.steps_per_year
+                for acct in [Account.EXPENSES, Account.TAXED_INC, Account.UNTAXED_INC, Account.IRA_WITHDRAWALS, Account.TAX_OWED]
+            }
+        for acct, move_amt in self.step_amounts.items():
             if int(abs(move_amt)) > 0:
                 print(f" - sweeping ${int(move_amt)} from {acct} into savings")
                 self.accounts.get(Account.SAVINGS).add(move_amt)
@@ -214,54 +505,171 @@ class SimulationBase(ABC):
 
 
     def apply_investment_returns_and_inflation(self):
-        ret_pct = self.return_percentage()
-        inf_pct = self.inflation_percentage()
+        if self.asset_classes:
+            self.apply_portfolio_returns_and_inflation()
+            return
+        if self.draws is not None:
+            draw = self.current_draw()
+            ret_pct, inf_pct = float(draw[RETURNS]), float(draw[INFLATION])
+        else:
+            ret_pct = self.return_percentage()
+            inf_pct = self.inflation_percentage()
         print(f" - investment returns = {ret_pct:.1f}%, inflation = {inf_pct:.1f}%")
 
         for account in self.accounts.persistent_accounts():
             before = account.balance
             account.balance *= (1.0 + (ret_pct - inf_pct) / 100.0)
             after = account.balance
+            if self.journal is not None:
+                self.journal.record(account, after - before)
             pct = 0
             if before > 0:
                 pct = ((after / before) - 1) * 100.0
             if self.debug:
                 print(f"{DEBUG_PREFIX}account {account.label()} : {int(before)} adjusted {pct:.2f}% = {int(after)}")
 
-    def single_simulation(self):
-        self.year = self.start_year
-        self.accounts = Accounts(self.initial_balances())
+    def apply_portfolio_returns_and_inflation(self):
+        if self.draws is not None:
+            draw = self.current_draw()
+            asset_pcts = [float(pct) for pct in draw[RETURNS:RETURNS + len(self.asset_classes)]]
+            inf_pct = float(draw[INFLATION])
+        else:
+            asset_pcts = self.asset_return_percentages()
+            inf_pct = self.inflation_percentage()
+        returns_str = ", ".join(f"{name} {pct:.1f}%" for name, pct in zip(self.asset_classes, asset_pcts))
+        print(f" - investment returns: {returns_str}, inflation = {inf_pct:.1f}%")
+
+        # Each account holds its own mix, which drifts with the markets until it gets rebalanced.
+        rebalance = self.step == 0 and self.rebalance(self.year)
+        for account in self.accounts.persistent_accounts():
+            if rebalance or account.weights is None:
+                account.weights = self.asset_allocation(self.year, account)
+            before = account.balance
+            growth = [weight * (1.0 + (pct - inf_pct) / 100.0) for weight, pct in zip(account.weights, asset_pcts)]
+            factor = sum(growth)
+            account.balance *= factor
+            if factor:
+                account.weights = [amount / factor for amount in growth]
+            after = account.balance
+            if self.journal is not None:
+                self.journal.record(account, after - before)
+            if self.debug:
+                mix = ", ".join(f"{name} {weight:.0%}" for name, weight in zip(self.asset_classes, account.weights))
+                print(f"{DEBUG_PREFIX}account {account.label()} : {int(before)} adjusted {(factor - 1) * 100:.2f}% = {int(after)} ({mix})")
+
+    def simulate_year(self):
+        # clear transient values
+        for account in self.accounts.perennial_accounts():
+            account.balance = 0
+        # earn income
+        self.job_income()
+        self.socsec_income()
+        # spend money (a withdrawal strategy sets the budget, in voluntary_distributions())
+        if not self.strategy_spending():
+            self.budget_expenses(self.year, self.accounts)
+        self.housing_expenses(self.year, self.accounts)
+        self.healthcare_expenses(self.year, self.accounts)
+        # other adjustments
+        self.other_one_time_adjustments(self.year, self.accounts)
+        # pull money out of retirement accounts
+        self.required_minimum_distributions()
+        self.roth_conversions()
+        self.voluntary_distributions()
+        self.calculate_taxes()
+        # At this point, we have adjusted all of the accounts to show how money was moved around.
+        # But we really need to sweep it all back into actual savings accounts, a step at a time.
+        for self.step in range(self.steps_per_year):
+            self.sweep_category_accounts_into_savings()
+            self.ensure_minimum_savings_balance()
+            # last step = capital gains and inflation
+            self.apply_investment_returns_and_inflation()
+        self.step = 0
+
+    def snapshot(self, year_totals):
+        # Everything needed to pick this run up again at the start of self.year, possibly
+        # in another Simulation object (with a few overrides), so owners are kept by name.
+        return {
+            "year": self.year,
+            "balances": {
+                (account.type, account.owner.name if account.owner else None): account.balance
+                for account in self.accounts.all()
+            },
+            "weights": {
+                (account.type, account.owner.name if account.owner else None): account.weights
+                for account in self.accounts.all()
+            },
+            "random_state": random.getstate(),
+            "numpy_state": np.random.get_state(),
+            "year_totals": list(year_totals),
+            "draws": self.draws,
+            "withdrawals": self.withdrawals,
+            "lifetimes": self.lifetimes,
+            "deceased": [person.name for person in self.deceased],
+        }
+
+    def resume(self, snapshot):
+        people = {person.name: person for person in self.everyone()}
+        self.year = snapshot["year"]
+        self.accounts = Accounts([
+            Account(acct_type, people[owner] if owner else None, balance)
+            for (acct_type, owner), balance in snapshot["balances"].items()
+        ])
+        for account in self.accounts.all():
+            account.weights = snapshot["weights"][(account.type, account.owner.name if account.owner else None)]
+        random.setstate(snapshot["random_state"])
+        np.random.set_state(snapshot["numpy_state"])
+        if self.draws is None:
+            self.draws = snapshot["draws"]
+        self.withdrawals = snapshot["withdrawals"]
+        if self.lifetimes is None:
+            self.lifetimes = snapshot["lifetimes"]
+        self.deceased = {people[name] for name in snapshot["deceased"]}
+        return list(snapshot["year_totals"])
+
+    def single_simulation(self, snapshot_years=(), resume_from=None):
+        """
+        Run the simulation one year at a time, and return the total value at the start
+        of each year.  The state at the start of each of snapshot_years is saved in
+        self.snapshots, and a run can pick up from one of those with resume_from, so a
+        change that only matters late in life doesn't have to redo the early years.
+        """
+        self.snapshots = {}
+        # what the withdrawal strategy took each year, once it started
+        self.withdrawals = None
+        self.deceased = set()
+        if self.mortality:
+            self.family = self.living_family
+            if self.lifetimes is None and not resume_from:
+                everyone = self.everyone()
+                self.lifetimes = mortality.death_ages(self.life_rng.random((1, len(everyone))), everyone,
+                                                      self.start_year)[0]
+        if self.steps_per_year > 1 and self.draws is None and not resume_from:
+            # the markets for every step of every year, rolled all at once
+            self.draws = self.spread_over_steps(self.yearly_draws())
+        if resume_from:
+            year_totals = self.resume(resume_from)
+        else:
+            self.year = self.start_year
+            self.accounts = Accounts(self.initial_balances())
+            year_totals = [self.total_value()]
         # poke our debug flag (as a prefix string) into each account
         if self.debug:
             for account in self.accounts.all():
                 account.debug = DEBUG_PREFIX
+        if self.journal is not None:
+            self.accounts.set_journal(self.journal)
         self.print_year()
-        year_totals = [self.total_value()]
         try:
-            for iteration in range(self.num_years):
-                # clear transient values
-                for account in self.accounts.perennial_accounts():
-                    account.balance = 0
-                # earn income
-                self.job_income()
-                self.socsec_income()
-                # spend money
-                self.budget_expenses(self.year, self.accounts)
-                self.housing_expenses(self.year, self.accounts)
-                self.healthcare_expenses(self.year, self.accounts)
-                # other adjustments
-                self.other_one_time_adjustments(self.year, self.accounts)
-                # pull money out of retirement accounts
-                self.required_minimum_distributions()
-                self.roth_conversions()
-                self.voluntary_distributions()
-                self.calculate_taxes()
-                # At this point, we have adjusted all of the accounts to show how money was moved around.
-                # But we really need to sweep it all back into actual savings accounts.
-                self.sweep_category_accounts_into_savings()
-                self.ensure_minimum_savings_balance()
-                # last step = capital gains and inflation
-                self.apply_investment_returns_and_inflation()
+            while self.year < self.start_year + self.num_years:
+                if self.mortality and not self.household_deaths():
+                    # nobody is left to run out of money
+                    print("everyone has died")
+                    while len(year_totals) <= self.num_years:
+                        year_totals.append(year_totals[-1])
+                    break
+                if self.year in snapshot_years:
+                    self.snapshots[self.year] = self.snapshot(year_totals)
+                self.simulate_year()
                 # adjust year number, print summary, store total for chart
                 self.year += 1
                 self.print_year()
@@ -320,3 +728,20 @@ class SimulationBase(ABC):
     def minimum_savings_balance(self, year):
         raise NotImplementedError
 
+
+    # ONLY NEEDED IF YOU SET asset_classes
+
+    def asset_return_percentages(self):
+        # one return percentage for each of asset_classes, for this year
+        raise NotImplementedError
+
+
+    def asset_allocation(self, year, account):
+        # target weights for each of asset_classes in this account, adding up to 1.0
+        raise NotImplementedError
+
+
+    def rebalance(self, year):
+        # move every account back to its asset_allocation() this year?
+        return True
+
@@ -0,0 +1,49 @@
+# SOCIAL SECURITY - EVERY YEAR'S BENEFITS FOR A HOUSEHOLD, WORKED OUT ONCE FOR THE WHOLE PLAN
+#
+# Nothing about Social Security depends on the markets, so instead of going through the
+# rules for every person in every year of every run, benefits() works out the whole
+# stream for a household (whoever is still alive) as one array, and the yearly step just
+# looks up its row.  The rules are the ones SimulationBase has always used:
+#
+#   own benefit   ss_benefits[claiming age - 62] a month, from the claiming age on
+#   spousal       once someone has claimed and reached full retirement age, they get at
+#                 least half of the highest benefit anyone in the household is collecting
+#   survivor      a widow or widower who has claimed gets at least their late spouse's benefit
+#
+# Amounts are in today's dollars, like everything else, so a COLA that keeps up with
+# inflation leaves them flat.  cola_gap is how many percent a year they fall behind.
+
+import numpy as np
+
+from chatgpt import get_full_retirement_age
+
+OWN = "own"
+SPOUSAL = "spousal"
+SURVIVOR = "survivor"
+
+
+def benefits(living, deceased, start_year, num_years, cola_gap=0.0):
+    """
+    The yearly benefit each of living (a list of Persons) collects in each year, shaped
+    (years, people), and why, as a list of years of {person index: OWN, SPOUSAL or SURVIVOR}
+    for the people collecting anything.  deceased is everyone who has already died.
+    """
+    years = np.arange(start_year, start_year + num_years)
+    ages = np.array([years - person.birth_year() for person in living]).T.reshape(num_years, len(living))
+    claiming = ages >= np.array([person.ss_start_age for person in living])
+    own = np.where(claiming, np.array([person.ss_amount() * 12 for person in living]), 0)
+    waited = claiming & (ages >= np.array([get_full_retirement_age(person.birth_year()) for person in living]))
+    higher = own.max(axis=1, initial=0)
+
+    collected = np.where(waited, np.maximum(own, 0.5 * higher[:, None]), own)
+    kinds = np.where(collected > own, SPOUSAL, OWN).astype(object)
+    for idx, person in enumerate(living):
+        if person.spouse in deceased:
+            survivor = np.maximum(collected[:, idx], person.spouse.ss_amount() * 12)
+            kinds[:, idx] = np.where(claiming[:, idx] & (survivor > own[:, idx]), SURVIVOR, kinds[:, idx])
+            collected[:, idx] = np.where(claiming[:, idx], survivor, collected[:, idx])
+    if cola_gap:
+        collected = collected * ((1.0 - cola_gap / 100.0) ** np.arange(num_years))[:, None]
+    reasons = [{idx: kinds[year_idx, idx] for idx in range(len(living)) if claiming[year_idx, idx]}
+               for year_idx in range(num_years)]
+    return collected, reasons
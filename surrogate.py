@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# SURROGATE - A CHEAP STAND-IN FOR THE SIMULATOR, FOR ANSWERS AS FAST AS SLIDERS MOVE
+#
+#   python surrogate.py build --simulation=example_glidepath --save=glidepath.surrogate.json
+#   python surrogate.py predict glidepath.surrogate.json spending=1.1 retirement_age=2
+#
+# Building it spreads a few hundred versions of the plan over a box of knobs (spending,
+# retirement and social security ages, distributions, and the stock share for plans
+# with asset classes) with a Latin hypercube, and runs them all in batched passes on
+# the same markets.  Then it fits the log-odds of success at each point with a
+# polynomial and with radial basis functions, keeps whichever did better on points it
+# held back, and reports how far off that was.  A prediction is a few numpy operations;
+# a question from outside the box gets a real simulation instead.
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from sensitivity import compile_variants, scale_expenses
+
+# versions of the plan in each batched pass, so the batch stays a reasonable size
+VARIANTS_PER_PASS = 25
+# share of the design points held back to check the fit
+HOLDOUT = 0.2
+
+
+class Knob:
+    """
+    Something a planner would move, relative to the plan as written, so that as_planned
+    is always the plan itself.  apply(sim, value) changes sim in place, and limits(sim) is
+    how far it can go for that plan, or None if it doesn't apply.  whole knobs (ages) only
+    take whole numbers.
+    """
+    whole = False
+
+    def __init__(self, name, low, high, as_planned, description):
+        self.name = name
+        self.low = low
+        self.high = high
+        self.as_planned = as_planned
+        self.description = description
+
+    def limits(self, sim):
+        return self.low, self.high
+
+    def apply(self, sim, value):
+        pass
+
+
+class Spending(Knob):
+    def apply(self, sim, value):
+        scale_expenses(sim, "budget_expenses", value)
+
+
+class AgeOffset(Knob):
+    # years added to an age of everyone in the family, as far as it can go for all of them
+    whole = True
+
+    def __init__(self, name, low, high, as_planned, description, attribute, youngest=None, oldest=None):
+        super().__init__(name, low, high, as_planned, description)
+        self.attribute = attribute
+        self.youngest = youngest
+        self.oldest = oldest
+
+    def limits(self, sim):
+        ages = [getattr(person, self.attribute) for person in sim.everyone()]
+        low = self.low if self.youngest is None else max(self.low, self.youngest - min(ages))
+        high = self.high if self.oldest is None else min(self.high, self.oldest - max(ages))
+        return (low, high) if low < high else None
+
+    def apply(self, sim, value):
+        for person in sim.everyone():
+            age = getattr(person, self.attribute) + int(round(value))
+            if self.youngest is not None:
+                age = max(self.youngest, age)
+            if self.oldest is not None:
+                age = min(self.oldest, age)
+            setattr(person, self.attribute, age)
+
+
+class Distributions(Knob):
+    def apply(self, sim, value):
+        hook = sim.distribution_percentage
+        sim.distribution_percentage = lambda year: hook(year) * value
+
+
+class StockShare(Knob):
+    # moves the first asset class's share of every account, taking it from (or giving it to) the others
+    def limits(self, sim):
+        if not sim.asset_classes or len(sim.asset_classes) < 2:
+            return None
+        return self.low, self.high
+
+    def apply(self, sim, value):
+        hook = sim.asset_allocation
+
+        def allocation(year, account):
+            weights = np.array(hook(year, account), dtype=float)
+            first = min(1.0, max(0.0, weights[0] + value))
+            rest = weights[1:].sum()
+            weights[1:] = weights[1:] * (1.0 - first) / rest if rest > 0 else (1.0 - first) / (len(weights) - 1)
+            weights[0] = first
+            return list(weights)
+        sim.asset_allocation = allocation
+
+
+KNOBS = [
+    Spending("spending", 0.7, 1.3, 1.0, "times budget_expenses()"),
+    AgeOffset("retirement_age", -3, 3, 0, "years added to everyone's retirement age", "retirement_age"),
+    # social security benefits are only known from 62 to 70
+    AgeOffset("ss_age", -3, 3, 0, "years added to everyone's social security age", "ss_start_age", 62, 70),
+    Distributions("distributions", 0.0, 3.0, 1.0, "times distribution_percentage()"),
+    StockShare("stock_share", -0.3, 0.3, 0.0, "added to the first asset class's share"),
+]
+
+
+def latin_hypercube(num_points, num_dims, rng, tries=50):
+    # Points in [0, 1)^num_dims with exactly one in each of num_points slices of every
+    # dimension - the try whose closest two points are furthest apart.
+    best, best_distance = None, -1.0
+    for _ in range(tries):
+        slices = np.array([rng.permutation(num_points) for _ in range(num_dims)]).T
+        points = (slices + rng.random((num_points, num_dims))) / num_points
+        gaps = points[:, None, :] - points[None, :, :]
+        distances = (gaps ** 2).sum(axis=2)
+        np.fill_diagonal(distances, np.inf)
+        if distances.min() > best_distance:
+            best, best_distance = points, distances.min()
+    return best
+
+
+def logit(p):
+    return np.log(p / (1.0 - p))
+
+
+def expit(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def weighted_fit(features, y, weights, ridge=1e-6):
+    # least squares with a weight per point and a little ridge, so near-duplicate features don't blow up
+    root = np.sqrt(weights)[:, None]
+    a = np.vstack([features * root, np.sqrt(ridge) * np.eye(features.shape[1])])
+    b = np.concatenate([y * root[:, 0], np.zeros(features.shape[1])])
+    return np.linalg.lstsq(a, b, rcond=None)[0]
+
+
+class PolynomialModel:
+    # every product of the knobs up to degree, on knobs scaled to [-1, 1]
+
+    def __init__(self, num_dims, degree=3):
+        self.name = f"polynomial (degree {degree})"
+        self.degree = degree
+        terms = [np.zeros(num_dims, dtype=int)]
+        for order in range(1, degree + 1):
+            for dims in itertools.combinations_with_replacement(range(num_dims), order):
+                term = np.zeros(num_dims, dtype=int)
+                for dim in dims:
+                    term[dim] += 1
+                terms.append(term)
+        self.exponents = np.array(terms)
+        self.coefficients = None
+
+    def features(self, x):
+        return np.prod(x[:, None, :] ** self.exponents, axis=2)
+
+    def fit(self, x, y, weights):
+        self.coefficients = weighted_fit(self.features(x), y, weights)
+        return self
+
+    def predict_one(self, x):
+        return float(np.prod(x ** self.exponents, axis=1) @ self.coefficients)
+
+    def to_json(self):
+        return {"model": "polynomial", "degree": self.degree, "coefficients": self.coefficients.tolist()}
+
+    @classmethod
+    def from_json(cls, data, num_dims):
+        model = cls(num_dims, data["degree"])
+        model.coefficients = np.array(data["coefficients"])
+        return model
+
+
+class RbfModel:
+    # Gaussian bumps on the training points plus a plane, fitted by least squares (not
+    # interpolated, since every point has simulation noise in it).  How wide the bumps are
+    # and how hard the fit is held back are picked by cross-validation on the training points.
+    name = "radial basis functions"
+    # bump widths, in typical distances to the nearest other point, and ridges to try
+    WIDTHS = [2.0, 4.0, 8.0]
+    RIDGES = [1e-3, 1e-1, 1.0]
+    FOLDS = 5
+
+    def __init__(self, centers=None, width=None):
+        self.centers = centers
+        self.width = width
+        self.coefficients = None
+
+    def features(self, x):
+        distances = ((x[:, None, :] - self.centers[None, :, :]) ** 2).sum(axis=2)
+        return np.hstack([np.exp(-distances / self.width ** 2), np.ones((len(x), 1)), x])
+
+    def fit(self, x, y, weights):
+        gaps = ((x[:, None, :] - x[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(gaps, np.inf)
+        spacing = float(np.sqrt(gaps.min(axis=1)).mean())
+        folds = np.arange(len(x)) % self.FOLDS
+        best = None
+        for width, ridge in itertools.product(self.WIDTHS, self.RIDGES):
+            error = 0.0
+            for fold in range(self.FOLDS):
+                train = folds != fold
+                self.centers, self.width = x[train], width * spacing
+                self.coefficients = weighted_fit(self.features(x[train]), y[train], weights[train], ridge)
+                error += (weights[~train] * (self.features(x[~train]) @ self.coefficients - y[~train]) ** 2).sum()
+            if best is None or error < best[0]:
+                best = (error, width, ridge)
+        self.centers, self.width = x, best[1] * spacing
+        self.coefficients = weighted_fit(self.features(x), y, weights, best[2])
+        return self
+
+    def predict_one(self, x):
+        bumps = np.exp(-((self.centers - x) ** 2).sum(axis=1) / self.width ** 2)
+        num_centers = len(self.centers)
+        c = self.coefficients
+        return float(bumps @ c[:num_centers] + c[num_centers] + x @ c[num_centers + 1:])
+
+    def to_json(self):
+        return {"model": "rbf", "centers": self.centers.tolist(), "width": self.width,
+                "coefficients": self.coefficients.tolist()}
+
+    @classmethod
+    def from_json(cls, data, num_dims):
+        model = cls(np.array(data["centers"]), data["width"])
+        model.coefficients = np.array(data["coefficients"])
+        return model
+
+
+def new_models(num_dims):
+    # the models to try, freshly made
+    return [PolynomialModel(num_dims, 2), PolynomialModel(num_dims, 3), RbfModel()]
+
+
+class Surrogate:
+    """
+    A fitted model of the chance of success (money left at the end) over a box of knobs,
+    for one plan.  predict(spending=1.1, ...) answers from the model inside the box, and
+    from a real batched simulation (the same runs and seed the model was built from)
+    outside it.  Knobs left out stay as planned.
+    """
+
+    def __init__(self, job, knobs, low, high, model, holdout=None):
+        # job: simulation, start_year, years, runs, seed, mortality
+        self.job = job
+        self.knobs = knobs
+        self.low = np.array(low, dtype=float)
+        self.high = np.array(high, dtype=float)
+        self.model = model
+        self.holdout = holdout or {}
+        self.whole = np.array([knob.whole for knob in knobs])
+
+    def point(self, params):
+        names = [knob.name for knob in self.knobs]
+        unknown = [name for name in params if name not in names]
+        if unknown:
+            raise ValueError(f"unknown knobs {unknown}, pick from {names}")
+        point = np.array([float(params.get(knob.name, knob.as_planned)) for knob in self.knobs])
+        return np.where(self.whole, np.round(point), point)
+
+    def inside(self, point):
+        return bool(np.all(point >= self.low) and np.all(point <= self.high))
+
+    def scale(self, points):
+        # the knobs, from the box to [-1, 1]
+        return 2.0 * (points - self.low) / (self.high - self.low) - 1.0
+
+    def predict(self, **params):
+        """
+        Returns (chance of success in percent, "surrogate" or "simulation").
+        """
+        point = self.point(params)
+        if not self.inside(point):
+            return self.simulate(point), "simulation"
+        return 100.0 / (1.0 + np.exp(-self.model.predict_one(self.scale(point)))), "surrogate"
+
+    def simulate(self, point):
+        from vectorized import CompiledSimulation, run_batched
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            sim = plan(self.job, self.knobs, point)
+            draws = sim.market_draws(self.job["seed"], 0, self.job["runs"])
+            death_ages = sim.death_ages(self.job["seed"], 0, self.job["runs"]) if sim.mortality else None
+            totals = run_batched(CompiledSimulation(sim), draws, death_ages=death_ages)
+        return 100.0 * np.count_nonzero(totals[:, -1] > 0) / len(totals)
+
+    def to_json(self):
+        return {
+            "job": self.job,
+            "knobs": [[knob.name, low, high] for knob, low, high in zip(self.knobs, self.low, self.high)],
+            "model": self.model.to_json(),
+            "holdout": self.holdout,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        knobs = {knob.name: knob for knob in KNOBS}
+        names, low, high = zip(*data["knobs"])
+        model_class = PolynomialModel if data["model"]["model"] == "polynomial" else RbfModel
+        model = model_class.from_json(data["model"], len(names))
+        return cls(data["job"], [knobs[name] for name in names], low, high, model, data["holdout"])
+
+
+def plan(job, knobs, point):
+    # a fresh copy of the plan, with the knobs set to point
+    sim = importlib.import_module(job["simulation"]).Simulation(job["start_year"], job["years"])
+    if job["mortality"]:
+        sim.mortality = True
+    for knob, value in zip(knobs, point):
+        if value != knob.as_planned:
+            knob.apply(sim, value)
+    return sim
+
+
+def run_design(job, knobs, points):
+    # the number of runs that had money left at the end, for each point, all on the same markets
+    from vectorized import VariantRuns, run_with_snapshots
+
+    sim = plan(job, [], [])
+    draws = sim.market_draws(job["seed"], 0, job["runs"])
+    death_ages = sim.death_ages(job["seed"], 0, job["runs"]) if sim.mortality else None
+    successes = []
+    for first in range(0, len(points), VARIANTS_PER_PASS):
+        variants = compile_variants([plan(job, knobs, point) for point in points[first:first + VARIANTS_PER_PASS]])
+        totals, _ = run_with_snapshots(variants[0], draws, (), death_ages=death_ages,
+                                       variant_runs=VariantRuns(variants, len(draws)))
+        successes += list(np.count_nonzero((totals[:, -1] > 0).reshape(len(variants), len(draws)), axis=1))
+    return np.array(successes)
+
+
+def build(simulation, start_year, num_years, num_points=300, num_runs=1000, seed=0, mortality=False, verbose=True):
+    """
+    Run the design and fit the models.  Returns a Surrogate with the model that did best
+    on the held-out points, refitted on all of them.
+    """
+    job = {"simulation": simulation, "start_year": start_year, "years": num_years, "runs": num_runs,
+           "seed": seed, "mortality": mortality}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        sim = plan(job, [], [])
+    limits = [(knob, knob.limits(sim)) for knob in KNOBS]
+    knobs = [knob for knob, limit in limits if limit is not None]
+    low, high = zip(*[limit for _, limit in limits if limit is not None])
+    # a fixed share is held back, at least one point, and the rest have to pin down
+    # every term of the polynomial
+    num_held_out = max(1, round(HOLDOUT * num_points))
+    num_terms = len(PolynomialModel(len(knobs)).exponents)
+    if num_points - num_held_out < num_terms:
+        fewest = next(n for n in itertools.count(num_terms + 1) if n - max(1, round(HOLDOUT * n)) >= num_terms)
+        raise ValueError(f"{num_points} points are too few for a degree-3 polynomial in {len(knobs)} knobs "
+                         f"with {num_held_out} held back - use --points={fewest} or more")
+    surrogate = Surrogate(job, knobs, low, high, None)
+    rng = np.random.default_rng(seed)
+    points = surrogate.low + latin_hypercube(num_points, len(knobs), rng) * (surrogate.high - surrogate.low)
+    points = np.where(surrogate.whole, np.round(points), points)
+    scaled = surrogate.scale(points)
+
+    started = time.time()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        successes = run_design(job, knobs, points)
+    if verbose:
+        print(f"ran {num_points} points x {num_runs:,} runs in {time.time() - started:.1f}s")
+
+    # log-odds of success, nudged off 0 and 1, and weighted by how sure each point is of it
+    p = (successes + 0.5) / (num_runs + 1.0)
+    y = logit(p)
+    weights = num_runs * p * (1.0 - p)
+    # the design is spread evenly, so any points will do
+    held_out = np.zeros(num_points, dtype=bool)
+    held_out[rng.choice(num_points, num_held_out, replace=False)] = True
+    # the simulation's own noise, for comparison
+    noise = 100.0 * float(np.sqrt(p * (1.0 - p) / num_runs)[held_out].mean())
+    surrogate.holdout = {"points": int(held_out.sum()), "noise_pct": noise, "models": {}}
+    for model in new_models(len(knobs)):
+        model.fit(scaled[~held_out], y[~held_out], weights[~held_out])
+        predicted = 100.0 * expit(np.array([model.predict_one(x) for x in scaled[held_out]]))
+        errors = predicted - 100.0 * successes[held_out] / num_runs
+        surrogate.holdout["models"][model.name] = {"rms_error_pct": float(np.sqrt((errors ** 2).mean())),
+                                                   "max_error_pct": float(np.abs(errors).max())}
+    if verbose:
+        print(f"held-out error on {held_out.sum()} points, in points of success rate "
+              f"(the simulation's own noise is about {noise:.2f}):")
+        for name, errors in surrogate.holdout["models"].items():
+            print(f"  {name:<24}{errors['rms_error_pct']:6.2f} rms {errors['max_error_pct']:6.2f} worst")
+    models = surrogate.holdout["models"]
+    best = min(range(len(models)), key=lambda idx: list(models.values())[idx]["rms_error_pct"])
+    surrogate.model = new_models(len(knobs))[best].fit(scaled, y, weights)
+    surrogate.holdout["best"] = surrogate.model.name
+    return surrogate
+
+
+def load(path):
+    with open(path) as surrogate_file:
+        return Surrogate.from_json(json.load(surrogate_file))
+
+
+def save(path, surrogate):
+    with open(path, "w") as surrogate_file:
+        json.dump(surrogate.to_json(), surrogate_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build and query a fast stand-in for the simulator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    command = subparsers.add_parser("build", help="run a design over the knobs and fit a model")
+    command.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    command.add_argument("--years", type=int, default=50, help="number of years")
+    command.add_argument("--points", type=int, default=300, help="versions of the plan to run")
+    command.add_argument("--runs", type=int, default=1000, help="runs at each point")
+    command.add_argument("--seed", type=int, default=0, help="random seed")
+    command.add_argument("--mortality", default=False, action="store_true", help="give everyone a random lifespan")
+    command.add_argument("--save", required=True, help="file to save the surrogate to")
+
+    command = subparsers.add_parser("predict", help="ask a saved surrogate, like spending=1.1 ss_age=-2")
+    command.add_argument("surrogate", help="file saved by build")
+    command.add_argument("knobs", nargs="*", help="name=value")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            surrogate = build(args.simulation, datetime.date.today().year, args.years, args.points, args.runs,
+                              args.seed, args.mortality)
+        except ValueError as e:
+            parser.error(str(e))
+        save(args.save, surrogate)
+        print(f"saved the {surrogate.holdout['best']} model to {args.save}; its knobs:")
+        for knob in surrogate.knobs:
+            low, high = surrogate.low[surrogate.knobs.index(knob)], surrogate.high[surrogate.knobs.index(knob)]
+            print(f"  {knob.name:<16}{low:>6g} to {high:<6g}{knob.description}")
+        return
+
+    surrogate = load(args.surrogate)
+    params = {name: float(value) for name, value in (knob.split("=", 1) for knob in args.knobs)}
+    started = time.perf_counter()
+    success_pct, source = surrogate.predict(**params)
+    seconds = time.perf_counter() - started
+    if source == "surrogate":
+        # time it properly, since one call is too quick to measure
+        started = time.perf_counter()
+        for _ in range(1000):
+            surrogate.predict(**params)
+        seconds = (time.perf_counter() - started) / 1000
+    print(f"{success_pct:.1f}% chance of success, from the {source} in {seconds * 1e6:,.0f} microseconds")
+
+
+if __name__ == "__main__":
+    main()
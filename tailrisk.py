@@ -0,0 +1,261 @@
+# TAIL RISK - THE CHANCE OF RUNNING OUT OF MONEY, WHEN IT IS SMALL (IMPORTANCE SAMPLING)
+#
+# A plan that fails 0.5% of the time only fails in 50 of 10,000 runs, so the failure
+# rate jumps around until there are hundreds of thousands of them.  Instead, the markets
+# are rolled from a worse distribution - each year's returns a little lower or inflation
+# a little higher - so a lot more runs fail, and each run counts for the ratio of how
+# likely its markets are with the real distribution to how likely they are with the
+# worse one:
+#
+#   failure rate = average over runs of (weight * 1 if it ran out, else 0)
+#
+# which comes out the same as plain Monte Carlo on average, with a much smaller error.
+#
+# How much worse each year should be is learned from a few small pilot passes (the
+# cross-entropy method): each pass moves every year's means to where they were in its
+# worst runs, until at least a tenth of the runs fail.  That usually ends up leaning on
+# the first years of retirement, where a bad start does the most damage.
+#
+# The draws that get moved are the ones made with chatgpt.gaussian_guess() (which is what
+# chatgpt.random_inflation() uses) by return_percentage(), asset_return_percentages() and
+# inflation_percentage().  Anything else - historical returns from models.py, say - is
+# rolled as usual and weighs 1, so the answer is still right, it just isn't any sharper.
+
+import contextlib
+import datetime
+import math
+import os
+import random
+
+import numpy as np
+
+import chatgpt
+from montecarlo import BLOCK, make_simulation, pick_engine
+from simulation import run_seed
+from vectorized import CompiledSimulation, run_batched
+
+MARKET_HOOKS = ["return_percentage", "asset_return_percentages", "inflation_percentage"]
+# runs in each pilot pass, the most passes, and the share of the runs that count as the worst
+PILOT_RUNS = 2000
+PILOT_PASSES = 6
+WORST = 0.1
+# no year's mean moves further than this many standard deviations, and each year's shift
+# is averaged with the ones around it (this many years in all), so the pilots' noise
+# doesn't add to the weights' spread
+MAX_SHIFT = 1.5
+SMOOTHING = 5
+# if the runs are worth fewer unweighted ones than this share of them, a handful of runs
+# carry nearly all the weight, and the standard error can't be trusted either
+MIN_ESS = 0.05
+
+
+def normal_cdf(z):
+    return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+
+
+def log_density(value, mean, std_dev, min_value=None, max_value=None):
+    # log of gaussian_guess()'s density at value, leaving out what doesn't depend on the mean
+    inside = 1.0
+    if max_value is not None:
+        inside = normal_cdf((max_value - mean) / std_dev)
+    if min_value is not None:
+        inside -= normal_cdf((min_value - mean) / std_dev)
+    return -0.5 * ((value - mean) / std_dev) ** 2 - math.log(inside)
+
+
+class Tilt:
+    """
+    Stands in for chatgpt.gaussian_guess() while the markets are rolled.  A stream is one
+    gaussian_guess() call in a market hook, like ("asset_return_percentages", 0) for the
+    first asset class; shifts has an array for each stream, with how many standard
+    deviations to move its mean in each year.  For the run being rolled, log_ratio adds up
+    log(real density / tilted density), and rolls has each stream's draws, in standard
+    deviations from the real mean.
+    """
+
+    def __init__(self, num_years, shifts=None):
+        self.num_years = num_years
+        self.shifts = shifts or {}
+        self.hook = None
+        self.calls = 0
+        self.year_idx = None
+        self.log_ratio = 0.0
+        self.rolls = {}
+
+    def start_run(self):
+        self.log_ratio = 0.0
+        self.rolls = {}
+
+    def gaussian_guess(self, mean, std_dev, min_value=None, max_value=None):
+        tilted = mean
+        if self.hook is not None:
+            stream = (self.hook, self.calls)
+            self.calls += 1
+            if stream in self.shifts:
+                tilted = mean + self.shifts[stream][self.year_idx] * std_dev
+        # the same rolls as gaussian_guess(), so untilted draws come out the same
+        while True:
+            value = random.gauss(tilted, std_dev)
+            if min_value is not None and value < min_value:
+                continue
+            if max_value is not None and value > max_value:
+                continue
+            break
+        if self.hook is not None:
+            self.rolls.setdefault(stream, np.zeros(self.num_years))[self.year_idx] = (value - mean) / std_dev
+        if tilted != mean:
+            self.log_ratio += (log_density(value, mean, std_dev, min_value, max_value)
+                               - log_density(value, tilted, std_dev, min_value, max_value))
+        return round(value, 2)
+
+
+def smooth(shifts, width=SMOOTHING):
+    # each year's shift, averaged with the ones up to width // 2 years either side
+    window = np.ones(width)
+    return np.convolve(shifts, window, "same") / np.convolve(np.ones(len(shifts)), window, "same")
+
+
+def tilt_hooks(sim, tilt):
+    # make sim's market hooks tell tilt which of them is drawing, and for which year
+    def tilted(name, hook):
+        def draw(*args, **kwargs):
+            tilt.hook, tilt.calls, tilt.year_idx = name, 0, sim.year - sim.start_year
+            try:
+                return hook(*args, **kwargs)
+            finally:
+                tilt.hook = None
+        return draw
+
+    for name in MARKET_HOOKS:
+        setattr(sim, name, tilted(name, getattr(sim, name)))
+
+
+@contextlib.contextmanager
+def tilted(tilt):
+    original = chatgpt.gaussian_guess
+    chatgpt.gaussian_guess = tilt.gaussian_guess
+    try:
+        yield
+    finally:
+        chatgpt.gaussian_guess = original
+
+
+def tilted_draws(sim, tilt, seed, first_run, num_runs):
+    """
+    market_draws() from sim (with tilt_hooks() on it).  Returns the draws, each run's
+    weight, and {stream: each run's rolls, shaped (runs, years)}.
+    """
+    draws = []
+    weights = np.zeros(num_runs)
+    rolls = {}
+    with tilted(tilt):
+        for row, run_num in enumerate(range(first_run, first_run + num_runs)):
+            tilt.start_run()
+            draws.append(sim.market_draws(seed, run_num, 1)[0])
+            weights[row] = math.exp(tilt.log_ratio)
+            for stream, values in tilt.rolls.items():
+                rolls.setdefault(stream, np.zeros((num_runs, tilt.num_years)))[row] = values
+    return np.array(draws), weights, rolls
+
+
+def simulate(simulation_cls, start_year, years, overrides, sim, compiled, draws, seed, first_run):
+    # the year totals of first_run, ... with draws, on the batched engine if compiled is given
+    if compiled:
+        death_ages = sim.death_ages(seed, first_run, len(draws)) if sim.mortality else None
+        return run_batched(compiled, draws, death_ages=death_ages)
+    totals = []
+    for row, run_num in enumerate(range(first_run, first_run + len(draws))):
+        this_sim = make_simulation(simulation_cls, start_year, years, overrides)
+        this_sim.seed(run_seed(seed, run_num))
+        this_sim.draws = draws[row]
+        totals.append(this_sim.single_simulation())
+    return np.array(totals)
+
+
+def failure_probability(simulation_cls, num_runs, seed=None, years=50, start_year=None, overrides=None,
+                        pilot_runs=PILOT_RUNS, shifts=None):
+    """
+    The chance of running out of money by each year, by importance sampling.  shifts is
+    a Tilt's shifts to use, or None to learn them first with pilot_runs runs a pass.
+    Returns a dict of numpy arrays with one entry per year (like the columns of the
+    totals): failure_pct and its standard error failure_se, tilted_pct, the share of the
+    tilted runs that failed, and plain_runs, how many plain Monte Carlo runs it would
+    take to get the same error.  Also ess, the effective sample size (how many unweighted
+    runs the weights are worth), collapsed, True when ess is under MIN_ESS of the runs
+    (then plain_runs is all NaN, since the error is no good), and the shifts and seed
+    that were used.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    start_year = start_year or datetime.date.today().year
+    sim = make_simulation(simulation_cls, start_year, years, overrides)
+    tilt = Tilt(years, shifts)
+    tilt_hooks(sim, tilt)
+    engine = pick_engine(sim)
+
+    weights = np.zeros(num_runs)
+    failed = np.zeros((num_runs, years + 1), dtype=bool)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        compiled = CompiledSimulation(sim) if engine == "batched" else None
+        if shifts is None:
+            # the pilot runs come after the real ones, so they don't see the same markets
+            for number in range(PILOT_PASSES):
+                first = num_runs + number * pilot_runs
+                draws, pilot_weights, rolls = tilted_draws(sim, tilt, seed, first, pilot_runs)
+                final = simulate(simulation_cls, start_year, years, overrides, sim, compiled, draws, seed, first)[:, -1]
+                threshold = max(0, np.quantile(final, WORST))
+                worst = pilot_weights * (final <= threshold)
+                if not worst.any():
+                    break
+                tilt.shifts = {stream: np.clip(smooth(worst @ values / worst.sum()), -MAX_SHIFT, MAX_SHIFT)
+                               for stream, values in rolls.items()}
+                if threshold == 0:
+                    break
+
+        for first in range(0, num_runs, BLOCK):
+            count = min(BLOCK, num_runs - first)
+            draws, weights[first:first + count], _ = tilted_draws(sim, tilt, seed, first, count)
+            totals = simulate(simulation_cls, start_year, years, overrides, sim, compiled, draws, seed, first)
+            failed[first:first + count] = totals <= 0
+
+    terms = weights[:, None] * failed
+    failure = terms.mean(axis=0)
+    se = terms.std(axis=0, ddof=1) / np.sqrt(num_runs) if num_runs > 1 else np.zeros(years + 1)
+    ess = weights.sum() ** 2 / (weights ** 2).sum() if weights.any() else 0.0
+    collapsed = ess < MIN_ESS * num_runs
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plain_runs = np.where((se > 0) & ~collapsed, failure * (1 - failure) / se ** 2, np.nan)
+    return {
+        "failure_pct": 100.0 * failure,
+        "failure_se": 100.0 * se,
+        "tilted_pct": 100.0 * failed.mean(axis=0),
+        "plain_runs": plain_runs,
+        "ess": ess,
+        "collapsed": collapsed,
+        "shifts": tilt.shifts,
+        "seed": seed,
+    }
+
+
+def print_failure_table(sim, result, num_runs, step=5):
+    # the chance of having run out by every step years, with everyone's ages
+    print(f"{'year (ages)':<24}{'ran out':>9}{'std err':>9}{'tilted runs':>13}{'plain runs for the same error':>31}")
+    for year in range(sim.start_year, sim.start_year + sim.num_years + 1, step):
+        idx = year - sim.start_year
+        ages = ', '.join([str(p.age(year)) for p in sim.everyone()])
+        plain = result["plain_runs"][idx]
+        plain = f"{plain:,.0f}" if np.isfinite(plain) else "-"
+        print(f"{f'{year} (ages {ages})':<24}{result['failure_pct'][idx]:8.3f}%{result['failure_se'][idx]:8.3f}%"
+              f"{result['tilted_pct'][idx]:12.1f}%{plain:>31}")
+    if result["collapsed"]:
+        print(f"WARNING: the {num_runs:,} runs are only worth {result['ess']:,.0f} unweighted ones - a few runs carry")
+        print("nearly all the weight, so the chances and errors above can't be trusted.  Try more --runs,")
+        print("or plain runs if running out isn't that rare")
+        return
+    print(f"('tilted runs' is how many ran out in the worse markets; the {num_runs:,} runs are worth "
+          f"{result['ess']:,.0f} unweighted ones overall)")
+    if result["plain_runs"][-1] > result["ess"]:
+        print(f"(but {result['plain_runs'][-1]:,.0f} plain ones for the chance of running out by the end)")
+    if result["plain_runs"][-1] < num_runs:
+        print("(the worse markets didn't help here - running out must not be that rare, or not up to the markets,"
+              " so plain runs do better)")
@@ -0,0 +1,606 @@
+# BATCHED ENGINE - THE YEARLY STEPS OF SimulationBase.single_simulation(), FOR MANY RUNS AT ONCE
+#
+# The hooks that move money around based on the year alone are called once per year
+# (see SimulationBase.schedule) and the result is replayed for every run.  The steps
+# that depend on balances (distributions, taxes, sweeping, returns) are done here on
+# arrays shaped (runs, accounts), in the same order and with the same arithmetic as the
+# one-run-at-a-time versions, so a run comes out the same either way.
+#
+# Before a simulation is compiled, its schedule is worked out a second time, with money
+# in the accounts and other random numbers; hooks that come out different look at
+# balances or roll dice, so the simulation is left to single_simulation().
+
+import functools
+import itertools
+import random
+
+import numpy as np
+
+import chatgpt
+from common import Account
+from simulation import SimulationBase, INFLATION, RETURNS
+from withdrawals import StrategyRuns
+
+# SimulationBase steps that are re-implemented below.  A simulation that overrides any
+# of these has to be run with single_simulation() instead.
+ENGINE_STEPS = [
+    "required_minimum_distributions",
+    "roth_conversions",
+    "voluntary_distributions",
+    "move_from_retirement_accounts",
+    "calculate_taxes",
+    "sweep_category_accounts_into_savings",
+    "ensure_minimum_savings_balance",
+    "apply_investment_returns_and_inflation",
+]
+
+# shared one-year accounts, in the order they are swept into savings
+SWEPT = [Account.EXPENSES, Account.TAXED_INC, Account.UNTAXED_INC, Account.IRA_WITHDRAWALS, Account.TAX_OWED]
+EXPENSES, TAXED_INC, UNTAXED_INC, IRA_WITHDRAWALS, TAX_OWED = range(len(SWEPT))
+
+
+def check_batchable(sim):
+    for name in ENGINE_STEPS:
+        if name in vars(sim) or getattr(type(sim), name) is not getattr(SimulationBase, name):
+            raise ValueError(f"{type(sim).__name__} overrides {name}(), so it can only run one run at a time")
+    check_schedule(sim)
+
+
+def check_schedule(sim):
+    # The schedule is worked out once and replayed for every run, so the income and expense
+    # hooks can't look at balances or roll their own dice.  Work it out again with money in
+    # the accounts and with other random numbers; if anything changes, they do.
+    state = random.getstate(), np.random.get_state()
+    try:
+        random.seed(1)
+        np.random.seed(1)
+        plain = sim.schedule(by_hook=True)
+        random.seed(2)
+        np.random.seed(2)
+        funded = sim.schedule(by_hook=True, starting=sim.initial_balances())
+    finally:
+        random.setstate(state[0])
+        np.random.set_state(state[1])
+    for year_idx, (hooks, other) in enumerate(zip(plain, funded)):
+        for name, amounts in hooks.items():
+            keys = set(amounts) | set(other[name])
+            # adding to a balance and taking it away again can be off in the last digit
+            if any(not np.isclose(amounts.get(key, 0.0), other[name].get(key, 0.0), rtol=1e-9, atol=1e-6)
+                   for key in keys):
+                raise ValueError(f"{type(sim).__name__}.{name}() does something different in {sim.start_year + year_idx} "
+                                 "depending on the balances or random numbers, so it can only run one run at a time")
+
+
+class CompiledSimulation:
+    """
+    Everything about one simulation that does not depend on the markets, boiled down to
+    arrays and lists: starting balances, the income and expense schedule, and the yearly
+    values of the other hooks.  Build it once, then run it against as many draws as you like.
+
+    With mortality, there is also one for every part of the family that could be left, in
+    self.households, keyed by a bit mask of who is alive (bit i for everyone()[i]).  They
+    all use the same slots, so a run can switch from one to another when someone dies.
+
+    slots, if given, is the list of accounts to use, like another one's self.slots, so two
+    versions of a plan can run side by side (see VariantRuns).
+    """
+
+    def __init__(self, sim, survivors=None, slots=None):
+        if survivors is None:
+            check_batchable(sim)
+        self.mortality = sim.mortality
+        if not sim.mortality:
+            self.compile(sim, slots)
+            self.households = None
+            return
+        # compile the hooks as if only survivors were left
+        everyone = sim.everyone()
+        saved = sim.deceased, vars(sim).get("family")
+        sim.deceased = set(everyone) - set(everyone if survivors is None else survivors)
+        sim.family = sim.living_family
+        try:
+            full_slots = self.compile(sim, slots)
+        finally:
+            sim.deceased = saved[0]
+            if saved[1] is None:
+                del sim.family
+            else:
+                sim.family = saved[1]
+        self.households = None
+        if survivors is None:
+            self.everyone = [person.name for person in everyone]
+            # each person's slot for the spouse who inherits their IRA and Roth, or None
+            self.heirs = [everyone.index(person.spouse) if person.spouse in everyone else None for person in everyone]
+            self.households = {(1 << len(everyone)) - 1: self}
+            for count in range(1, len(everyone)):
+                for group in itertools.combinations(range(len(everyone)), count):
+                    self.households[sum(1 << idx for idx in group)] = CompiledSimulation(
+                        sim, [everyone[idx] for idx in group], full_slots)
+
+    def compile(self, sim, given_slots=None):
+        # Fills in everything but the households; returns self.slots.  given_slots, keyed by
+        # (acct_type, owner name), are used as they are, so every household lines up with the whole family.
+        self.start_year = sim.start_year
+        self.num_years = sim.num_years
+        family = sim.family()
+        self.names = [person.name for person in family]
+        self.married = len(family) > 1
+        schedule = sim.schedule()
+
+        # One slot per persistent account, in the order single_simulation() creates them,
+        # since that is the order their balances get added up in.
+        starting = {}
+        for account in sim.initial_balances():
+            starting[(account.type, account.owner)] = account.balance
+        slots = list(starting.keys())
+        for year in schedule:
+            slots += [key for key in year if is_persistent(key) and key not in slots]
+        engine_keys = [(Account.SAVINGS, None)]
+        engine_keys += [(acct_type, person) for person in family for acct_type in (Account.DEFERRED_IRA, Account.EXEMPT_ROTH)]
+        slots += [key for key in engine_keys if key not in slots]
+        if given_slots is not None:
+            extra = [(acct_type, owner.name if owner else None) for acct_type, owner in slots]
+            extra = [key for key in extra if key not in given_slots]
+            if extra:
+                raise ValueError(f"{type(sim).__name__} uses accounts {extra} that the others don't")
+            people = {person.name: person for person in sim.everyone()}
+            slots = [(acct_type, people[owner] if owner else None) for acct_type, owner in given_slots]
+        slot_index = {key: idx for idx, key in enumerate(slots)}
+
+        self.slots = [(acct_type, owner.name if owner else None) for acct_type, owner in slots]
+        self.initial = np.array([starting.get(key, 0.0) for key in slots], dtype=float)
+        self.deltas = np.zeros((self.num_years, len(slots)))
+        self.flows = np.zeros((self.num_years, len(SWEPT)))
+        for year_idx, year in enumerate(schedule):
+            for (acct_type, owner), amount in year.items():
+                if (acct_type, owner) in slot_index:
+                    self.deltas[year_idx, slot_index[(acct_type, owner)]] = amount
+                elif owner is None and acct_type in SWEPT:
+                    self.flows[year_idx, SWEPT.index(acct_type)] = amount
+
+        years = range(self.start_year, self.start_year + self.num_years)
+        self.distribution_pct = [sim.distribution_percentage(year) for year in years]
+        self.minimum_balance = [sim.minimum_savings_balance(year) for year in years]
+        self.ages = [[person.age(year) for person in family] for year in years]
+        self.steps_per_year = sim.steps_per_year
+        # years a withdrawal strategy is in charge of distributions, and whose age it goes by
+        self.withdrawing = [all(person.retired(year) for person in family) for year in years]
+        self.youngest = [min(ages) for ages in self.ages]
+        self.withdrawal_strategy = sim.withdrawal_strategy
+        # amount to convert to Roth each year, or None for the simple rule
+        self.conversions = None
+        if sim.roth_conversion_schedule is not None:
+            self.conversions = [sim.roth_conversion_schedule.get(year, 0) for year in years]
+
+        # target mix of investments for each (year, slot, asset class), if there is more than one
+        self.asset_classes = list(sim.asset_classes) if sim.asset_classes else None
+        self.targets = None
+        self.rebalance = None
+        if self.asset_classes:
+            accounts = [Account(acct_type, owner, 0) for acct_type, owner in slots]
+            self.targets = np.array([[sim.asset_allocation(year, account) for account in accounts] for year in years],
+                                    dtype=float)
+            self.rebalance = [bool(sim.rebalance(year)) for year in years]
+
+        self.savings = slot_index[(Account.SAVINGS, None)]
+        self.ira = [slot_index[(Account.DEFERRED_IRA, person)] for person in family]
+        self.roth = [slot_index[(Account.EXEMPT_ROTH, person)] for person in family]
+        self.ira_slots = [idx for idx, key in enumerate(slots) if key[0] == Account.DEFERRED_IRA]
+        self.roth_slots = [idx for idx, key in enumerate(slots) if key[0] == Account.EXEMPT_ROTH]
+
+        # what each income and expense hook did, for the journal: [(hook, (acct_type, owner name), amount)]
+        self.hook_amounts = [
+            [(hook, (acct_type, owner.name if owner else None), amount)
+             for hook, amounts in year.items() for (acct_type, owner), amount in amounts.items()]
+            for year in sim.schedule(by_hook=True)
+        ]
+        return self.slots
+
+
+def is_persistent(key):
+    return Account(key[0], key[1], 0).persistent()
+
+
+def sum_slots(balances, slots):
+    # add up left to right, like sum() does over the accounts
+    total = np.zeros(len(balances))
+    for slot in slots:
+        total = total + balances[:, slot]
+    return total
+
+
+def total_value(balances):
+    return np.trunc(sum_slots(balances, range(balances.shape[1]))).astype(np.int64)
+
+
+def move_from_retirement_accounts(compiled, balances, year_idx, person_slots, amount, wanted, target,
+                                  target_key, note=None):
+    # Same as SimulationBase.move_from_retirement_accounts(), for the runs where wanted is True.
+    # note(key, amounts) is called for each leg of each transfer, if given.
+    eligible = [slot for slot, age in zip(person_slots, compiled.ages[year_idx]) if age >= 59.5]
+    all_balances = sum_slots(balances, eligible)
+    go = wanted & (all_balances > 0)
+    all_balances = np.where(go, all_balances, 1.0)
+    for slot in eligible:
+        person_balance = balances[:, slot]
+        person_share = np.where(go, np.minimum(amount * (person_balance / all_balances), person_balance), 0.0)
+        balances[:, slot] -= person_share
+        target += person_share
+        if note:
+            note(compiled.slots[slot], -person_share)
+            note(target_key, person_share)
+
+
+def simulate_year(compiled, year_idx, balances, draws, note=None, weights=None, withdraw=None):
+    """
+    One pass through the yearly steps for every row of balances, changing them in place.
+    draws holds this year's market percentages for each row, shaped (runs, columns), or
+    (runs, steps, columns) for a simulation with more than one step per year.
+    For simulations with asset classes, weights is the mix of investments in each account,
+    shaped (runs, slots, asset classes), and drifts or gets rebalanced in place.
+    withdraw(portfolio) gives the share of each run's IRAs and Roths to take out, and the
+    amount, which is spent instead of budget_expenses(), for years when a withdrawal
+    strategy is in charge.
+    note(phase, (acct_type, owner name), amounts) is called for every move of money, if given.
+    Returns a boolean array of the runs that ran out of money this year.
+    """
+    c = compiled
+    num_runs = balances.shape[0]
+    savings = balances[:, c.savings]
+    savings_key = c.slots[c.savings]
+    swept_keys = [(acct_type, None) for acct_type in SWEPT]
+    if note is None:
+        def note(*args):
+            pass
+
+    # income and expenses come from the schedule
+    balances += c.deltas[year_idx]
+    perennial = np.tile(c.flows[year_idx], (num_runs, 1))
+    for hook, key, amount in c.hook_amounts[year_idx]:
+        note(hook, key, np.full(num_runs, amount))
+
+    # required minimum distributions
+    for person_idx, age in enumerate(c.ages[year_idx]):
+        divisor = chatgpt.UNIFORM_LIFETIME_TABLE.get(age)
+        if age < 73 or divisor is None:
+            continue
+        rmd = balances[:, c.ira[person_idx]] / divisor
+        rmd = np.where(rmd > 0, rmd, 0.0)
+        perennial[:, IRA_WITHDRAWALS] += rmd
+        balances[:, c.ira[person_idx]] -= rmd
+        note("required_minimum_distributions", swept_keys[IRA_WITHDRAWALS], rmd)
+        note("required_minimum_distributions", c.slots[c.ira[person_idx]], -rmd)
+
+    # roth conversions, from the schedule or only in years without other taxable income
+    if c.conversions is None:
+        no_taxed_income = ~(perennial[:, TAXED_INC] > 0)
+    else:
+        amount = c.conversions[year_idx]
+        all_balances = sum_slots(balances, c.ira)
+        go = (amount > 0) & (all_balances > 0)
+        all_balances = np.where(go, all_balances, 1.0)
+    for ira, roth in zip(c.ira, c.roth):
+        if c.conversions is None:
+            conversion = np.minimum(balances[:, ira], 125_000)
+            conversion = np.where(no_taxed_income & (conversion > 0), conversion, 0.0)
+        else:
+            conversion = np.minimum(amount * (balances[:, ira] / all_balances), balances[:, ira])
+            conversion = np.where(go & (conversion > 0), conversion, 0.0)
+        balances[:, ira] -= conversion
+        balances[:, roth] += conversion
+        perennial[:, IRA_WITHDRAWALS] += conversion
+        savings -= conversion
+        for key, moved in [(c.slots[ira], -conversion), (c.slots[roth], conversion),
+                           (swept_keys[IRA_WITHDRAWALS], conversion), (savings_key, -conversion)]:
+            note("roth_conversions", key, moved)
+
+    # voluntary distributions
+    target_pct = c.distribution_pct[year_idx] / 100.0
+    if withdraw is not None and c.withdrawing[year_idx]:
+        target_pct, spending = withdraw(sum_slots(balances, c.ira_slots) + sum_slots(balances, c.roth_slots))
+        perennial[:, EXPENSES] -= spending
+        note("voluntary_distributions", swept_keys[EXPENSES], -spending)
+    remaining = sum_slots(balances, c.ira_slots) * target_pct - perennial[:, IRA_WITHDRAWALS]
+    voluntary = functools.partial(note, "voluntary_distributions")
+    move_from_retirement_accounts(c, balances, year_idx, c.ira, remaining, remaining > 0,
+                                  perennial[:, IRA_WITHDRAWALS], swept_keys[IRA_WITHDRAWALS], voluntary)
+    remaining = sum_slots(balances, c.roth_slots) * target_pct
+    move_from_retirement_accounts(c, balances, year_idx, c.roth, remaining, remaining > 0,
+                                  savings, savings_key, voluntary)
+
+    # taxes
+    taxable_income = perennial[:, TAXED_INC] + perennial[:, IRA_WITHDRAWALS]
+    tax = chatgpt.estimate_income_tax_array(taxable_income, c.married)
+    perennial[:, TAX_OWED] -= tax
+    note("calculate_taxes", swept_keys[TAX_OWED], -tax)
+
+    # The rest happens once per step: this year's one-year accounts are swept into savings in
+    # equal parts, savings gets topped up, and the markets move.  A run that runs out of
+    # money at any step is done, and moves no more money after that.
+    if c.steps_per_year == 1:
+        draws = draws[:, None, :]
+    step_amounts = perennial / c.steps_per_year
+    desired_savings = c.minimum_balance[year_idx]
+    out_of_money = np.zeros(num_runs, dtype=bool)
+    running_note = functools.partial(note_running, note, out_of_money)
+    for step in range(c.steps_per_year):
+        if step:
+            note = running_note
+
+        # sweep the one-year accounts into savings
+        for column in range(len(SWEPT)):
+            move_amt = step_amounts[:, column]
+            move_amt = np.where(np.abs(move_amt) >= 1, move_amt, 0.0)
+            savings += move_amt
+            note("sweep_category_accounts_into_savings", savings_key, move_amt)
+
+        # top up savings from retirement accounts
+        topping_up = functools.partial(note, "ensure_minimum_savings_balance")
+        for person_slots, target, target_key in [(c.ira, perennial[:, IRA_WITHDRAWALS], swept_keys[IRA_WITHDRAWALS]),
+                                                 (c.roth, savings, savings_key)]:
+            savings_balance = savings.copy()
+            move_from_retirement_accounts(c, balances, year_idx, person_slots, desired_savings - savings_balance,
+                                          savings_balance <= desired_savings, target, target_key, topping_up)
+        out_of_money |= savings <= 0
+
+        # capital gains and inflation
+        step_draws = draws[:, step]
+        before = balances.copy()
+        if weights is None:
+            balances *= (1.0 + (step_draws[:, RETURNS] - step_draws[:, INFLATION]) / 100.0)[:, None]
+        else:
+            if step == 0 and c.rebalance[year_idx]:
+                weights[:] = c.targets[year_idx]
+            num_assets = len(c.asset_classes)
+            real_growth = 1.0 + (step_draws[:, RETURNS:RETURNS + num_assets] - step_draws[:, INFLATION, None]) / 100.0
+            growth = weights * real_growth[:, None, :]
+            factor = growth.sum(axis=2)
+            balances *= factor
+            np.divide(growth, factor[:, :, None], out=weights, where=factor[:, :, None] != 0)
+        for slot, key in enumerate(c.slots):
+            note("apply_investment_returns_and_inflation", key, np.where(out_of_money, 0.0, balances[:, slot] - before[:, slot]))
+    return out_of_money
+
+
+def household_deaths(compiled, year_idx, death_ages, balances, note=None):
+    """
+    Same as SimulationBase.household_deaths(), for every row of balances at once, given the
+    age each person dies at on each row, shaped (runs, people).  Returns who is alive this
+    year, shaped the same way.
+    """
+    c = compiled
+    alive = np.array(c.ages[year_idx]) <= death_ages
+    if year_idx == 0:
+        return alive
+    died = (np.array(c.ages[year_idx - 1]) <= death_ages) & ~alive
+    for person_idx, heir_idx in enumerate(c.heirs):
+        if heir_idx is None:
+            continue
+        # a spouse who dies in the same year still inherits, if they come later in the family
+        inheriting = died[:, person_idx] & (alive[:, heir_idx] | (died[:, heir_idx] & (heir_idx > person_idx)))
+        for person_slots in (c.ira, c.roth):
+            amount = np.where(inheriting, balances[:, person_slots[person_idx]], 0.0)
+            balances[:, person_slots[person_idx]] -= amount
+            balances[:, person_slots[heir_idx]] += amount
+            if note:
+                note("household_deaths", c.slots[person_slots[person_idx]], -amount)
+                note("household_deaths", c.slots[person_slots[heir_idx]], amount)
+    return alive
+
+
+def household_groups(compiled, alive):
+    # [(compiled household, rows)] for the rows that have each combination of people left
+    if alive is None:
+        return [(compiled, slice(None))]
+    codes = alive.astype(np.int64) @ (1 << np.arange(alive.shape[1]))
+    present = np.unique(codes)
+    if len(present) == 1:
+        return [(compiled.households[int(present[0])], slice(None))]
+    return [(compiled.households[int(code)], np.flatnonzero(codes == code)) for code in present]
+
+
+def note_running(note, out_of_money, phase, key, amounts):
+    # note() for the later steps of a year, leaving out runs that already ran out of money
+    note(phase, key, np.where(out_of_money, 0.0, amounts))
+
+
+class PathState:
+    """
+    Where a batch of runs stands at the start of a year: the runs that still have money,
+    their balances, and the year totals so far.  The market draws are indexed by run and
+    year, so nothing else is needed to carry on from here.
+    """
+
+    def __init__(self, year_idx, runs, balances, totals, slots, weights=None):
+        self.year_idx = year_idx
+        self.runs = runs
+        self.balances = balances
+        self.totals = totals
+        self.slots = slots
+        self.weights = weights
+
+    def first_runs(self, num_runs):
+        # the same state, for a batch that only has the first num_runs of these runs
+        keep = self.runs < num_runs
+        weights = None if self.weights is None else self.weights[keep]
+        return PathState(self.year_idx, self.runs[keep], self.balances[keep], self.totals[:num_runs], self.slots,
+                         weights)
+
+
+class VariantRuns:
+    """
+    Several versions of one plan side by side in one batch, against the same draws: with
+    draws for N runs, batch run v * N + n is run n with variants[v], a CompiledSimulation
+    with the same slots as the others.  shifts, if given, has a row of percentage points
+    for each variant to add to every step's market draws (one per draw column).
+    """
+
+    def __init__(self, variants, num_draws, shifts=None):
+        if any(variant.slots != variants[0].slots for variant in variants):
+            raise ValueError("variants have to use the same accounts - compile them with the same slots")
+        self.variants = variants
+        self.num_draws = num_draws
+        self.shifts = shifts
+
+    def groups(self, runs):
+        # [(variant, rows of runs, shift or None)] for the variants that still have runs
+        which = runs // self.num_draws
+        groups = []
+        for number in np.unique(which):
+            rows = np.flatnonzero(which == number)
+            shift = None if self.shifts is None or not np.any(self.shifts[number]) else self.shifts[number]
+            groups.append((self.variants[number], rows, shift))
+        return groups
+
+
+def first_difference(compiled, other):
+    """
+    The first year index where two compiled simulations (say, a plan and a what-if) do
+    anything differently, or num_years if they never do.  A run of other can resume from a
+    PathState of compiled saved at or before that year.
+    """
+    if compiled.mortality != other.mortality:
+        return 0
+    if compiled.mortality:
+        # the earliest difference in any household
+        return min(first_household_difference(household, other.households[code])
+                   for code, household in compiled.households.items())
+    return first_household_difference(compiled, other)
+
+
+def first_household_difference(compiled, other):
+    if (compiled.num_years != other.num_years or compiled.slots != other.slots
+            or compiled.steps_per_year != other.steps_per_year
+            or (compiled.conversions is None) != (other.conversions is None)
+            or compiled.married != other.married or not np.array_equal(compiled.initial, other.initial)):
+        return 0
+    for year_idx in range(compiled.num_years):
+        if (not np.array_equal(compiled.deltas[year_idx], other.deltas[year_idx])
+                or not np.array_equal(compiled.flows[year_idx], other.flows[year_idx])
+                or compiled.distribution_pct[year_idx] != other.distribution_pct[year_idx]
+                or compiled.minimum_balance[year_idx] != other.minimum_balance[year_idx]
+                or compiled.ages[year_idx] != other.ages[year_idx]
+                or (compiled.conversions is not None and compiled.conversions[year_idx] != other.conversions[year_idx])):
+            return year_idx
+        if compiled.asset_classes != other.asset_classes:
+            return 0
+        if compiled.asset_classes and (not np.array_equal(compiled.targets[year_idx], other.targets[year_idx])
+                                       or compiled.rebalance[year_idx] != other.rebalance[year_idx]):
+            return year_idx
+    return compiled.num_years
+
+
+def run_batched(compiled, draws, resume_from=None, journal=None, death_ages=None, first_run=0):
+    """
+    Run the compiled simulation once for every row of draws, shaped (runs, years, columns).
+    Returns the year totals, shaped (runs, years + 1) - the same numbers single_simulation()
+    returns for each run.  Runs that run out of money are dropped as they go.
+    Every move of money is recorded in journal, if given, with run numbers counting from
+    first_run (for a block that isn't the first one).
+    A simulation with mortality also needs death_ages, one row per row of draws, from
+    SimulationBase.death_ages().  Runs where everyone has died are dropped too, and their
+    total stays where it was for the rest of the years.
+    """
+    totals, _ = run_with_snapshots(compiled, draws, (), resume_from, journal, death_ages=death_ages,
+                                   first_run=first_run)
+    return totals
+
+
+def run_with_snapshots(compiled, draws, snapshot_years, resume_from=None, journal=None, strategy_runs=None,
+                       death_ages=None, variant_runs=None, first_run=0):
+    """
+    Same as run_batched(), also saving a PathState at the start of each of snapshot_years.
+    Returns (totals, {year: PathState}).  With resume_from, the runs pick up from that
+    state instead of starting over; the draws have to be the same ones it was saved with.
+    With strategy_runs (a withdrawals.StrategyRuns), every row of draws is run once for
+    each of its withdrawal strategies, one block of rows after another.  With variant_runs
+    (a VariantRuns), it is run once for each variant the same way, and compiled only
+    stands for all of them.
+    """
+    if compiled.mortality and death_ages is None:
+        raise ValueError("a simulation with mortality needs death_ages")
+    if variant_runs is not None and (strategy_runs is not None or resume_from is not None or snapshot_years):
+        raise ValueError("variants can't be run with other strategies, or saved or resumed")
+    variants = [compiled] if variant_runs is None else variant_runs.variants
+    if strategy_runs is None and compiled.withdrawal_strategy is not None:
+        strategy_runs = StrategyRuns([variant.withdrawal_strategy for variant in variants], draws.shape[0],
+                                     compiled.num_years)
+    if strategy_runs is not None and (resume_from is not None or snapshot_years):
+        raise ValueError("runs with a withdrawal strategy can't be saved or resumed")
+    num_draws = draws.shape[0]
+    num_runs = num_draws * (len(strategy_runs.strategies) if strategy_runs else len(variants))
+    totals = np.zeros((num_runs, compiled.num_years + 1), dtype=np.int64)
+    if resume_from is None:
+        first_year_idx = 0
+        runs = np.arange(num_runs)
+        balances = np.repeat([variant.initial for variant in variants], num_runs // len(variants), axis=0)
+        weights = None
+        if compiled.asset_classes:
+            weights = np.repeat([variant.targets[0] for variant in variants], num_runs // len(variants), axis=0)
+        totals[:, 0] = total_value(balances)
+    else:
+        if resume_from.slots != compiled.slots or (resume_from.weights is None) != (not compiled.asset_classes):
+            raise ValueError("can't resume a simulation with different accounts")
+        first_year_idx = resume_from.year_idx
+        runs = resume_from.runs.copy()
+        balances = resume_from.balances.copy()
+        weights = None if resume_from.weights is None else resume_from.weights.copy()
+        totals[:, :first_year_idx + 1] = resume_from.totals
+        # runs that were already done keep their last total (zero, unless everyone died first)
+        done = np.ones(num_runs, dtype=bool)
+        done[runs] = False
+        totals[done, first_year_idx + 1:] = totals[done, first_year_idx, None]
+
+    snapshots = {}
+    year = compiled.start_year
+    if journal is not None:
+        journal.runs = max(journal.runs, first_run + num_runs)
+    for year_idx in range(first_year_idx, compiled.num_years):
+        alive = None
+        if compiled.mortality:
+            note = None if journal is None else journal.recorder(first_run + runs, year + year_idx)
+            alive = household_deaths(compiled, year_idx, death_ages[runs % num_draws], balances, note)
+            # nobody is left to run out of money, so these runs are done
+            ended = ~alive.any(axis=1)
+            if ended.any():
+                totals[runs[ended], year_idx + 1:] = totals[runs[ended], year_idx, None]
+                runs, balances, alive = runs[~ended], balances[~ended], alive[~ended]
+                if weights is not None:
+                    weights = weights[~ended]
+        if year + year_idx in snapshot_years:
+            snapshots[year + year_idx] = PathState(
+                year_idx, runs.copy(), balances.copy(), totals[:, :year_idx + 1].copy(), compiled.slots,
+                None if weights is None else weights.copy())
+
+        # each household (everyone, or whoever is left) of each variant takes its own rows through the year
+        out_of_money = np.zeros(len(runs), dtype=bool)
+        groups = [(compiled, slice(None), None)] if variant_runs is None else variant_runs.groups(runs)
+        for variant, variant_rows, shift in groups:
+            for household, rows in household_groups(variant, None if alive is None else alive[variant_rows]):
+                if not isinstance(variant_rows, slice):
+                    rows = variant_rows[rows]
+                note = None
+                if journal is not None:
+                    note = journal.recorder(first_run + runs[rows], year + year_idx)
+                withdraw = None
+                if strategy_runs is not None:
+                    withdraw = functools.partial(strategy_runs.withdraw, runs[rows], year_idx,
+                                                 household.youngest[year_idx])
+                part = balances[rows]
+                part_weights = None if weights is None else weights[rows]
+                year_draws = draws[runs[rows] % num_draws, year_idx]
+                if shift is not None:
+                    year_draws = year_draws + shift
+                out_of_money[rows] = simulate_year(household, year_idx, part, year_draws, note, part_weights, withdraw)
+                if not isinstance(rows, slice):
+                    # the rows were copied out, so copy them back
+                    balances[rows] = part
+                    if weights is not None:
+                        weights[rows] = part_weights
+        if out_of_money.any():
+            runs = runs[~out_of_money]
+            balances = balances[~out_of_money]
+            if weights is not None:
+                weights = weights[~out_of_money]
+        totals[runs, year_idx + 1] = total_value(balances)
+    return totals, snapshots
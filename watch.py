@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# WATCH MODE - RE-RUN A SIMULATION EVERY TIME ITS MODULE IS SAVED
+#
+#   python main.py --simulation=chooseyourname --runs=3000 --watch
+#
+# The process stays up, so the imports, the market draws and the compiled schedule stay
+# warm.  When the module changes, only that module is reloaded; the markets are rolled
+# again only if the market hooks changed, and the schedule is rebuilt only if something
+# else in the module did.  Every pass uses the same seed, so the only thing that moves
+# the numbers is your edit.
+
+import contextlib
+import importlib
+import inspect
+import os
+import random
+import time
+import traceback
+
+import numpy as np
+
+from montecarlo import bank_draws, print_success_table
+from serve import MARKET_HOOKS
+from simulation import run_seed
+from vectorized import CompiledSimulation, run_batched
+
+
+def source(thing):
+    try:
+        return inspect.getsource(thing)
+    except (OSError, TypeError):
+        return repr(thing)
+
+
+def market_fingerprint(sim):
+    # the market hooks and settings, as written - the draws only depend on these
+    return tuple(source(value) if callable(value) else repr(value)
+                 for value in (getattr(sim, name, None) for name in MARKET_HOOKS))
+
+
+def schedule_fingerprint(module, sim):
+    # the whole module, minus the market hooks
+    text = source(module)
+    for name in MARKET_HOOKS:
+        hook = getattr(type(sim), name, None)
+        if callable(hook) and inspect.getmodule(hook) is module:
+            text = text.replace(source(hook), "")
+    return text
+
+
+def family_fingerprint(sim):
+    return tuple((person.name, person.birthday, person.sex) for person in sim.everyone())
+
+
+class Watcher:
+    def __init__(self, name, start_year, num_years, num_runs, seed=None, overrides=None, bank=None):
+        self.name = name
+        self.start_year = start_year
+        self.num_years = num_years
+        self.num_runs = num_runs
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.overrides = overrides or {}
+        self.bank = bank
+        self.module = importlib.import_module(name)
+        self.mtime = os.stat(self.module.__file__).st_mtime
+        # fingerprint -> what was built from it, one of each kept
+        self.draws = (None, None)
+        self.compiled = (None, None)
+        self.death_ages = (None, None)
+
+    def simulation(self):
+        sim = self.module.Simulation(self.start_year, self.num_years)
+        sim.override(self.overrides)
+        return sim
+
+    def market_draws(self, sim):
+        # Reuse the draws if the market hooks look the same and still roll the same first run
+        # (which catches edits to things they use, like a constant at the top of the module).
+        key = market_fingerprint(sim)
+        draws = self.draws[1]
+        if draws is None or self.draws[0] != key or not (self.bank or np.array_equal(
+                sim.market_draws(self.seed, 0, 1), draws[:1])):
+            if self.bank:
+                draws = bank_draws(self.bank, sim, self.seed, 0, self.num_runs)
+            else:
+                draws = sim.market_draws(self.seed, 0, self.num_runs)
+            self.draws = (key, draws)
+            return draws, "rolled again"
+        return draws, "reused"
+
+    def compiled_simulation(self, sim):
+        key = schedule_fingerprint(self.module, sim)
+        if self.compiled[0] != key:
+            try:
+                compiled = CompiledSimulation(sim)
+            except ValueError:
+                # overrides an engine step, so it has to go one run at a time
+                compiled = None
+            self.compiled = (key, compiled)
+            return compiled, "rebuilt"
+        return self.compiled[1], "reused"
+
+    def lifetimes(self, sim):
+        if not sim.mortality:
+            return None
+        key = family_fingerprint(sim)
+        if self.death_ages[0] != key:
+            self.death_ages = (key, sim.death_ages(self.seed, 0, self.num_runs))
+        return self.death_ages[1]
+
+    def run(self):
+        """
+        One pass over every run, from whatever is still warm.
+        Returns (simulation, year totals, what was reused or rebuilt).
+        """
+        sim = self.simulation()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            draws, draws_note = self.market_draws(sim)
+            compiled, schedule_note = self.compiled_simulation(sim)
+            death_ages = self.lifetimes(sim)
+            if compiled is not None:
+                totals = run_batched(compiled, draws, death_ages=death_ages)
+            else:
+                totals = []
+                for row in range(self.num_runs):
+                    this_sim = self.simulation()
+                    this_sim.seed(run_seed(self.seed, row))
+                    this_sim.draws = draws[row]
+                    if death_ages is not None:
+                        this_sim.lifetimes = death_ages[row]
+                    totals.append(this_sim.single_simulation())
+                totals = np.array(totals)
+                schedule_note = "not batchable, ran one at a time"
+        return sim, totals, f"markets {draws_note}, schedule {schedule_note}"
+
+    def changed(self):
+        mtime = os.stat(self.module.__file__).st_mtime
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        return True
+
+    def watch(self, poll=0.5):
+        print(f"watching {self.module.__file__} with seed {self.seed} - save it to re-run, ctrl-c to stop")
+        try:
+            reloaded = True
+            while True:
+                if reloaded:
+                    started = time.time()
+                    try:
+                        sim, totals, notes = self.run()
+                        print_success_table(sim, totals)
+                        print(f"({self.num_runs:,} runs in {time.time() - started:.2f}s: {notes})")
+                    except Exception:
+                        traceback.print_exc()
+                while not self.changed():
+                    time.sleep(poll)
+                print(f"\n{50 * '-'}\n{self.name} changed, reloading")
+                try:
+                    self.module = importlib.reload(self.module)
+                    reloaded = True
+                except Exception:
+                    # a typo - wait for the next save
+                    traceback.print_exc()
+                    reloaded = False
+        except KeyboardInterrupt:
+            pass
+
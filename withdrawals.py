@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# WITHDRAWAL STRATEGIES - HOW MUCH TO TAKE OUT OF THE RETIREMENT ACCOUNTS EACH YEAR
+#
+#   python withdrawals.py --simulation=example --runs=5000
+#   python withdrawals.py --simulation=example --check
+#
+# Once everyone is retired, a strategy decides each year's withdrawal from the IRAs and
+# Roths (instead of distribution_percentage()), the usual distribution step takes it
+# out, and it is what the household spends that year, instead of budget_expenses()
+# (housing and healthcare still come on top).  Everything is in today's dollars, since
+# the simulation takes inflation out of the returns, so "the same withdrawal as last
+# year" already keeps up with inflation.
+#
+# Strategies work on arrays, one entry per run, so one batched pass can run several of
+# them side by side against the same market draws.
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import os
+import warnings
+
+import numpy as np
+
+# years from the first withdrawal that the strategies plan for, in VPW
+PLAN_TO_AGE = 100
+# with --check, how many years later than the first person everyone else retires
+STAGGER = 3
+
+
+class WithdrawalStrategy:
+    """
+    first(portfolio, age) is the first year's withdrawal, and next(portfolio, age, previous,
+    initial) is every year after that.  portfolio is the IRA and Roth balances, age is the
+    youngest person's age, previous is last year's withdrawal and initial the first one -
+    all arrays with one entry per run.
+    """
+    name = "strategy"
+
+    def __str__(self):
+        return self.name
+
+    def first(self, portfolio, age):
+        raise NotImplementedError
+
+    def next(self, portfolio, age, previous, initial):
+        raise NotImplementedError
+
+    def withdraw(self, portfolio, age, previous=None, initial=None):
+        # Returns (share of the portfolio to take out, amount), never more than is there.
+        if previous is None:
+            amount = self.first(portfolio, age)
+        else:
+            amount = self.next(portfolio, age, previous, initial)
+        amount = np.clip(amount, 0.0, np.maximum(portfolio, 0.0))
+        fraction = np.where(portfolio > 0, amount / np.where(portfolio > 0, portfolio, 1.0), 0.0)
+        return fraction, amount
+
+
+class FixedPercent(WithdrawalStrategy):
+    # the same share of whatever is there, every year
+    def __init__(self, pct=4.0):
+        self.pct = pct
+        self.name = f"fixed {pct:g}%"
+
+    def first(self, portfolio, age):
+        return portfolio * self.pct / 100.0
+
+    def next(self, portfolio, age, previous, initial):
+        return portfolio * self.pct / 100.0
+
+
+class FourPercentRule(WithdrawalStrategy):
+    # 4% of the first year's portfolio, then the same amount (after inflation) every year
+    def __init__(self, pct=4.0):
+        self.pct = pct
+        self.name = f"{pct:g}% rule"
+
+    def first(self, portfolio, age):
+        return portfolio * self.pct / 100.0
+
+    def next(self, portfolio, age, previous, initial):
+        return previous
+
+
+class GuytonKlinger(WithdrawalStrategy):
+    # Start at pct, then keep last year's withdrawal unless it has drifted more than
+    # guardrail (20%) away from pct of the portfolio, in which case cut or raise it by adjustment.
+    def __init__(self, pct=5.0, guardrail=0.2, adjustment=0.1):
+        self.pct = pct
+        self.guardrail = guardrail
+        self.adjustment = adjustment
+        self.name = f"guardrails {pct:g}%"
+
+    def first(self, portfolio, age):
+        return portfolio * self.pct / 100.0
+
+    def next(self, portfolio, age, previous, initial):
+        rate = previous / np.where(portfolio > 0, portfolio, np.nan)
+        too_high = ~(rate <= self.pct / 100.0 * (1 + self.guardrail))
+        too_low = rate < self.pct / 100.0 * (1 - self.guardrail)
+        return np.where(too_high, previous * (1 - self.adjustment),
+                        np.where(too_low, previous * (1 + self.adjustment), previous))
+
+
+class VariablePercentage(WithdrawalStrategy):
+    # VPW: the payment that would spend the portfolio down by PLAN_TO_AGE at real_return
+    def __init__(self, real_return=3.0):
+        self.real_return = real_return
+        self.name = "VPW"
+
+    def rate(self, age):
+        years_left = max(1, PLAN_TO_AGE - age + 1)
+        r = self.real_return / 100.0
+        if r == 0:
+            return 1.0 / years_left
+        return r / (1 - (1 + r) ** -years_left)
+
+    def first(self, portfolio, age):
+        return portfolio * self.rate(age)
+
+    def next(self, portfolio, age, previous, initial):
+        return portfolio * self.rate(age)
+
+
+class FloorAndCeiling(WithdrawalStrategy):
+    # pct of the portfolio, but never below floor or above ceiling times the first withdrawal
+    def __init__(self, pct=4.0, floor=0.85, ceiling=1.25):
+        self.pct = pct
+        self.floor = floor
+        self.ceiling = ceiling
+        self.name = f"floor/ceiling {pct:g}%"
+
+    def first(self, portfolio, age):
+        return portfolio * self.pct / 100.0
+
+    def next(self, portfolio, age, previous, initial):
+        return np.clip(portfolio * self.pct / 100.0, initial * self.floor, initial * self.ceiling)
+
+
+STRATEGIES = [FixedPercent(), FourPercentRule(), GuytonKlinger(), VariablePercentage(), FloorAndCeiling()]
+
+
+class StrategyRuns:
+    """
+    Several strategies side by side in one batch: with draws for N runs, batch run
+    s * N + n is run n with strategies[s].  Keeps what every run took out each year, and
+    each run's last and first withdrawal (NaN until it makes one), since the runs don't
+    all start withdrawing in the same year.
+    """
+
+    def __init__(self, strategies, num_draws, num_years):
+        self.strategies = strategies
+        self.num_draws = num_draws
+        self.amounts = np.full((len(strategies) * num_draws, num_years), np.nan)
+        self.previous = np.full(len(strategies) * num_draws, np.nan)
+        self.initial = np.full(len(strategies) * num_draws, np.nan)
+
+    def withdraw(self, runs, year_idx, age, portfolio):
+        # (the share of each run's portfolio to take out this year, amount) - for simulate_year()
+        fraction = np.zeros(len(runs))
+        amount = np.zeros(len(runs))
+        which = runs // self.num_draws
+        starting = np.isnan(self.previous[runs])
+        for number, strategy in enumerate(self.strategies):
+            mine = (which == number) & starting
+            if mine.any():
+                fraction[mine], amount[mine] = strategy.withdraw(portfolio[mine], age)
+            mine = (which == number) & ~starting
+            if mine.any():
+                fraction[mine], amount[mine] = strategy.withdraw(portfolio[mine], age, self.previous[runs[mine]],
+                                                                 self.initial[runs[mine]])
+        self.amounts[runs, year_idx] = amount
+        self.previous[runs] = amount
+        self.initial[runs] = np.where(starting, amount, self.initial[runs])
+        return fraction, amount
+
+
+def spending_volatility(amounts):
+    # for each run, the standard deviation of the year-to-year change in withdrawals, in percent
+    changes = amounts[:, 1:] / np.where(amounts[:, :-1] > 0, amounts[:, :-1], np.nan) - 1.0
+    with warnings.catch_warnings():
+        # runs that never got two withdrawals in a row have no changes
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return 100.0 * np.nanstd(changes, axis=1)
+
+
+def compare(sim, strategies, num_runs, seed=0, draws=None):
+    """
+    Run every strategy against the same draws in one batched pass.  Returns a list of
+    dicts, best first: ranked by success rate, then by steadier spending.
+    """
+    from vectorized import CompiledSimulation, run_with_snapshots
+
+    # any strategy will do here: with one, the schedule leaves out budget_expenses() once
+    # everyone is retired, and strategy_runs decides which one each run uses
+    sim.withdrawal_strategy = strategies[0]
+    compiled = CompiledSimulation(sim)
+    if draws is None:
+        draws = sim.market_draws(seed, 0, num_runs)
+    strategy_runs = StrategyRuns(strategies, len(draws), sim.num_years)
+    totals, _ = run_with_snapshots(compiled, draws, (), strategy_runs=strategy_runs)
+    results = []
+    for number, strategy in enumerate(strategies):
+        rows = slice(number * len(draws), (number + 1) * len(draws))
+        amounts = strategy_runs.amounts[rows]
+        ended = totals[rows, -1]
+        taken = amounts[~np.isnan(amounts)]
+        results.append({
+            "strategy": str(strategy),
+            "success_pct": 100.0 * (ended > 0).mean(),
+            "median_withdrawal": float(np.median(taken)) if len(taken) else 0.0,
+            "p10_withdrawal": float(np.percentile(taken, 10)) if len(taken) else 0.0,
+            "volatility_pct": float(np.nanmedian(spending_volatility(amounts))) if len(taken) else 0.0,
+            "median_end": float(np.median(ended)),
+        })
+    return sorted(results, key=lambda result: (-result["success_pct"], result["volatility_pct"]))
+
+
+def check(simulation_cls, strategies, num_runs, years=50, seed=0):
+    """
+    Run every strategy through both engines, with the plan as it is and with everyone
+    after the first retiring STAGGER years later (so the runs don't all start withdrawing
+    in the same year), with and without mortality.  Returns a list of (what was run,
+    number of runs whose year totals differ between the engines).
+    """
+    from montecarlo import run_block
+
+    def variant(strategy, stagger, mortality):
+        def make(start_year, num_years):
+            sim = simulation_cls(start_year, num_years)
+            sim.withdrawal_strategy = strategy
+            sim.mortality = mortality
+            for person in sim.everyone()[1:]:
+                person.retirement_age += stagger
+            return sim
+        return make
+
+    start_year = datetime.date.today().year
+    mismatches = []
+    for strategy in strategies:
+        for stagger in (0, STAGGER):
+            for mortality in (False, True):
+                make = variant(strategy, stagger, mortality)
+                batched, scalar = [run_block(make, start_year, years, seed, 0, num_runs, engine=engine)
+                                   for engine in ("batched", "scalar")]
+                mismatches.append((f"{strategy}, retiring {stagger} years apart" + (", mortality" if mortality else ""),
+                                   int((batched != scalar).any(axis=1).sum())))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare withdrawal strategies on the same markets")
+    parser.add_argument("--simulation", default="example", help="simulation module, contains a class called Simulation")
+    parser.add_argument("--runs", type=int, default=2000, help="number of simulations per strategy")
+    parser.add_argument("--years", type=int, default=50, help="number of years")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--check", default=False, action="store_true",
+                        help="check that both engines give the same results for every strategy")
+    args = parser.parse_args()
+
+    simulation_cls = importlib.import_module(args.simulation).Simulation
+    if args.check:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            mismatches = check(simulation_cls, STRATEGIES, min(args.runs, 200), args.years, args.seed)
+        for what, differ in mismatches:
+            print(f"{what:<54}{'same' if differ == 0 else f'{differ} runs differ'}")
+        if any(differ for _, differ in mismatches):
+            raise SystemExit("the batched and scalar engines don't agree")
+        return
+
+    sim = simulation_cls(datetime.date.today().year, args.years)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = compare(sim, STRATEGIES, args.runs, args.seed)
+
+    print(f"{'strategy':<22}{'success':>9}{'median':>11}{'p10':>11}{'volatility':>12}{'median end':>13}")
+    for result in results:
+        print(f"{result['strategy']:<22}{result['success_pct']:8.1f}%"
+              f"{int(result['median_withdrawal']) // 1000:>10,}k{int(result['p10_withdrawal']) // 1000:>10,}k"
+              f"{result['volatility_pct']:>11.1f}%{int(result['median_end']) // 1000:>12,}k")
+    print("(withdrawals are yearly, in today's dollars, and spent instead of the budget; "
+          "volatility is the typical year-to-year change)")
+
+
+if __name__ == "__main__":
+    main()